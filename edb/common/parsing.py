@@ -19,6 +19,7 @@
 
 from __future__ import annotations
 
+import array
 import logging
 import os
 import sys
@@ -309,17 +310,108 @@ class Spec(parsing.Spec):
         return ret
 
 
+def _pack_rows(rows, width):
+    """Pack sparse rows into a dense table of ints.
+
+    *rows* is a list of {column: value} dicts with values other than
+    zero.  Return (base, table) arrays, where the value at (row,
+    column) is table[base[row] + column], or zero if there is none.
+    Identical rows share their entries.
+    """
+    base = array.array('i')
+    table = array.array('i')
+    offsets = {}
+
+    for row in rows:
+        key = tuple(sorted(row.items()))
+        offset = offsets.get(key)
+        if offset is None:
+            offset = offsets[key] = len(table)
+            table.frombytes(bytes(width * table.itemsize))
+            for col, val in key:
+                table[offset + col] = val
+        base.append(offset)
+
+    return base, table
+
+
+class LrTables:
+    """Compact LR(1) tables of a parser spec.
+
+    Tokens, nonterminals and productions are numbered, and the action
+    and goto tables are packed into arrays of ints.  An action is the
+    next state plus one for shifts, minus the production number minus
+    one for reductions, and zero for errors.
+    """
+
+    def __init__(self, spec, token_meta):
+        token_specs = {}
+        nonterm_specs = {}
+        productions = {}
+
+        # Tokens that the grammar does not use are numbered too, so
+        # that they are reported as unexpected.
+        for sym_spec in spec._sym2spec.values():
+            if isinstance(sym_spec, parsing.TokenSpec):
+                token_specs.setdefault(sym_spec, len(token_specs))
+        for state_gotos in spec._goto:
+            for nt_spec in state_gotos:
+                nonterm_specs.setdefault(nt_spec, len(nonterm_specs))
+
+        actions = []
+        for state_actions in spec._action:
+            row = {}
+            for tok_spec, (action,) in state_actions.items():
+                if isinstance(action, parsing.ShiftAction):
+                    act = action.nextState + 1
+                else:
+                    prod = action.production
+                    prod_idx = productions.setdefault(prod, len(productions))
+                    nonterm_specs.setdefault(prod.lhs, len(nonterm_specs))
+                    act = -prod_idx - 1
+                row[token_specs[tok_spec]] = act
+            actions.append(row)
+
+        gotos = []
+        for state_gotos in spec._goto:
+            gotos.append({nonterm_specs[nt_spec]: next_state
+                          for nt_spec, next_state in state_gotos.items()})
+
+        self.ntokens = len(token_specs)
+        self.nnonterms = len(nonterm_specs)
+        self.action_base, self.action = _pack_rows(actions, self.ntokens)
+        self.goto_base, self.goto = _pack_rows(gotos, self.nnonterms)
+
+        # Production number -> (number of symbols on the right-hand
+        # side, nonterminal number, nonterminal class, method).
+        self.productions = [None] * len(productions)
+        for prod, prod_idx in productions.items():
+            lhs = prod.lhs
+            self.productions[prod_idx] = (
+                len(prod.rhs), nonterm_specs[lhs], lhs.nontermType,
+                prod.method)
+
+        # Lexer token type -> (token number, token class).
+        self.tokens = {}
+        for (meta, lextoken), tok_cls in TokenMeta.token_map.items():
+            if meta is token_meta:
+                tok_spec = spec._sym2spec.get(tok_cls)
+                if tok_spec is not None:
+                    self.tokens[lextoken] = (token_specs[tok_spec], tok_cls)
+
+        self.eoi = token_specs[spec._sym2spec[parsing.EndOfInput]]
+
+
 class Parser:
     def __init__(self, **parser_data):
         self.lexer = None
-        self.parser = None
         self.parser_data = parser_data
 
     def cleanup(self):
         self.__class__.parser_spec = None
+        self.__class__.parser_tables = None
         self.__class__.lexer_spec = None
         self.lexer = None
-        self.parser = None
 
     def get_debug(self):
         return False
@@ -365,36 +457,96 @@ class Parser:
         """
         raise NotImplementedError
 
+    def get_parser_tables(self):
+        cls = self.__class__
+
+        try:
+            tables = cls.__dict__['parser_tables']
+        except KeyError:
+            pass
+        else:
+            if tables is not None:
+                return tables
+
+        mod = self.get_parser_spec_module()
+        tables = LrTables(self.get_parser_spec(), mod.TokenMeta)
+
+        self.__class__.parser_tables = tables
+        return tables
+
     def reset_parser(self, input):
-        if not self.parser:
+        if not self.lexer:
             self.lexer = self.get_lexer()
-            self.parser = parsing.Lr(self.get_parser_spec())
-            self.parser.parser_data = self.parser_data
-            self.parser.verbose = self.get_debug()
 
-        self.parser.reset()
         self.lexer.setinputstr(input)
 
-    def process_lex_token(self, mod, tok):
-        return mod.TokenMeta.for_lex_token(tok.type)(
-            self.parser, tok.value, self.context(tok))
-
     def parse(self, input):
         self.reset_parser(input)
-        mod = self.get_parser_spec_module()
+        tables = self.get_parser_tables()
+
+        action_base = tables.action_base
+        action = tables.action
+        goto_base = tables.goto_base
+        goto = tables.goto
+        productions = tables.productions
+        lex_tokens = tables.tokens
+        context = self.context
+
+        # Symbols and states of the parser stack; the bottom of the
+        # stack is the start state.
+        symbols = [None]
+        states = [0]
 
         try:
             tok = self.lexer.token()
 
-            while tok:
-                token = self.process_lex_token(mod, tok)
-                if token is not None:
-                    self.parser.token(token)
+            while True:
+                if tok:
+                    tok_idx, tok_cls = lex_tokens[tok.type]
+                    # Tokens and nonterminals are plain carriers of val
+                    # and context; their parsing.Symbol state is unused.
+                    sym = tok_cls.__new__(tok_cls)
+                    sym.val = tok.value
+                    sym.context = context(tok)
+                else:
+                    tok_idx = tables.eoi
+                    sym = None
+
+                while True:
+                    act = action[action_base[states[-1]] + tok_idx]
+                    if act > 0:
+                        symbols.append(sym)
+                        states.append(act - 1)
+                        break
+                    elif act < 0:
+                        nrhs, lhs, nonterm_cls, method = productions[-act - 1]
+                        if nrhs:
+                            args = symbols[-nrhs:]
+                            del symbols[-nrhs:]
+                            del states[-nrhs:]
+                        else:
+                            args = ()
+
+                        nonterm = nonterm_cls.__new__(nonterm_cls)
+                        result = method(nonterm, *args)
+                        if result is None:
+                            result = nonterm
+
+                        symbols.append(result)
+                        states.append(goto[goto_base[states[-1]] + lhs])
+                    elif tok:
+                        raise parsing.SyntaxError(
+                            'Unexpected token: %r' % sym)
+                    else:
+                        raise parsing.SyntaxError(
+                            'Unexpected token: <$>')
+
+                if not tok:
+                    # End of input has been shifted.
+                    break
 
                 tok = self.lexer.token()
 
-            self.parser.eoi()
-
         except parsing.SyntaxError as e:
             raise self.get_exception(
                 e, context=self.context(tok), token=tok) from e
@@ -409,7 +561,7 @@ class Parser:
             raise self.get_exception(
                 e, context=self.context(tok), token=tok) from e
 
-        return self.parser.start[0].val
+        return symbols[1].val
 
     def context(self, tok=None):
         lex = self.lexer
@@ -22,13 +22,24 @@
 
 from __future__ import annotations
 
+import pickle
+
+from edb.common import lru
+
 from edb.edgeql import ast as qlast
+from edb.edgeql import parser as qlparser
 
 from edb.schema import schema as s_schema
 from edb.schema import types as s_types
 from edb.schema import utils as s_utils
 
 
+# Maximum number of parsed schema expressions kept.
+MAX_SCHEMA_EXPR_CACHE = 1000
+
+_schema_expr_cache = lru.LRUMapping(maxsize=MAX_SCHEMA_EXPR_CACHE)
+
+
 def extend_qlbinop(binop, *exprs, op='AND'):
     exprs = list(exprs)
     binop = binop or exprs.pop(0)
@@ -53,6 +64,23 @@ def ensure_qlstmt(expr):
     return expr
 
 
+def parse_schema_expr(text: str) -> qlast.Base:
+    """Parse the text of a computable, a default or a view definition.
+
+    These are compiled again by every query that refers to them.  The
+    parse does not depend on the schema, so the trees are cached by
+    text.  The compiler may modify the trees it compiles, so the cache
+    holds pickled trees and every call gets a fresh copy.
+    """
+    pickled = _schema_expr_cache.get(text)
+    if pickled is None:
+        tree = qlparser.parse(text)
+        _schema_expr_cache[text] = pickle.dumps(
+            tree, protocol=pickle.HIGHEST_PROTOCOL)
+        return tree
+    return pickle.loads(pickled)
+
+
 def is_ql_empty_set(expr):
     return isinstance(expr, qlast.Set) and len(expr.elements) == 0
 
@@ -43,7 +43,6 @@ from edb.schema import utils as s_utils
 
 from edb.edgeql import ast as qlast
 from edb.edgeql import qltypes
-from edb.edgeql import parser as qlparser
 
 from . import astutils
 from . import context
@@ -844,7 +843,7 @@ def computable_ptr_set(
             raise ValueError(
                 f'{ptrcls_sn!r} is not a computable pointer')
 
-        qlexpr = qlparser.parse(comp_expr.text)
+        qlexpr = astutils.parse_schema_expr(comp_expr.text)
         # NOTE: Validation of the expression type is not the concern
         # of this function. For any non-object pointer target type,
         # the default expression must be assignment-cast into that
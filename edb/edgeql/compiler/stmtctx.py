@@ -44,7 +44,6 @@ from edb.schema import types as s_types
 
 from edb.edgeql import ast as qlast
 from edb.edgeql import qltypes
-from edb.edgeql import parser as qlparser
 
 from . import astutils
 from . import context
@@ -417,7 +416,7 @@ def declare_view_from_schema(
         subctx.expr_exposed = False
         view_expr = viewcls.get_expr(ctx.env.schema)
         assert view_expr is not None
-        view_ql = qlparser.parse(view_expr.text)
+        view_ql = astutils.parse_schema_expr(view_expr.text)
         viewcls_name = viewcls.get_name(ctx.env.schema)
         view_set = declare_view(view_ql, alias=viewcls_name,
                                 fully_detached=True, ctx=subctx)
@@ -116,7 +116,7 @@ def compile_ir_to_sql(
     if timer is None:
         codegen = _run_codegen(qtree, pretty=pretty)
     else:
-        with timer.timeit('compile_ir_to_sql'):
+        with timer.timeit('codegen'):
             codegen = _run_codegen(qtree, pretty=pretty)
 
     sql_text = ''.join(codegen.result)
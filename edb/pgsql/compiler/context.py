@@ -48,6 +48,9 @@ class OutputFormat(enum.Enum):
     NATIVE = enum.auto()
     JSON = enum.auto()
     JSONB = enum.auto()
+    # Like JSON, but every element of the result set is returned
+    # as a separate row instead of being aggregated into an array.
+    JSON_ELEMENTS = enum.auto()
 
 
 NO_VOLATILITY = object()
@@ -57,6 +57,7 @@ qt = common.quote_type
 
 DATABASE_ID_NAMESPACE = uuid.UUID('0e6fed66-204b-11e9-8666-cffd58a5240b')
 CONFIG_ID_NAMESPACE = uuid.UUID('a48b38fa-349b-11e9-a6be-4f337f82f5ad')
+QUERY_STATS_ID_NAMESPACE = uuid.UUID('e2d5a5fa-c9a3-11f1-940a-02fc00000001')
 CONFIG_ID = uuid.UUID('172097a4-39f4-11e9-b189-9321eb2f4b97')
 
 
@@ -1417,7 +1418,8 @@ class SysConfigFunction(dbops.Function):
                          'work_mem',
                          'effective_cache_size',
                          'effective_io_concurrency',
-                         'default_statistics_target'
+                         'default_statistics_target',
+                         'statement_timeout'
                      ])
                     )
 
@@ -1906,6 +1908,76 @@ def _generate_database_view(schema):
     return dbops.View(name=tabname(schema, Database), query=view_query)
 
 
+def _generate_query_stats_view(schema):
+    QueryStats = schema.get('sys::QueryStats')
+
+    # The statistics are saved to the data directory by the server.
+    view_query = f'''
+        SELECT
+            edgedb.uuid_generate_v5(
+                '{QUERY_STATS_ID_NAMESPACE}'::uuid,
+                s.database || ':' || s.query_hash)
+                                                AS id,
+            (SELECT id FROM edgedb.Object
+                 WHERE name = 'sys::QueryStats') AS __type__,
+            s.database                          AS database,
+            s.query_hash                        AS query_hash,
+            s.query                             AS query,
+            s.compile_count                     AS compile_count,
+            make_interval(secs => s.compile_time_total)
+                                                AS compile_time,
+            make_interval(secs => s.compile_time_max)
+                                                AS max_compile_time,
+            make_interval(secs => s.parse_time) AS parse_time,
+            make_interval(secs => s.compile_ast_to_ir_time)
+                                                AS ir_compile_time,
+            make_interval(secs => s.compile_ir_to_sql_time)
+                                                AS sql_compile_time,
+            make_interval(secs => s.codegen_time)
+                                                AS codegen_time,
+            make_interval(secs => s.describe_time)
+                                                AS describe_time,
+            s.cache_hits                        AS cache_hits,
+            s.calls                             AS calls,
+            make_interval(secs => s.exec_time_total)
+                                                AS exec_time,
+            make_interval(secs => CASE WHEN s.calls > 0
+                THEN s.exec_time_total / s.calls ELSE 0 END)
+                                                AS mean_exec_time,
+            make_interval(secs => s.exec_time_max)
+                                                AS max_exec_time,
+            s.rows                              AS rows,
+            s.bytes_sent                        AS bytes_sent
+        FROM
+            jsonb_to_recordset(
+                (SELECT pg_read_file(
+                    (SELECT setting || '/query_stats.json'
+                     FROM pg_settings WHERE name = 'data_directory')
+                )::jsonb)
+            ) AS s(
+                database text,
+                query_hash text,
+                query text,
+                compile_count bigint,
+                compile_time_total float8,
+                compile_time_max float8,
+                parse_time float8,
+                compile_ast_to_ir_time float8,
+                compile_ir_to_sql_time float8,
+                codegen_time float8,
+                describe_time float8,
+                cache_hits bigint,
+                calls bigint,
+                exec_time_total float8,
+                exec_time_max float8,
+                rows bigint,
+                bytes_sent bigint
+            )
+    '''
+
+    return dbops.View(name=tabname(schema, QueryStats), query=view_query)
+
+
 def _generate_role_views(schema):
     Role = schema.get('sys::Role')
 
@@ -2712,6 +2784,9 @@ async def generate_views(conn, schema):
     for role_view in role_views:
         views[role_view.name] = role_view
 
+    query_stats_view = _generate_query_stats_view(schema)
+    views[query_stats_view.name] = query_stats_view
+
     types_view = views[tabname(schema, schema.get('schema::Type'))]
     types_view.query += '\nUNION ALL\n' + '\nUNION ALL\n'.join(f'''
         (
@@ -44,6 +44,7 @@ class Port:
         self._devmode = devmode.is_in_dev_mode()
 
         self._compiler_manager = None
+        self._compiler_pool = None
         self._serving = False
 
     def in_dev_mode(self):
@@ -61,33 +62,54 @@ class Port:
     def get_compiler_worker_name(self):
         raise NotImplementedError
 
-    async def new_compiler(self, dbname, dbver):
-        compiler_worker = await self._compiler_manager.spawn_worker()
-        try:
-            await compiler_worker.call('connect', dbname, dbver)
-        except Exception:
-            await compiler_worker.close()
-            raise
-        return compiler_worker
+    def get_compiler_pool_size(self):
+        raise NotImplementedError
+
+    def get_compiler_pool(self):
+        return self._compiler_pool
+
+    def get_compiler_stats(self):
+        """Return the stats of the compiler workers of this port."""
+        if self._compiler_manager is None:
+            return None
+        stats = self._compiler_manager.get_stats()
+        if self._compiler_pool is not None:
+            stats.update(self._compiler_pool.get_stats())
+        return stats
+
+    async def update_database_schema(self, dbname, dbver, schema):
+        """Send the new schema of a database to all compiler workers."""
+        if self._compiler_pool is not None:
+            await self._compiler_pool.call_all(
+                'update_database_schema', dbname, dbver, schema)
 
     async def start(self):
         if self._serving:
             raise RuntimeError('already serving')
         self._serving = True
 
+        min_pool_size, max_pool_size = self._server.get_compiler_buffer_size()
         self._compiler_manager = await procpool.create_manager(
             runstate_dir=self._internal_runstate_dir,
             worker_args=(dict(host=self._pg_addr),
-                         self._pg_data_dir),
+                         self._pg_data_dir,
+                         self._internal_runstate_dir),
             worker_cls=self.get_compiler_worker_cls(),
             name=self.get_compiler_worker_name(),
+            min_pool_size=min_pool_size,
+            max_pool_size=max_pool_size,
+        )
+
+        self._compiler_pool = await procpool.create_pool(
+            self._compiler_manager,
+            size=self.get_compiler_pool_size(),
         )
 
     async def stop(self):
         if self._compiler_manager is not None:
             await self._compiler_manager.stop()
-            self._compiler_manager = None
         self._compiler_manager = None
+        self._compiler_pool = None
         self._serving = False
 
     async def _fix_localhost(self, host, port):
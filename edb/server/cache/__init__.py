@@ -19,7 +19,8 @@
 
 from __future__ import annotations
 
+from .persistent import PersistentQueryCache, get_build_key
 from .stmt_cache import StatementsCache
 
 
-__all__ = ('StatementsCache',)
+__all__ = ('PersistentQueryCache', 'StatementsCache', 'get_build_key')
@@ -0,0 +1,325 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import pathlib
+import pickle
+import sqlite3
+import time
+import typing
+
+import immutables
+
+from edb.common import devmode
+
+
+logger = logging.getLogger('edb.server')
+
+
+FLUSH_DELAY = 1.0
+
+# Bumped whenever the layout of the store changes.
+STORE_FORMAT = 2
+
+EDB_ROOT = pathlib.Path(__file__).parent.parent.parent
+
+# Sources that determine how queries are compiled.
+CACHE_SRC_DIRS = (
+    (EDB_ROOT / 'edgeql', '.py'),
+    (EDB_ROOT / 'ir', '.py'),
+    (EDB_ROOT / 'lib', '.edgeql'),
+    (EDB_ROOT / 'pgsql', '.py'),
+    (EDB_ROOT / 'schema', '.py'),
+    (EDB_ROOT / 'server' / 'compiler', '.py'),
+)
+
+
+def get_build_key(version: str) -> str:
+    """Return the build key of the queries stored by this server.
+
+    In dev mode the compiler changes without a change of the version,
+    so the key also includes a hash of its sources.
+    """
+    if not devmode.is_in_dev_mode():
+        return version
+    src_hash = devmode.hash_dirs(CACHE_SRC_DIRS)
+    return f'{version}-{src_hash.hex()}'
+
+
+class PersistentQueryCache:
+    """An on-disk store of compiled queries.
+
+    Entries are grouped by database and are keyed by the build of the
+    server and by the schema version they were compiled for.  A schema
+    version is a fingerprint of the schema read from the backend, so
+    entries compiled by another build of the server or for a schema
+    that has changed since, even while the server was down, are never
+    loaded.  The number of stored entries is bounded; the least
+    recently used entries are evicted first.
+
+    All disk I/O happens in a dedicated thread, in the order in which
+    it was requested.  Writes are batched and flushed in the background.
+    """
+
+    def __init__(self, path: str, *, build: str, maxsize: int):
+        if maxsize <= 0:
+            raise ValueError(
+                f'maxsize is expected to be greater than 0, got {maxsize}')
+
+        self._path = path
+        self._build = build
+        self._maxsize = maxsize
+
+        self._executor = None
+        self._db = None
+        self._loop = None
+
+        # dbname -> schema version of the entries being stored
+        self._versions = {}
+        # Databases that have stored entries.
+        self._databases = []
+
+        self._pending_puts = []
+        self._pending_touches = {}
+        self._flush_handle = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='edgedb-query-cache')
+        self._databases = await self._run(self._open)
+
+    def close(self):
+        if self._executor is None:
+            return
+
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._flush()
+
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def get_databases(self) -> typing.List[str]:
+        return list(self._databases)
+
+    def get_schema_version(self, dbname: str) -> typing.Optional[str]:
+        """Return the schema version of the entries stored for *dbname*.
+
+        Returns None if storing entries for *dbname* is suspended.
+        """
+        return self._versions.get(dbname)
+
+    def set_schema_version(self, dbname: str, version: str):
+        """Start storing entries for *dbname* under *version*.
+
+        Entries stored for other schema versions of *dbname* are dropped.
+        """
+        if self._executor is None:
+            return
+
+        self._versions[dbname] = version
+        self._submit(self._invalidate, dbname, version)
+
+    def suspend(self, dbname: str):
+        """Stop storing entries for *dbname* until set_schema_version().
+
+        Stored entries are kept: if the schema has not changed in the
+        meantime, they are still valid.
+        """
+        self._versions.pop(dbname, None)
+        self._pending_puts = [
+            put for put in self._pending_puts if put[0] != dbname]
+
+    def drop_database(self, dbname: str):
+        if self._executor is None:
+            return
+
+        self.suspend(dbname)
+        self._submit(self._invalidate, dbname, None)
+
+    async def load(self, dbname: str, version: str):
+        if self._executor is None:
+            return []
+
+        try:
+            return await self._run(self._load, dbname, version)
+        except Exception:
+            logger.exception(
+                'could not load the persistent query cache')
+            return []
+
+    def put(self, dbname: str, version: str, key, compiled):
+        if (self._executor is None or version is None or
+                self._versions.get(dbname) != version):
+            return
+        self._pending_puts.append((dbname, version, key, compiled))
+        self._schedule_flush()
+
+    def touch(self, dbname: str, key):
+        if self._executor is None:
+            return
+        self._pending_touches[(dbname, key)] = time.time()
+        self._schedule_flush()
+
+    async def _run(self, func, *args):
+        return await self._loop.run_in_executor(self._executor, func, *args)
+
+    def _submit(self, func, *args):
+        # The executor has a single thread, so the submitted calls run
+        # in order and after all previously submitted writes.
+        self._executor.submit(func, *args).add_done_callback(_log_errors)
+
+    def _schedule_flush(self):
+        if self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(
+                FLUSH_DELAY, self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+
+        puts = self._pending_puts
+        touches = self._pending_touches
+        self._pending_puts = []
+        self._pending_touches = {}
+
+        if puts or touches:
+            self._submit(self._write, puts, touches)
+
+    # The methods below run in the I/O thread.
+
+    def _open(self):
+        self._db = sqlite3.connect(self._path, check_same_thread=False)
+        with self._db:
+            self._db.execute('PRAGMA journal_mode = WAL')
+            (fmt,) = self._db.execute('PRAGMA user_version').fetchone()
+            if fmt != STORE_FORMAT:
+                self._db.execute('DROP TABLE IF EXISTS schema_versions')
+                self._db.execute('DROP TABLE IF EXISTS queries')
+                self._db.execute(f'PRAGMA user_version = {STORE_FORMAT}')
+
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS queries (
+                    dbname text NOT NULL,
+                    key_id blob NOT NULL,
+                    build text NOT NULL,
+                    version text NOT NULL,
+                    key blob NOT NULL,
+                    compiled blob NOT NULL,
+                    last_used real NOT NULL,
+                    PRIMARY KEY (dbname, key_id)
+                )
+            ''')
+            self._db.execute('''
+                CREATE INDEX IF NOT EXISTS queries_last_used
+                    ON queries (last_used)
+            ''')
+
+            # Entries compiled by another build of the server.
+            self._db.execute(
+                'DELETE FROM queries WHERE build != ?', (self._build,))
+
+        return [dbname for dbname, in self._db.execute(
+            'SELECT DISTINCT dbname FROM queries')]
+
+    def _close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _invalidate(self, dbname, version):
+        with self._db:
+            if version is None:
+                self._db.execute(
+                    'DELETE FROM queries WHERE dbname = ?', (dbname,))
+            else:
+                self._db.execute(
+                    'DELETE FROM queries WHERE dbname = ? AND version != ?',
+                    (dbname, version))
+
+    def _load(self, dbname, version):
+        rows = self._db.execute(
+            'SELECT key, compiled FROM queries '
+            'WHERE dbname = ? AND build = ? AND version = ? '
+            'ORDER BY last_used',
+            (dbname, self._build, version))
+
+        entries = []
+        for key, compiled in rows:
+            try:
+                entries.append((pickle.loads(key), pickle.loads(compiled)))
+            except Exception:
+                # The entry cannot be unpickled, e.g. because one of
+                # the modules it refers to has been changed.
+                continue
+        return entries
+
+    def _write(self, puts, touches):
+        now = time.time()
+        with self._db:
+            for dbname, version, key, compiled in puts:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO queries'
+                    '(dbname, key_id, build, version, key, compiled, '
+                    ' last_used) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (dbname, _key_id(key), self._build, version,
+                     pickle.dumps(key), pickle.dumps(compiled), now))
+
+            for (dbname, key), last_used in touches.items():
+                self._db.execute(
+                    'UPDATE queries SET last_used = ? '
+                    'WHERE dbname = ? AND key_id = ?',
+                    (last_used, dbname, _key_id(key)))
+
+            self._db.execute(
+                'DELETE FROM queries WHERE rowid IN ('
+                '  SELECT rowid FROM queries ORDER BY last_used DESC '
+                '  LIMIT -1 OFFSET ?)',
+                (self._maxsize,))
+
+
+def _log_errors(fut):
+    if not fut.cancelled() and fut.exception() is not None:
+        logger.error(
+            'could not write to the persistent query cache',
+            exc_info=fut.exception())
+
+
+def _canonicalize(obj):
+    if isinstance(obj, tuple):
+        return tuple(_canonicalize(el) for el in obj)
+    elif isinstance(obj, immutables.Map):
+        # Maps do not iterate in a stable order across processes.
+        return tuple(sorted(
+            ((repr(k), _canonicalize(v)) for k, v in obj.items()),
+            key=lambda item: item[0]))
+    else:
+        return obj
+
+
+def _key_id(key) -> bytes:
+    return hashlib.sha1(pickle.dumps(_canonicalize(key))).digest()
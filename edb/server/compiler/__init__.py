@@ -23,6 +23,7 @@ from .compiler import Compiler, BaseCompiler, CompilerDatabaseState
 from .compiler import compile_bootstrap_script
 from .dbstate import QueryUnit
 from .enums import Capability, CompileStatementMode, ResultCardinality
+from .snapshot import remove_schema_snapshot, write_schema_snapshot
 from .stdschema import load_std_schema
 
 
@@ -31,5 +32,5 @@ __all__ = (
     'QueryUnit',
     'Capability', 'CompileStatementMode', 'ResultCardinality',
     'compile_bootstrap_script',
-    'load_std_schema'
+    'load_std_schema', 'remove_schema_snapshot', 'write_schema_snapshot',
 )
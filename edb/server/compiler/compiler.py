@@ -19,10 +19,12 @@
 
 from __future__ import annotations
 
+import asyncio
 import collections
 import dataclasses
 import hashlib
 import pathlib
+import pickle
 import typing
 
 import asyncpg
@@ -36,8 +38,10 @@ from edb.pgsql import intromech
 
 from edb import edgeql
 from edb.common import debug
+from edb.common import lru
 
 from edb.edgeql import ast as qlast
+from edb.edgeql import parser as ql_parser
 from edb.edgeql import compiler as ql_compiler
 from edb.edgeql import quote as ql_quote
 from edb.edgeql import qltypes
@@ -63,7 +67,9 @@ from edb.server import config
 from . import dbstate
 from . import enums
 from . import errormech
+from . import normalization
 from . import sertypes
+from . import snapshot
 from . import status
 from . import stdschema
 
@@ -84,6 +90,8 @@ class CompileContext:
     expected_cardinality_one: bool
     stmt_mode: enums.CompileStatementMode
     json_parameters: bool = False
+    timer: dbstate.CompileTimer = dataclasses.field(
+        default_factory=dbstate.CompileTimer)
 
 
 EMPTY_MAP = immutables.Map()
@@ -91,6 +99,15 @@ DEFAULT_MODULE_ALIASES_MAP = immutables.Map(
     {None: defines.DEFAULT_MODULE_ALIAS})
 
 
+# Statements that are compiled with their literals extracted.
+NORMALIZED_STATEMENTS = (
+    qlast.SelectQuery,
+    qlast.InsertQuery,
+    qlast.UpdateQuery,
+    qlast.DeleteQuery,
+)
+
+
 pg_ql = lambda o: pg_common.quote_literal(str(o))
 
 
@@ -141,19 +158,25 @@ def compile_bootstrap_script(std_schema: s_schema.Schema,
 class BaseCompiler:
 
     _connect_args: dict
-    _dbname: typing.Optional[str]
-    _cached_db: typing.Optional[CompilerDatabaseState]
+    _dbs: typing.Dict[str, CompilerDatabaseState]
+    _dbs_loading: typing.Dict[typing.Tuple[str, int], asyncio.Future]
 
-    def __init__(self, connect_args: dict, data_dir: str):
+    def __init__(self, connect_args: dict, data_dir: str,
+                 runstate_dir: typing.Optional[str] = None):
         self._connect_args = connect_args
-        self._dbname = None
-        self._cached_db = None
+        self._runstate_dir = runstate_dir
+        self._dbs = {}
+        self._dbs_loading = {}
 
         if data_dir is not None:
             self._data_dir = pathlib.Path(data_dir)
             self._std_schema = stdschema.load_std_schema(self._data_dir)
             config_spec = config.load_spec_from_schema(self._std_schema)
             config.set_settings(config_spec)
+
+            # Build the parser tables upfront: with the fork server
+            # this is done once for all workers.
+            ql_parser.preload()
         else:
             self._data_dir = None
             self._std_schema = None
@@ -171,17 +194,39 @@ class BaseCompiler:
             con_args=con_args,
             schema=schema)
 
-    async def _get_database(self, dbver: int) -> CompilerDatabaseState:
-        if self._cached_db is not None and self._cached_db.dbver == dbver:
-            return self._cached_db
+    async def _get_database(self, dbname: str,
+                            dbver: int) -> CompilerDatabaseState:
+        db = self._dbs.get(dbname)
+        if db is not None and db.dbver == dbver:
+            return db
+
+        # Calls are run concurrently: make sure that a schema is
+        # introspected only once.
+        key = (dbname, dbver)
+        loading = self._dbs_loading.get(key)
+        if loading is None:
+            loading = self._dbs_loading[key] = asyncio.ensure_future(
+                self._load_database(dbname, dbver))
+            loading.add_done_callback(
+                lambda _: self._dbs_loading.pop(key, None))
 
-        assert self._std_schema is not None
+        return await asyncio.shield(loading)
 
-        self._cached_db = None
+    async def _load_database(self, dbname: str,
+                             dbver: int) -> CompilerDatabaseState:
+        assert self._std_schema is not None
 
         con_args = self._connect_args.copy()
         con_args['user'] = defines.EDGEDB_SUPERUSER
-        con_args['database'] = self._dbname
+        con_args['database'] = dbname
+
+        if self._runstate_dir is not None:
+            schema = snapshot.load_schema_snapshot(
+                self._runstate_dir, dbname, dbver)
+            if schema is not None:
+                db = self._wrap_schema(dbver, con_args, schema)
+                self._set_database(dbname, db)
+                return db
 
         con = await asyncpg.connect(**con_args)
         try:
@@ -189,35 +234,80 @@ class BaseCompiler:
             schema = await im.readschema(
                 schema=self._std_schema,
                 exclude_modules=s_schema.STD_MODULES)
-
-            db = self._wrap_schema(dbver, con_args, schema)
-            self._cached_db = db
-            return db
         finally:
             await con.close()
 
+        if self._runstate_dir is not None:
+            snapshot_dbver = snapshot.get_snapshot_dbver(
+                self._runstate_dir, dbname)
+        else:
+            snapshot_dbver = dbver
+        if snapshot_dbver is None or snapshot_dbver < dbver:
+            # Let the workers that will need this schema later
+            # load it from the snapshot.
+            snapshot.write_schema_snapshot(
+                self._runstate_dir, dbname, dbver,
+                pickle.dumps(schema, protocol=pickle.HIGHEST_PROTOCOL))
+
+        db = self._wrap_schema(dbver, con_args, schema)
+        self._set_database(dbname, db)
+        return db
+
+    def _set_database(self, dbname: str, db: CompilerDatabaseState):
+        # Versions of a database only grow: a schema loaded or pushed
+        # late must not replace a newer one.
+        cur = self._dbs.get(dbname)
+        if cur is None or cur.dbver < db.dbver:
+            self._dbs[dbname] = db
+
     # API
 
-    async def connect(self, dbname: str, dbver: int) -> CompilerDatabaseState:
-        self._dbname = dbname
-        self._cached_db = None
-        await self._get_database(dbver)
+    async def update_database_schema(self, dbname: str, dbver: int,
+                                     user_schema: bytes):
+        db = self._dbs.get(dbname)
+        if db is not None and db.dbver >= dbver:
+            return
 
+        con_args = self._connect_args.copy()
+        con_args['user'] = defines.EDGEDB_SUPERUSER
+        con_args['database'] = dbname
+
+        schema = pickle.loads(user_schema)
+        self._set_database(
+            dbname, self._wrap_schema(dbver, con_args, schema))
 
-class Compiler(BaseCompiler):
 
-    def __init__(self, connect_args: dict, data_dir: str):
-        super().__init__(connect_args, data_dir)
+class Compiler(BaseCompiler):
 
-        self._current_db_state = None
+    def __init__(self, connect_args: dict, data_dir: str,
+                 runstate_dir: typing.Optional[str] = None):
+        super().__init__(connect_args, data_dir, runstate_dir)
+
+        # States of explicit transactions of client connections,
+        # keyed by connection ID.  Evicting the state of an open
+        # transaction would break it, so states are only dropped
+        # by their connections (see drop_connection_state()).
+        self._con_states = {}
+        # Parsed statements of recently compiled query texts.  The
+        # same text is compiled in different modes, with different
+        # session configs and again after every DDL.
+        self._parse_cache = lru.LRUMapping(
+            maxsize=defines.MAX_COMPILER_PARSE_CACHE)
         self._bootstrap_mode = False
 
-        if data_dir is not None:
-            self._data_dir = pathlib.Path(data_dir)
-            self._std_schema = stdschema.load_std_schema(self._data_dir)
-        else:
-            self._data_dir = None
-            self._std_schema = None
+    def _parse_block(self, eql: str) -> typing.List[qlast.Base]:
+        # The compiler may modify the trees it compiles, so the cache
+        # holds pickled trees and every hit gets a fresh copy.  For
+        # a query with a nested shape, unpickling its tree took
+        # 0.42ms, against 4.5ms for copy.deepcopy() and 10.3ms for
+        # parsing the text again.
+        pickled = self._parse_cache.get(eql)
+        if pickled is None:
+            statements = edgeql.parse_block(eql)
+            self._parse_cache[eql] = pickle.dumps(
+                statements, protocol=pickle.HIGHEST_PROTOCOL)
+            return statements
+        return pickle.loads(pickled)
 
     def _in_testmode(self, ctx: CompileContext):
         current_tx = ctx.state.current_tx()
@@ -280,15 +370,16 @@ class Compiler(BaseCompiler):
         # commands indicates that session mode is available
         session_mode = ctx.state.capability & (enums.Capability.TRANSACTION |
                                                enums.Capability.SESSION)
-        ir = ql_compiler.compile_ast_to_ir(
-            ql,
-            schema=current_tx.get_schema(),
-            modaliases=current_tx.get_modaliases(),
-            implicit_tid_in_shapes=implicit_fields,
-            implicit_id_in_shapes=implicit_fields,
-            disable_constant_folding=disable_constant_folding,
-            json_parameters=ctx.json_parameters,
-            session_mode=session_mode)
+        with ctx.timer.timeit('compile_ast_to_ir'):
+            ir = ql_compiler.compile_ast_to_ir(
+                ql,
+                schema=current_tx.get_schema(),
+                modaliases=current_tx.get_modaliases(),
+                implicit_tid_in_shapes=implicit_fields,
+                implicit_id_in_shapes=implicit_fields,
+                disable_constant_folding=disable_constant_folding,
+                json_parameters=ctx.json_parameters,
+                session_mode=session_mode)
 
         if ir.cardinality is qltypes.Cardinality.ONE:
             result_cardinality = enums.ResultCardinality.ONE
@@ -303,29 +394,52 @@ class Compiler(BaseCompiler):
             ir,
             pretty=debug.flags.edgeql_compile,
             expected_cardinality_one=ctx.expected_cardinality_one,
-            output_format=ctx.output_format)
+            output_format=ctx.output_format,
+            timer=ctx.timer)
 
         sql_bytes = sql_text.encode(defines.EDGEDB_ENCODING)
 
         if single_stmt_mode:
-            if native_out_format:
-                out_type_data, out_type_id = sertypes.TypeSerializer.describe(
-                    ir.schema, ir.stype,
-                    ir.view_shapes, ir.view_shapes_metadata)
-            else:
-                out_type_data, out_type_id = \
-                    sertypes.TypeSerializer.describe_json()
-
-            if ir.params:
-                subtypes = [None] * len(ir.params)
-                first_param_name = next(iter(ir.params))
+            with ctx.timer.timeit('describe'):
+                if native_out_format:
+                    out_type_data, out_type_id = \
+                        sertypes.TypeSerializer.describe(
+                            ir.schema, ir.stype,
+                            ir.view_shapes, ir.view_shapes_metadata)
+                else:
+                    out_type_data, out_type_id = \
+                        sertypes.TypeSerializer.describe_json()
+
+            params = ir.params
+            extracted_args = None
+            if params and not ctx.json_parameters:
+                hidden = [param_name for param_name in params
+                          if normalization.is_extracted_param(param_name)]
+                if hidden:
+                    if len(hidden) != len(params):
+                        raise errors.QueryError(
+                            f'parameter names starting with '
+                            f'{normalization.PARAM_PREFIX!r} are reserved')
+                    # Parameters that replace extracted literals are
+                    # bound by the server and are not a part of the
+                    # input type.
+                    params = {}
+                    prefix_len = len(normalization.PARAM_PREFIX)
+                    extracted_args = tuple(
+                        int(param_name[prefix_len:])
+                        for param_name, _ in sorted(
+                            argmap.items(), key=lambda item: item[1]))
+
+            if params:
+                subtypes = [None] * len(params)
+                first_param_name = next(iter(params))
                 if first_param_name.isdecimal():
                     named = False
-                    for param_name, param_type in ir.params.items():
+                    for param_name, param_type in params.items():
                         subtypes[int(param_name)] = (param_name, param_type)
                 else:
                     named = True
-                    for param_name, param_type in ir.params.items():
+                    for param_name, param_type in params.items():
                         subtypes[argmap[param_name] - 1] = (
                             param_name, param_type
                         )
@@ -337,8 +451,9 @@ class Compiler(BaseCompiler):
                 params_type = s_types.Tuple.create(
                     ir.schema, element_types={}, named=False)
 
-            in_type_data, in_type_id = sertypes.TypeSerializer.describe(
-                ir.schema, params_type, {}, {})
+            with ctx.timer.timeit('describe'):
+                in_type_data, in_type_id = sertypes.TypeSerializer.describe(
+                    ir.schema, params_type, {}, {})
 
             in_type_args = None
             if ctx.json_parameters:
@@ -361,6 +476,7 @@ class Compiler(BaseCompiler):
                 in_type_args=in_type_args,
                 out_type_id=out_type_id.bytes,
                 out_type_data=out_type_data,
+                extracted_args=extracted_args,
             )
 
         else:
@@ -436,10 +552,16 @@ class Compiler(BaseCompiler):
         # will also update the schema.
         schema, plan = self._process_delta(ctx, cmd, schema)
 
+        drop_db = None
+        user_schema = None
         if isinstance(plan, (s_db.CreateDatabase, s_db.DropDatabase)):
             block = pg_dbops.SQLBlock()
+            if isinstance(plan, s_db.DropDatabase):
+                drop_db = str(plan.classname)
         else:
             block = pg_dbops.PLTopBlock()
+            if current_tx.is_implicit():
+                user_schema = schema
 
         plan.generate(block)
         sql = block.to_string().encode('utf-8')
@@ -450,7 +572,8 @@ class Compiler(BaseCompiler):
             debug.header('Delta Script')
             debug.dump_code(sql, lexer='sql')
 
-        return dbstate.DDLQuery(sql=(sql,))
+        return dbstate.DDLQuery(
+            sql=(sql,), drop_db=drop_db, user_schema=user_schema)
 
     def _compile_command(
             self, ctx: CompileContext, cmd) -> dbstate.BaseQuery:
@@ -513,6 +636,7 @@ class Compiler(BaseCompiler):
         single_unit = False
 
         modaliases = None
+        user_schema = None
 
         if isinstance(ql, qlast.StartTransaction):
             ctx.state.start_tx()
@@ -531,8 +655,13 @@ class Compiler(BaseCompiler):
             cacheable = False
 
         elif isinstance(ql, qlast.CommitTransaction):
+            tx = ctx.state.current_tx()
+            schema_changed = tx.get_schema() is not tx.get_initial_schema()
+
             new_state: dbstate.TransactionState = ctx.state.commit_tx()
             modaliases = new_state.modaliases
+            if schema_changed:
+                user_schema = new_state.schema
 
             sql = (b'COMMIT',)
             single_unit = True
@@ -598,7 +727,8 @@ class Compiler(BaseCompiler):
             action=action,
             cacheable=cacheable,
             single_unit=single_unit,
-            modaliases=modaliases)
+            modaliases=modaliases,
+            user_schema=user_schema)
 
     def _compile_ql_sess_state(self, ctx: CompileContext,
                                ql: qlast.BaseSessionCommand):
@@ -797,15 +927,64 @@ class Compiler(BaseCompiler):
                  ctx: CompileContext,
                  eql: bytes) -> typing.List[dbstate.QueryUnit]:
 
+        eql = eql.decode()
+
+        if (ctx.stmt_mode is enums.CompileStatementMode.SINGLE and
+                not ctx.json_parameters):
+            units = self._try_compile_normalized(ctx, eql)
+            if units is not None:
+                return units
+
+        with ctx.timer.timeit('parse'):
+            statements = self._parse_block(eql)
+
+        return self._compile_statements(ctx=ctx, statements=statements)
+
+    def _try_compile_normalized(
+            self, ctx: CompileContext,
+            eql: str) -> typing.Optional[typing.List[dbstate.QueryUnit]]:
+        """Compile a query with its literals extracted into parameters.
+
+        Return None if the query has no literals or cannot be compiled
+        in this form.
+        """
+        source = normalization.normalize(eql)
+        if source is None:
+            return None
+
+        units = None
+        try:
+            with ctx.timer.timeit('parse'):
+                statements = self._parse_block(source.text)
+            if (len(statements) == 1 and
+                    isinstance(statements[0], NORMALIZED_STATEMENTS)):
+                units = self._compile_statements(
+                    ctx=ctx, statements=statements)
+        except errors.QueryError:
+            # Some literals cannot be replaced with parameters, which
+            # surfaces as a syntax or a type error.  The original query
+            # is compiled instead and reports any genuine error with
+            # positions in its own text.
+            pass
+
+        if units is None:
+            # Do not count the abandoned attempt in the timings of
+            # the original query.
+            ctx.timer.pop_timings()
+        return units
+
+    def _compile_statements(
+            self, *,
+            ctx: CompileContext,
+            statements: typing.List[qlast.Base],
+    ) -> typing.List[dbstate.QueryUnit]:
+
         # When True it means that we're compiling for "connection.fetchall()".
         # That means that the returned QueryUnit has to have the in/out codec
         # information, correctly inferred "singleton_result" field etc.
         single_stmt_mode = ctx.stmt_mode is enums.CompileStatementMode.SINGLE
         default_cardinality = enums.ResultCardinality.NOT_APPLICABLE
 
-        eql = eql.decode()
-
-        statements = edgeql.parse_block(eql)
         statements_len = len(statements)
 
         if ctx.stmt_mode is enums.CompileStatementMode.SKIP_FIRST:
@@ -826,8 +1005,15 @@ class Compiler(BaseCompiler):
         units = []
         unit = None
 
+        # The unit that commits schema changes and the new schema.
+        schema_unit = None
+        user_schema = None
+
         for stmt in statements:
             comp: dbstate.BaseQuery = self._compile_dispatch_ql(ctx, stmt)
+            # Includes the time spent parsing the block for the first
+            # statement.
+            timings = ctx.timer.pop_timings()
 
             if unit is not None:
                 if (isinstance(comp, dbstate.TxControlQuery) and
@@ -844,6 +1030,13 @@ class Compiler(BaseCompiler):
             else:
                 unit.status = status.get_status(stmt)
 
+            if unit.compile_timings is None:
+                unit.compile_timings = timings
+            else:
+                for stage, elapsed in timings.items():
+                    unit.compile_timings[stage] = (
+                        unit.compile_timings.get(stage, 0.0) + elapsed)
+
             if isinstance(comp, dbstate.Query):
                 if single_stmt_mode:
                     unit.sql = comp.sql
@@ -854,6 +1047,7 @@ class Compiler(BaseCompiler):
                     unit.in_type_data = comp.in_type_data
                     unit.in_type_args = comp.in_type_args
                     unit.in_type_id = comp.in_type_id
+                    unit.extracted_args = comp.extracted_args
 
                     unit.cacheable = True
 
@@ -868,6 +1062,11 @@ class Compiler(BaseCompiler):
             elif isinstance(comp, dbstate.DDLQuery):
                 unit.sql += comp.sql
                 unit.has_ddl = True
+                if comp.drop_db is not None:
+                    unit.drop_db = comp.drop_db
+                if comp.user_schema is not None:
+                    schema_unit = unit
+                    user_schema = comp.user_schema
 
             elif isinstance(comp, dbstate.TxControlQuery):
                 unit.sql += comp.sql
@@ -883,6 +1082,9 @@ class Compiler(BaseCompiler):
                     unit.tx_id = ctx.state.current_tx().id
                 elif comp.action == dbstate.TxAction.COMMIT:
                     unit.tx_commit = True
+                    if comp.user_schema is not None:
+                        schema_unit = unit
+                        user_schema = comp.user_schema
                 elif comp.action == dbstate.TxAction.ROLLBACK:
                     unit.tx_rollback = True
                 elif comp.action is dbstate.TxAction.ROLLBACK_TO_SAVEPOINT:
@@ -925,6 +1127,10 @@ class Compiler(BaseCompiler):
         if unit is not None:
             units.append(unit)
 
+        if schema_unit is not None and not self._bootstrap_mode:
+            schema_unit.user_schema = pickle.dumps(
+                user_schema, protocol=pickle.HIGHEST_PROTOCOL)
+
         if single_stmt_mode:
             if len(units) != 1:  # pragma: no cover
                 raise errors.InternalServerError(
@@ -959,12 +1165,14 @@ class Compiler(BaseCompiler):
         return units
 
     async def _ctx_new_con_state(
-            self, *, dbver: int, json_mode: bool, expect_one: bool,
+            self, *, dbname: str, dbver: int, json_mode: bool,
+            expect_one: bool,
             modaliases,
             session_config: typing.Optional[immutables.Map],
             stmt_mode: typing.Optional[enums.CompileStatementMode],
             capability: enums.Capability,
-            json_parameters: bool=False):
+            json_parameters: bool=False,
+            json_elements: bool=False):
 
         if session_config is None:
             session_config = EMPTY_MAP
@@ -974,17 +1182,17 @@ class Compiler(BaseCompiler):
         assert isinstance(modaliases, immutables.Map)
         assert isinstance(session_config, immutables.Map)
 
-        db = await self._get_database(dbver)
-        self._current_db_state = dbstate.CompilerConnectionState(
+        db = await self._get_database(dbname, dbver)
+        state = dbstate.CompilerConnectionState(
             dbver,
             db.schema,
             modaliases,
             session_config,
             capability)
 
-        state = self._current_db_state
-
-        if json_mode:
+        if json_mode and json_elements:
+            of = pg_compiler.OutputFormat.JSON_ELEMENTS
+        elif json_mode:
             of = pg_compiler.OutputFormat.JSON
         else:
             of = pg_compiler.OutputFormat.NATIVE
@@ -998,10 +1206,10 @@ class Compiler(BaseCompiler):
 
         return ctx
 
-    async def _ctx_from_con_state(self, *, txid: int, json_mode: bool,
-                                  expect_one: bool,
+    async def _ctx_from_con_state(self, *, con_id: str, txid: int,
+                                  json_mode: bool, expect_one: bool,
                                   stmt_mode: enums.CompileStatementMode):
-        state = self._load_state(txid)
+        state = self._load_state(con_id, txid)
 
         if json_mode:
             of = pg_compiler.OutputFormat.JSON
@@ -1016,26 +1224,39 @@ class Compiler(BaseCompiler):
 
         return ctx
 
-    def _load_state(self, txid: int):
-        if self._current_db_state is None:  # pragma: no cover
+    def _load_state(self, con_id: str, txid: int):
+        state = self._con_states.get(con_id)
+        if state is None:  # pragma: no cover
             raise errors.InternalServerError(
                 f'failed to lookup transaction with id={txid}')
 
-        if self._current_db_state.current_tx().id == txid:
-            return self._current_db_state
+        if state.current_tx().id == txid:
+            return state
 
-        if self._current_db_state.can_rollback_to_savepoint(txid):
-            self._current_db_state.rollback_to_savepoint(txid)
-            return self._current_db_state
+        if state.can_rollback_to_savepoint(txid):
+            state.rollback_to_savepoint(txid)
+            return state
 
         raise errors.InternalServerError(
             f'failed to lookup transaction or savepoint with id={txid}'
         )  # pragma: no cover
 
+    def _save_state(self, con_id: typing.Optional[str],
+                    state: dbstate.CompilerConnectionState):
+        if con_id is None:
+            return
+
+        if state.current_tx().is_implicit():
+            # Nothing to remember: the next request of this
+            # connection will carry its complete session state.
+            self._con_states.pop(con_id, None)
+        else:
+            self._con_states[con_id] = state
+
     # API
 
     async def try_compile_rollback(self, dbver: int, eql: bytes):
-        statements = edgeql.parse_block(eql.decode())
+        statements = self._parse_block(eql.decode())
 
         stmt = statements[0]
         unit = None
@@ -1066,6 +1287,8 @@ class Compiler(BaseCompiler):
 
     async def compile_eql(
             self,
+            con_id: typing.Optional[str],
+            dbname: str,
             dbver: int,
             eql: bytes,
             sess_modaliases: typing.Optional[immutables.Map],
@@ -1074,9 +1297,11 @@ class Compiler(BaseCompiler):
             expect_one: bool,
             stmt_mode: enums.CompileStatementMode,
             capability: enums.Capability,
-            json_parameters: bool=False) -> typing.List[dbstate.QueryUnit]:
+            json_parameters: bool=False,
+            json_elements: bool=False) -> typing.List[dbstate.QueryUnit]:
 
         ctx = await self._ctx_new_con_state(
+            dbname=dbname,
             dbver=dbver,
             json_mode=json_mode,
             expect_one=expect_one,
@@ -1084,12 +1309,16 @@ class Compiler(BaseCompiler):
             session_config=sess_config,
             stmt_mode=enums.CompileStatementMode(stmt_mode),
             capability=capability,
-            json_parameters=json_parameters)
+            json_parameters=json_parameters,
+            json_elements=json_elements)
 
-        return self._compile(ctx=ctx, eql=eql)
+        units = self._compile(ctx=ctx, eql=eql)
+        self._save_state(con_id, ctx.state)
+        return units
 
     async def compile_eql_in_tx(
             self,
+            con_id: str,
             txid: int,
             eql: bytes,
             json_mode: bool,
@@ -1098,18 +1327,24 @@ class Compiler(BaseCompiler):
     ) -> typing.List[dbstate.QueryUnit]:
 
         ctx = await self._ctx_from_con_state(
+            con_id=con_id,
             txid=txid,
             json_mode=json_mode,
             expect_one=expect_one,
             stmt_mode=enums.CompileStatementMode(stmt_mode))
 
-        return self._compile(ctx=ctx, eql=eql)
+        units = self._compile(ctx=ctx, eql=eql)
+        self._save_state(con_id, ctx.state)
+        return units
+
+    async def drop_connection_state(self, con_id: str):
+        self._con_states.pop(con_id, None)
 
-    async def interpret_backend_error(self, dbver, fields):
-        db = await self._get_database(dbver)
+    async def interpret_backend_error(self, dbname, dbver, fields):
+        db = await self._get_database(dbname, dbver)
         return errormech.interpret_backend_error(db.schema, fields)
 
-    async def interpret_backend_error_in_tx(self, txid, fields):
-        state = self._load_state(txid)
+    async def interpret_backend_error_in_tx(self, con_id, txid, fields):
+        state = self._load_state(con_id, txid)
         return errormech.interpret_backend_error(
             state.current_tx().get_schema(), fields)
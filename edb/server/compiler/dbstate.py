@@ -19,6 +19,7 @@
 
 from __future__ import annotations
 
+import contextlib
 import dataclasses
 import enum
 import time
@@ -67,6 +68,10 @@ class Query(BaseQuery):
     # Set only when a query is compiled with "json_parameters=True"
     in_type_args: typing.Optional[typing.Tuple[str, ...]] = None
 
+    # Set only when literals were extracted from the query, see
+    # QueryUnit.extracted_args.
+    extracted_args: typing.Optional[typing.Tuple[int, ...]] = None
+
 
 @dataclasses.dataclass(frozen=True)
 class SimpleQuery(BaseQuery):
@@ -85,7 +90,13 @@ class SessionStateQuery(BaseQuery):
 
 @dataclasses.dataclass(frozen=True)
 class DDLQuery(BaseQuery):
-    pass
+
+    # Set to the name of the database being dropped, if any.
+    drop_db: typing.Optional[str] = None
+
+    # Set if the schema change is committed right away (i.e. the
+    # command is not in a transaction block).
+    user_schema: typing.Optional[s_schema.Schema] = None
 
 
 @dataclasses.dataclass(frozen=True)
@@ -97,6 +108,30 @@ class TxControlQuery(BaseQuery):
 
     modaliases: typing.Optional[immutables.Map]
 
+    # Set for a COMMIT of a transaction that has changed the schema.
+    user_schema: typing.Optional[s_schema.Schema] = None
+
+
+class CompileTimer:
+    """Time spent in each stage of compilation, in seconds."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextlib.contextmanager
+    def timeit(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+
+    def pop_timings(self) -> typing.Dict[str, float]:
+        timings = self.timings
+        self.timings = {}
+        return timings
+
 
 #############################
 
@@ -121,6 +156,16 @@ class QueryUnit:
     # True if this unit contains DDL commands.
     has_ddl: bool = False
 
+    # Set if this unit drops a database; the server has to close
+    # its pooled backend connections to that database first.
+    drop_db: typing.Optional[str] = None
+
+    # Pickled schema of the database after the schema changes made
+    # by this unit are committed.  Set only for units that commit
+    # DDL; the server ships it to compiler workers so that they don't
+    # have to introspect the new schema.
+    user_schema: typing.Optional[bytes] = None
+
     # True if this unit contains SET commands.
     has_set: bool = False
 
@@ -156,6 +201,12 @@ class QueryUnit:
     # Set only when a query is compiled with "json_parameters=True"
     in_type_args: typing.Optional[typing.Tuple[str, ...]] = None
 
+    # Set only when the unit was compiled from a normalized query,
+    # whose literals are passed as hidden parameters after the client
+    # arguments.  Holds the index of the extracted literal for every
+    # hidden parameter, in the order of the parameters.
+    extracted_args: typing.Optional[typing.Tuple[int, ...]] = None
+
     # Set only when this unit contains a CONFIGURE SYSTEM command.
     system_config: bool = False
     config_requires_restart: bool = False
@@ -165,6 +216,11 @@ class QueryUnit:
     config_ops: typing.Optional[typing.List[config.Operation]] = None
     modaliases: typing.Optional[immutables.Map] = None
 
+    # Time spent in each stage of compiling this unit, in seconds
+    # ("parse", "compile_ast_to_ir", "compile_ir_to_sql", "codegen",
+    # "describe").
+    compile_timings: typing.Optional[typing.Dict[str, float]] = None
+
 
 #############################
 
@@ -303,6 +359,9 @@ class Transaction:
     def get_schema(self) -> s_schema.Schema:
         return self._stack[-1].schema
 
+    def get_initial_schema(self) -> s_schema.Schema:
+        return self._stack[0].schema
+
     def get_modaliases(self) -> immutables.Map:
         return self._stack[-1].modaliases
 
@@ -58,6 +58,8 @@ class PGErrorCode(enum.Enum):
     TransactionSerializationFailure = '40001'
     TransactionDeadlockDetected = '40P01'
 
+    QueryCanceledError = '57014'
+
 
 class SchemaRequired:
     '''A sentinel used to signal that a particular error requires a schema.'''
@@ -281,6 +283,11 @@ def static_interpret_backend_error(fields):
     elif err_details.code == PGErrorCode.TransactionDeadlockDetected:
         return errors.TransactionDeadlockError(err_details.message)
 
+    elif err_details.code == PGErrorCode.QueryCanceledError:
+        # Either statement_timeout has expired or the query has been
+        # cancelled by a cancel request.
+        return errors.QueryTimeoutError(err_details.message)
+
     return errors.InternalServerError(err_details.message)
 
 
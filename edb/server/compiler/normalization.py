@@ -0,0 +1,210 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Extraction of literals and token fingerprints of EdgeQL queries.
+
+Queries that differ only in their literals are normalized into the
+same text, in which every literal is replaced with a hidden query
+parameter.  Such queries share a compiled query and a prepared
+statement; the extracted literals are bound at execution time.
+
+Queries that differ only in whitespace or comments have the same
+token fingerprint, which is used as the key
+of the compiled query cache.
+"""
+
+
+from __future__ import annotations
+
+import dataclasses
+import re
+import typing
+
+from edb.common import lexer as common_lexer
+from edb.edgeql.parser.grammar import lexer
+from edb.edgeql.parser.grammar import lexutils
+
+
+# Names of the parameters that replace extracted literals.
+PARAM_PREFIX = '__edb_arg_'
+
+# Types of the extracted literals, by token type.
+LITERAL_TYPES = {
+    'SCONST': 'std::str',
+    'RSCONST': 'std::str',
+    'ICONST': 'std::int64',
+    'FCONST': 'std::float64',
+    'NCONST': 'std::decimal',
+}
+
+# Literals that follow these tokens, possibly wrapped in parentheses,
+# are left in place: tuple element indexes must be constant and
+# a constant LIMIT affects the inferred cardinality of a query.
+KEEP_AFTER = frozenset({'.', 'LIMIT'})
+
+MAX_INT64 = 2 ** 63 - 1
+
+# Tokens merged by the lexer from two keywords, like "SET ANNOTATION".
+MERGED_TYPES = frozenset(
+    first + second for first, second in lexer.EdgeQLLexer.MERGE_TOKENS)
+
+_NUMERIC_ESCAPE_RE = re.compile(r'\\[xuU]')
+
+
+@dataclasses.dataclass(frozen=True)
+class NormalizedSource:
+
+    # The query text with literals replaced by parameters.
+    text: str
+    # Text representations of the extracted literals, in the order
+    # of their appearance in the query.
+    values: typing.Tuple[bytes, ...]
+    # Token fingerprint of the normalized query.
+    key: bytes
+
+
+@dataclasses.dataclass(frozen=True)
+class Source:
+
+    # Token fingerprint of the query: its tokens separated by single
+    # spaces, without whitespace and comments.  The fingerprint is
+    # itself a valid query that lexes into the same tokens.
+    key: bytes
+    # The query with its literals extracted, or None if there are
+    # no literals to extract.
+    normalized: typing.Optional[NormalizedSource]
+
+
+def is_extracted_param(name: str) -> bool:
+    return name.startswith(PARAM_PREFIX)
+
+
+def _get_literal_value(tok) -> typing.Optional[str]:
+    if tok.type == 'SCONST':
+        match = lexutils.VALID_STRING_RE.match(tok.text)
+        if match is None or match.group('err_esc'):
+            return None
+        body = re.sub(r'\\\n', '', match.group('body'))
+        if _NUMERIC_ESCAPE_RE.search(body):
+            # Left to the compiler, which validates the code points.
+            return None
+        return lexutils.unescape_string(body)
+    elif tok.type == 'RSCONST':
+        match = lexutils.VALID_RAW_STRING_RE.match(tok.text)
+        if match is None:
+            return None
+        return match.group('body')
+    elif tok.type == 'ICONST':
+        if int(tok.text) > MAX_INT64:
+            # Out of range integers are rejected by the compiler.
+            return None
+        return tok.text
+    elif tok.type == 'NCONST':
+        return tok.text[:-1]
+    else:
+        return tok.text
+
+
+def _get_token_key(tok) -> str:
+    # Tokens are kept as written: unreserved and reserved keywords
+    # can be identifiers, and identifiers are case-sensitive.
+    if tok.type in MERGED_TYPES:
+        # The text of a merged token is that of its first part; its
+        # value has both parts, separated by a single space.
+        return tok.value
+    else:
+        return tok.text
+
+
+def lex_source(eql: str) -> typing.Optional[Source]:
+    """Compute the token fingerprint of an EdgeQL query and extract
+    its literals.
+
+    Return None if the query cannot be lexed.
+    """
+    lex = lexer.EdgeQLLexer()
+    lex.setinputstr(eql)
+
+    tokens = []
+    norm_tokens = []
+    chunks = []
+    values = []
+    pos = 0
+    keep_literal = False
+    has_params = False
+
+    try:
+        for tok in lex.lex():
+            tok_type = tok.type
+            if tok_type == 'EOF':
+                break
+            elif tok_type == '$':
+                has_params = True
+
+            tok_key = _get_token_key(tok)
+            tokens.append(tok_key)
+
+            if tok_type in LITERAL_TYPES and not keep_literal:
+                value = _get_literal_value(tok)
+                if value is not None:
+                    # The parameter is a single fingerprint token, so
+                    # it cannot be confused with a parameter written
+                    # in the query.
+                    param = (f'<{LITERAL_TYPES[tok_type]}>'
+                             f'${PARAM_PREFIX}{len(values)}')
+                    chunks.append(eql[pos:tok.start.pointer])
+                    chunks.append(f' {param} ')
+                    norm_tokens.append(param)
+                    values.append(value.encode('utf-8'))
+                    pos = tok.end.pointer
+                    keep_literal = False
+                    continue
+
+            norm_tokens.append(tok_key)
+            if tok_type in KEEP_AFTER:
+                keep_literal = True
+            elif tok_type != '(':
+                # "LIMIT (1)" is as constant as "LIMIT 1".
+                keep_literal = False
+    except common_lexer.LexError:
+        # The compiler reports the error.
+        return None
+
+    normalized = None
+    if values and not has_params:
+        chunks.append(eql[pos:])
+        normalized = NormalizedSource(
+            text=''.join(chunks),
+            values=tuple(values),
+            key=' '.join(norm_tokens).encode('utf-8'))
+
+    return Source(key=' '.join(tokens).encode('utf-8'),
+                  normalized=normalized)
+
+
+def normalize(eql: str) -> typing.Optional[NormalizedSource]:
+    """Replace the literals of an EdgeQL query with parameters.
+
+    Return None if the query has no literals to extract, or if it has
+    parameters of its own.
+    """
+    source = lex_source(eql)
+    if source is None:
+        return None
+    return source.normalized
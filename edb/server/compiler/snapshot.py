@@ -0,0 +1,98 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Snapshots of database schemas shared by compiler workers.
+
+A snapshot is a file in the internal runstate directory of the server
+holding the pickled schema of a database together with the version
+(dbver) it was taken at.  The version is stored first so that a stale
+snapshot can be detected without unpickling the schema.
+
+Versions are only meaningful within one server process, so snapshots
+are never reused after a restart.
+"""
+
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pathlib
+import pickle
+import tempfile
+import typing
+
+from edb.schema import schema as s_schema
+
+
+def get_snapshot_path(runstate_dir: os.PathLike,
+                      dbname: str) -> pathlib.Path:
+    dbname_hash = hashlib.sha1(dbname.encode()).hexdigest()
+    return pathlib.Path(runstate_dir) / f'schema-{dbname_hash}.pickle'
+
+
+def get_snapshot_dbver(runstate_dir: os.PathLike,
+                       dbname: str) -> typing.Optional[int]:
+    try:
+        with open(get_snapshot_path(runstate_dir, dbname), 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def load_schema_snapshot(runstate_dir: os.PathLike,
+                         dbname: str,
+                         dbver: int) -> typing.Optional[s_schema.Schema]:
+    try:
+        with open(get_snapshot_path(runstate_dir, dbname), 'rb') as f:
+            if pickle.load(f) != dbver:
+                return None
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def write_schema_snapshot(runstate_dir: os.PathLike,
+                          dbname: str,
+                          dbver: int,
+                          schema: bytes):
+    """Atomically replace the snapshot of *dbname*.
+
+    *schema* is the pickled schema.
+    """
+    path = get_snapshot_path(runstate_dir, dbname)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.schema-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(dbver, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.write(schema)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def remove_schema_snapshot(runstate_dir: os.PathLike, dbname: str):
+    try:
+        os.unlink(get_snapshot_path(runstate_dir, dbname))
+    except FileNotFoundError:
+        pass
@@ -28,7 +28,10 @@ cdef class DatabaseIndex:
         object _sys_config_ver
         object _sys_queries
         object _instance_data
+        object _query_store
+        object _query_stats
 
+    cdef _on_drop_database(self, dbname)
     cdef _save_system_overrides(self)
 
 
@@ -38,11 +41,24 @@ cdef class Database:
         str _name
         object _dbver
         object _eql_to_compiled
+        object _hits
+        object _warmup_task
+        object _compiling
+        int _ddl_count
+        object _schema_version_task
         DatabaseIndex _index
 
-    cdef _signal_ddl(self)
+    cdef _load_schema_version(self, bint preload=*)
+    cdef _preload_compiled_queries(self, entries, dbver)
+    cdef _on_ddl_start(self)
+    cdef _on_ddl_end(self, bint committed)
+    cdef _signal_ddl(self, user_schema)
     cdef _invalidate_caches(self)
+    cdef _close(self)
+    cdef _get_hot_queries(self)
+    cdef _record_hit(self, key)
     cdef _cache_compiled_query(self, key, query_unit)
+    cdef _lookup_compiled_query(self, key, bytes eql=*)
     cdef _new_view(self, user, query_cache)
 
 
@@ -64,13 +80,16 @@ cdef class DatabaseConnectionView:
         bint _in_tx_with_ddl
         bint _in_tx_with_set
         bint _tx_error
+        bint _ddl_pending
 
     cdef _invalidate_local_cache(self)
+    cdef _end_ddl(self, bint committed)
     cdef _reset_tx_state(self)
 
     cdef rollback_tx_to_savepoint(self, spid, modaliases, config)
     cdef recover_aliases_and_config(self, modaliases, config)
     cdef abort_tx(self)
+    cdef close(self)
 
     cdef in_tx(self)
     cdef in_tx_error(self)
@@ -78,7 +97,7 @@ cdef class DatabaseConnectionView:
     cdef cache_compiled_query(self, bytes eql, bint json_mode,
                               bint expect_one, query_unit)
     cdef lookup_compiled_query(self, bytes eql, bint json_mode,
-                               bint expect_one)
+                               bint expect_one, bytes source=*)
 
     cdef tx_error(self)
 
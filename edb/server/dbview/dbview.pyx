@@ -17,7 +17,11 @@
 #
 
 
+import asyncio
+import dataclasses
+import heapq
 import json
+import logging
 import os.path
 import pickle
 import time
@@ -27,17 +31,58 @@ import immutables
 
 from edb import errors
 from edb.common import lru
-from edb.server import defines, config
+from edb.pgsql import common as pg_common
+from edb.server import buildmeta, cache, compiler, defines, config
+from edb.server import querystats
 from edb.server.compiler import dbstate
+from edb.server.compiler import enums
 
 
-__all__ = ('DatabaseIndex', 'DatabaseConnectionView')
+cdef object DEFAULT_MODALIASES = immutables.Map(
+    {None: defines.DEFAULT_MODULE_ALIAS})
+cdef object EMPTY_CONFIG = immutables.Map()
+
+# Fingerprint of the schema of a database: every DDL command creates,
+# updates or deletes rows of the schema object tables, which all
+# inherit from edgedb.object.
+cdef bytes SCHEMA_VERSION_QUERY = b'''
+    SELECT md5(string_agg(id::text || ':' || xmin::text, ',' ORDER BY id))
+    FROM edgedb.object
+'''
+
+
+__all__ = ('DatabaseIndex', 'DatabaseConnectionView', 'eql_cache_key')
+
+
+logger = logging.getLogger('edb.server')
+
+
+cpdef eql_cache_key(bytes eql, bint json_mode, bint expect_one,
+                    modaliases, config, bint json_parameters=False,
+                    bint json_elements=False):
+    """Return the compiled query cache key for an EdgeQL query.
+
+    The compiler treats None *modaliases* and *config* as the defaults
+    of a fresh session, so the keys of such compilations are the same
+    as those of sessions in the default state.
+
+    Queries compiled for the HTTP port never share entries with those
+    of the binary port: the HTTP port compiles with JSON parameters and
+    returns one JSON value per row, which changes the compiled SQL.
+    """
+    if modaliases is None:
+        modaliases = DEFAULT_MODALIASES
+    if config is None:
+        config = EMPTY_CONFIG
+    return (eql, json_mode, expect_one, json_parameters, json_elements,
+            modaliases, config)
 
 
 cdef class Database:
 
-    # Global LRU cache of compiled anonymous queries
-    _eql_to_compiled: typing.Mapping[bytes, dbstate.QueryUnit]
+    # Global LRU cache of compiled anonymous queries, shared by
+    # all ports serving this database.
+    _eql_to_compiled: typing.Mapping[typing.Hashable, dbstate.QueryUnit]
 
     def __init__(self, DatabaseIndex index, str name):
         self._name = name
@@ -48,12 +93,236 @@ cdef class Database:
         self._eql_to_compiled = lru.LRUMapping(
             maxsize=defines._MAX_QUERIES_CACHE)
 
-    cdef _signal_ddl(self):
+        # Cache hits per query since the last DDL.
+        self._hits = {}
+        self._warmup_task = None
+
+        # Compilations in progress: cache key -> future.
+        self._compiling = {}
+
+        # Number of connections running DDL that is not yet committed.
+        self._ddl_count = 0
+        self._schema_version_task = None
+        self._load_schema_version(preload=True)
+
+    cdef _load_schema_version(self, bint preload=False):
+        if self._schema_version_task is not None:
+            self._schema_version_task.cancel()
+        self._schema_version_task = asyncio.get_running_loop().create_task(
+            self._fetch_schema_version(self._dbver, preload))
+
+    async def _fetch_schema_version(self, dbver, bint preload):
+        store = self._index._query_store
+        server = self._index._server
+        try:
+            conn = await server.acquire_pgcon(self._name)
+            try:
+                result = await conn.simple_query(
+                    SCHEMA_VERSION_QUERY, ignore_data=False)
+            finally:
+                server.release_pgcon(self._name, conn)
+        except Exception:
+            logger.exception(
+                'could not read the schema version of %r', self._name)
+            return
+
+        if self._dbver != dbver or self._ddl_count:
+            # The schema might have changed since it was read.
+            return
+
+        version = result[0][0].decode()
+        store.set_schema_version(self._name, version)
+        if not preload:
+            return
+
+        entries = await store.load(self._name, version)
+        if (self._dbver != dbver or
+                store.get_schema_version(self._name) != version):
+            # The schema has changed while we were loading.
+            return
+        self._preload_compiled_queries(entries, dbver)
+
+    cdef _preload_compiled_queries(self, entries, dbver):
+        for key, compiled in entries:
+            if key not in self._eql_to_compiled:
+                # The stored entries were compiled for the current
+                # schema by a previous server process.
+                self._eql_to_compiled[key] = dataclasses.replace(
+                    compiled, dbver=dbver)
+
+    async def _compile_single_flight(self, key, compile, is_shareable):
+        # Concurrent compilations of the same query wait for the
+        # first one instead of loading the compiler pool.
+        key = (key, self._dbver)
+        fut = self._compiling.get(key)
+        if fut is not None:
+            try:
+                result = await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    # We were cancelled ourselves.
+                    raise
+            else:
+                if is_shareable(result):
+                    return result
+            # The compilation has failed or was cancelled, or its
+            # result depends on the state of the connection that
+            # requested it.
+            return await compile()
+
+        fut = asyncio.get_running_loop().create_future()
+        self._compiling[key] = fut
+        try:
+            result = await compile()
+        except BaseException:
+            # Queries that share a key can differ in formatting, so
+            # the positions of an error are only valid for the text
+            # that was compiled: let the waiters compile on their own.
+            fut.cancel()
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            if self._compiling.get(key) is fut:
+                del self._compiling[key]
+
+    cdef _record_hit(self, key):
+        hits = self._hits
+        try:
+            hits[key] += 1
+        except KeyError:
+            if len(hits) >= defines._MAX_QUERIES_CACHE * 2:
+                # Forget the queries that are no longer cached.
+                self._hits = hits = {
+                    k: v for k, v in hits.items()
+                    if k in self._eql_to_compiled
+                }
+            hits[key] = 1
+
+    cdef _on_ddl_start(self):
+        # The DDL can be committed before we get a chance to advance
+        # the version in _signal_ddl(): do not store the queries
+        # compiled in the meantime under the current schema version.
+        self._ddl_count += 1
+        self._index._query_store.suspend(self._name)
+
+    cdef _on_ddl_end(self, bint committed):
+        self._ddl_count -= 1
+        if not committed and not self._ddl_count:
+            # The schema has not changed: resume storing queries.
+            self._load_schema_version()
+
+    cdef _signal_ddl(self, user_schema):
+        hot_queries = self._get_hot_queries()
+
         self._dbver = time.monotonic_ns()  # Advance the version
         self._invalidate_caches()
 
+        if hot_queries or user_schema is not None:
+            self._warmup_task = asyncio.get_running_loop().create_task(
+                self._warm_up(hot_queries, self._dbver, user_schema))
+
     cdef _invalidate_caches(self):
         self._eql_to_compiled.clear()
+        self._hits.clear()
+        self._index._query_store.suspend(self._name)
+        if not self._ddl_count:
+            self._load_schema_version()
+
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+            self._warmup_task = None
+
+    cdef _close(self):
+        if self._schema_version_task is not None:
+            self._schema_version_task.cancel()
+            self._schema_version_task = None
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+            self._warmup_task = None
+
+    cdef _get_hot_queries(self):
+        candidates = [
+            key for key in self._hits
+            if isinstance(self._eql_to_compiled.get(key), dbstate.QueryUnit)
+        ]
+        return heapq.nlargest(
+            defines.HOT_QUERIES_WARMUP_SIZE, candidates,
+            key=self._hits.__getitem__)
+
+    async def _warm_up(self, hot_queries, dbver, user_schema):
+        try:
+            if user_schema is not None:
+                # Compiler workers would otherwise have to introspect
+                # the new schema.
+                server = self._index._server
+                try:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, compiler.write_schema_snapshot,
+                        server.get_internal_runstate_dir(),
+                        self._name, dbver, user_schema)
+                    await server.update_database_schema(
+                        self._name, dbver, user_schema)
+                except Exception:
+                    logger.exception(
+                        'could not send the new schema of %r to compiler '
+                        'workers', self._name)
+
+            # Recompile the most used queries against the new schema
+            # so that clients do not all miss the cache at once.
+            pool = self._index._server.get_compiler_pool()
+            if pool is None:
+                return
+
+            for key in hot_queries:
+                if self._dbver != dbver:
+                    return
+                if key in self._eql_to_compiled:
+                    continue
+
+                (eql, json_mode, expect_one, json_parameters,
+                    json_elements, modaliases, config) = key
+                if json_parameters:
+                    capability = enums.Capability.QUERY
+                else:
+                    capability = enums.Capability.ALL
+
+                async def compile():
+                    units = await pool.call(
+                        'compile_eql',
+                        None,  # connection ID: no state to keep
+                        self._name,
+                        dbver,
+                        eql,
+                        modaliases,
+                        config,
+                        json_mode,
+                        expect_one,
+                        enums.CompileStatementMode.SINGLE,
+                        capability,
+                        json_parameters,
+                        json_elements,
+                    )
+                    self._index.record_compile(self._name, eql, units)
+                    return units
+
+                try:
+                    units = await self._compile_single_flight(
+                        key, compile, lambda units: units[0].cacheable)
+                except Exception:
+                    # The query might no longer be valid.
+                    logger.debug(
+                        'could not recompile %r after DDL', eql,
+                        exc_info=True)
+                    continue
+
+                query_unit = units[0]
+                if query_unit.cacheable and self._dbver == dbver:
+                    self._cache_compiled_query(key, query_unit)
+        finally:
+            if self._dbver == dbver:
+                self._warmup_task = None
 
     cdef _cache_compiled_query(self, key, compiled: dbstate.QueryUnit):
         assert compiled.cacheable
@@ -65,6 +334,24 @@ cdef class Database:
 
         self._eql_to_compiled[key] = compiled
 
+        if compiled.dbver == self._dbver:
+            store = self._index._query_store
+            store.put(
+                self._name, store.get_schema_version(self._name),
+                key, compiled)
+
+    cdef _lookup_compiled_query(self, key, bytes eql=None):
+        compiled = self._eql_to_compiled.get(key)
+        if compiled is not None:
+            if compiled.dbver != self._dbver:
+                # Compiled for an older version of the schema.
+                return None
+            self._index._query_store.touch(self._name, key)
+            self._record_hit(key)
+            self._index._query_stats.record_cache_hit(
+                self._name, eql, compiled)
+        return compiled
+
     cdef _new_view(self, user, query_cache):
         return DatabaseConnectionView(self, user=user, query_cache=query_cache)
 
@@ -83,7 +370,9 @@ cdef class DatabaseConnectionView:
         self._config = immutables.Map()
         self._in_tx_config = None
 
-        self._modaliases = immutables.Map({None: defines.DEFAULT_MODULE_ALIAS})
+        self._modaliases = DEFAULT_MODALIASES
+
+        self._ddl_pending = False
 
         # Whenever we are in a transaction that had executed a
         # DDL command, we use this cache for compiled queries.
@@ -95,7 +384,14 @@ cdef class DatabaseConnectionView:
     cdef _invalidate_local_cache(self):
         self._eql_to_compiled.clear()
 
+    cdef _end_ddl(self, bint committed):
+        if self._ddl_pending:
+            self._ddl_pending = False
+            self._db._on_ddl_end(committed)
+
     cdef _reset_tx_state(self):
+        # The DDL of a committed transaction has been ended already.
+        self._end_ddl(False)
         self._txid = None
         self._in_tx = False
         self._in_tx_config = None
@@ -117,6 +413,10 @@ cdef class DatabaseConnectionView:
         self._modaliases = modaliases
         self.set_session_config(config)
 
+    cdef close(self):
+        # The backend rolls back the transaction of a closed connection.
+        self._end_ddl(False)
+
     cdef abort_tx(self):
         if not self.in_tx():
             raise errors.InternalServerError('abort_tx(): not in transaction')
@@ -134,6 +434,43 @@ cdef class DatabaseConnectionView:
         else:
             self._config = new_conf
 
+    def get_session_state_sql(self):
+        """Return SQL that applies session state to a backend connection.
+
+        Returns None if the session is in the default state, which is
+        the state of every fresh or reset backend connection.
+        """
+        if self._modaliases == DEFAULT_MODALIASES and not self._config:
+            return None
+
+        ql = pg_common.quote_literal
+        settings = config.get_settings()
+
+        rows = []
+        for alias, module in self._modaliases.items():
+            rows.append(f"({ql(alias or '')}, {ql(module)}, 'A')")
+
+        backend_sets = []
+        for name, value in self._config.items():
+            setting = settings[name]
+            if setting.backend_setting:
+                backend_sets.append(
+                    f'SET {pg_common.quote_ident(setting.backend_setting)} '
+                    f'= {ql(str(value))};')
+            else:
+                jvalue = json.dumps(config.value_to_json_value(setting, value))
+                rows.append(f"({ql(name)}, {ql(jvalue)}, 'C')")
+
+        sql = 'DELETE FROM _edgecon_state;'
+        if rows:
+            sql += (
+                f'INSERT INTO _edgecon_state(name, value, type) '
+                f'VALUES {", ".join(rows)};'
+            )
+        sql += ''.join(backend_sets)
+
+        return sql.encode()
+
     property modaliases:
         def __get__(self):
             return self._modaliases
@@ -165,7 +502,8 @@ cdef class DatabaseConnectionView:
 
         assert query_unit.cacheable
 
-        key = (eql, json_mode, expect_one, self._modaliases, self._config)
+        key = eql_cache_key(
+            eql, json_mode, expect_one, self._modaliases, self._config)
 
         if self._in_tx_with_ddl:
             self._eql_to_compiled[key] = query_unit
@@ -173,23 +511,47 @@ cdef class DatabaseConnectionView:
             self._db._cache_compiled_query(key, query_unit)
 
     cdef lookup_compiled_query(self, bytes eql, bint json_mode,
-                               bint expect_one):
+                               bint expect_one, bytes source=None):
+        # *source* is the text of the query, if *eql* is a fingerprint
+        # of it, and is only used for query statistics.
         if (self._tx_error or
                 not self._query_cache_enabled or
                 self._in_tx_with_ddl):
             return None
 
-        key = (eql, json_mode, expect_one, self._modaliases, self._config)
+        key = eql_cache_key(
+            eql, json_mode, expect_one, self._modaliases, self._config)
 
         if self._in_tx_with_ddl or self._in_tx_with_set:
             query_unit = self._eql_to_compiled.get(key)
         else:
-            query_unit = self._db._eql_to_compiled.get(key)
-            if query_unit is not None and query_unit.dbver != self.dbver:
-                query_unit = None
+            query_unit = self._db._lookup_compiled_query(
+                key, eql if source is None else source)
 
         return query_unit
 
+    async def compile_single_flight(self, bytes eql, bint json_mode,
+                                    bint expect_one, compile):
+        """Call *compile*, sharing its result with identical compilations.
+
+        *compile* must return a list of compiled query units.
+        """
+        if self._in_tx or not self._query_cache_enabled:
+            return await compile()
+
+        key = eql_cache_key(
+            eql, json_mode, expect_one, self._modaliases, self._config)
+
+        return await self._db._compile_single_flight(
+            key, compile, lambda units: units[0].cacheable)
+
+    def record_compile(self, bytes eql, units):
+        self._db._index.record_compile(self._db._name, eql, units)
+
+    def record_execute(self, query_unit, elapsed, rows, bytes_sent):
+        self._db._index.record_execute(
+            self._db._name, query_unit, elapsed, rows, bytes_sent)
+
     cdef tx_error(self):
         if self._in_tx:
             self._tx_error = True
@@ -206,6 +568,10 @@ cdef class DatabaseConnectionView:
         if self._in_tx and not self._txid:
             raise errors.InternalServerError('unset txid in transaction')
 
+        if query_unit.has_ddl and not self._ddl_pending:
+            self._ddl_pending = True
+            self._db._on_ddl_start()
+
         if self._in_tx:
             if query_unit.has_ddl:
                 self._in_tx_with_ddl = True
@@ -214,6 +580,8 @@ cdef class DatabaseConnectionView:
 
     cdef on_error(self, query_unit):
         self.tx_error()
+        if not self._in_tx:
+            self._end_ddl(False)
 
     cdef on_success(self, query_unit):
         if query_unit.tx_savepoint_rollback:
@@ -222,7 +590,11 @@ cdef class DatabaseConnectionView:
             self._invalidate_local_cache()
 
         if not self._in_tx and query_unit.has_ddl:
-            self._db._signal_ddl()
+            self._end_ddl(True)
+            self._db._signal_ddl(query_unit.user_schema)
+
+        if query_unit.drop_db is not None:
+            self._db._index._on_drop_database(query_unit.drop_db)
 
         if query_unit.modaliases is not None:
             self._modaliases = query_unit.modaliases
@@ -235,7 +607,8 @@ cdef class DatabaseConnectionView:
                     '"commit" outside of a transaction')
             self._config = self._in_tx_config
             if self._in_tx_with_ddl:
-                self._db._signal_ddl()
+                self._end_ddl(True)
+                self._db._signal_ddl(query_unit.user_schema)
             self._reset_tx_state()
 
         elif query_unit.tx_rollback:
@@ -268,6 +641,12 @@ cdef class DatabaseIndex:
     async def init(cls, server) -> DatabaseIndex:
         state = cls(server)
         await state.reload_config()
+
+        await state._query_store.start()
+        for dbname in state._query_store.get_databases():
+            # Start preloading compiled queries in the background.
+            state._get_db(dbname)
+
         return state
 
     def __init__(self, server):
@@ -290,6 +669,19 @@ cdef class DatabaseIndex:
         self._sys_config = None
         self._sys_config_ver = time.monotonic_ns()
 
+        self._query_store = cache.PersistentQueryCache(
+            os.path.join(datadir, 'query_cache.sqlite'),
+            build=cache.get_build_key(str(buildmeta.get_version())),
+            maxsize=defines.PERSISTENT_QUERY_CACHE_SIZE)
+
+        self._query_stats = querystats.QueryStats(datadir)
+
+    def close(self):
+        for db in self._dbs.values():
+            (<Database>db)._close()
+        self._query_store.close()
+        self._query_stats.close()
+
     def get_sys_query(self, key: str) -> bytes:
         return self._sys_queries[key]
 
@@ -323,6 +715,58 @@ cdef class DatabaseIndex:
             self._dbs[dbname] = db
         return db
 
+    def lookup_compiled_query(self, dbname, key, eql=None):
+        """Return the compiled query cached under *key*, or None.
+
+        *eql* is the text of an EdgeQL query, used for query
+        statistics; cache hits of other queries are not recorded.
+        """
+        db = self._get_db(dbname)
+        return (<Database>db)._lookup_compiled_query(key, eql)
+
+    async def compile_single_flight(self, dbname, key, compile,
+                                    is_shareable):
+        """Call *compile*, sharing its result with identical compilations.
+
+        Compilations of EdgeQL cache keys are shared by all ports and
+        the warm-up after DDL: for them, *compile* must return a list
+        of compiled query units.
+        """
+        db = self._get_db(dbname)
+        return await (<Database>db)._compile_single_flight(
+            key, compile, is_shareable)
+
+    def cache_compiled_query(self, dbname, key, compiled):
+        db = self._get_db(dbname)
+        (<Database>db)._cache_compiled_query(key, compiled)
+
+    def get_compiled_query_cache_sizes(self):
+        return {
+            dbname: len((<Database>db)._eql_to_compiled)
+            for dbname, db in self._dbs.items()
+        }
+
+    def record_compile(self, dbname, eql, units):
+        self._query_stats.record_compile(dbname, eql, units)
+
+    def record_execute(self, dbname, query_unit, elapsed, rows, bytes_sent):
+        self._query_stats.record_execute(
+            dbname, query_unit, elapsed, rows, bytes_sent)
+
+    cdef _on_drop_database(self, dbname):
+        db = self._dbs.pop(dbname, None)
+        if db is not None:
+            (<Database>db)._close()
+        self._query_store.drop_database(dbname)
+        self._query_stats.drop_database(dbname)
+        try:
+            compiler.remove_schema_snapshot(
+                self._server.get_internal_runstate_dir(), dbname)
+        except OSError:
+            logger.warning(
+                'could not remove the schema snapshot of %r', dbname,
+                exc_info=True)
+
     cdef _save_system_overrides(self):
         data = config.to_json(config.get_settings(), self._sys_config)
         with open(self._sys_overrides_fn, 'wt') as f:
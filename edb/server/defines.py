@@ -27,12 +27,29 @@ EDGEDB_ENCODING = 'utf-8'
 
 
 _MAX_QUERIES_CACHE = 1000
+# Maximum number of compiled queries kept on disk (for all databases).
+PERSISTENT_QUERY_CACHE_SIZE = 10_000
+# Number of most used queries recompiled in the background after DDL.
+HOT_QUERIES_WARMUP_SIZE = 100
+
+# Maximum number of queries (for all databases) statistics are kept for.
+MAX_QUERY_STATS = 1000
+# Compilations that take longer than this (in seconds) are logged.
+SLOW_COMPILE_LOG_THRESHOLD = 0.5
 
 _QUERY_ROLLING_AVG_LEN = 10
 _QUERIES_ROLLING_AVG_LEN = 300
 
 DEFAULT_MODULE_ALIAS = 'default'
 
+MIN_COMPILER_POOL_SIZE = 2
+# Maximum number of parsed query texts kept by a single compiler worker.
+MAX_COMPILER_PARSE_CACHE = 1000
+# Maximum number of named prepared statements of a client connection.
+MAX_PREPARED_STATEMENTS = 1000
+
 
-HTTP_PORT_QUERY_CACHE_SIZE = 500
 HTTP_PORT_MAX_CONCURRENCY = 250
+# Size of the part of a streamed HTTP response that is buffered before
+# the query is paused to wait for the client.
+HTTP_STREAM_BUFFER_SIZE = 8 * 1024 * 1024
@@ -35,6 +35,8 @@ cdef class HttpResponse:
         bint close_connection
         bytes content_type
         bytes body
+        bint streaming
+        bint chunked
 
 
 cdef class HttpProtocol:
@@ -45,6 +47,7 @@ cdef class HttpProtocol:
         object transport
         object unprocessed
         bint in_response
+        object write_waiter
 
         HttpRequest current_request
 
@@ -53,6 +56,10 @@ cdef class HttpProtocol:
 
     cdef write(self, HttpRequest request, HttpResponse response)
 
+    cdef start_streaming(self, HttpRequest request, HttpResponse response)
+    cdef write_chunk(self, HttpResponse response, bytes data)
+    cdef finish_streaming(self, HttpResponse response)
+
     cdef unhandled_exception(self, ex)
     cdef resume(self)
     cdef close(self)
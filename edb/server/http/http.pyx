@@ -17,6 +17,7 @@
 #
 
 
+import asyncio
 import collections
 import http
 
@@ -40,6 +41,8 @@ cdef class HttpResponse:
         self.content_type = b'text/plain'
         self.body = b''
         self.close_connection = False
+        self.streaming = False
+        self.chunked = False
 
 
 cdef class HttpProtocol:
@@ -52,6 +55,7 @@ cdef class HttpProtocol:
         self.current_request = HttpRequest()
         self.in_response = False
         self.unprocessed = None
+        self.write_waiter = None
 
     def connection_made(self, transport):
         self.transport = transport
@@ -60,6 +64,28 @@ cdef class HttpProtocol:
         self.transport = None
         self.unprocessed = None
 
+        if self.write_waiter is not None:
+            if not self.write_waiter.done():
+                self.write_waiter.set_exception(ConnectionAbortedError())
+            self.write_waiter = None
+
+    def pause_writing(self):
+        if self.write_waiter is None:
+            self.write_waiter = self.loop.create_future()
+
+    def resume_writing(self):
+        if self.write_waiter is not None:
+            if not self.write_waiter.done():
+                self.write_waiter.set_result(True)
+            self.write_waiter = None
+
+    async def drain(self):
+        # Waits until the client has read the data written so far.
+        if self.transport is None:
+            raise ConnectionAbortedError
+        if self.write_waiter is not None:
+            await asyncio.shield(self.write_waiter)
+
     def data_received(self, data):
         try:
             self.parser.feed_data(data)
@@ -149,6 +175,49 @@ cdef class HttpProtocol:
             response.body,
             response.close_connection)
 
+    cdef start_streaming(self, HttpRequest request, HttpResponse response):
+        # Sends the response headers; the body is then sent with
+        # write_chunk() and terminated by finish_streaming().
+        assert type(response.status) is HTTPStatus
+        assert not response.streaming
+        if self.transport is None:
+            raise ConnectionAbortedError
+
+        response.streaming = True
+        data = [
+            b'HTTP/', request.version, b' ',
+            f'{response.status.value} {response.status.phrase}'.encode(),
+            b'\r\n',
+            b'Content-Type: ', response.content_type, b'\r\n',
+        ]
+        if request.version == b'1.0':
+            # No chunked encoding in HTTP/1.0, the end of the body
+            # is signalled by closing the connection.
+            response.close_connection = True
+        else:
+            response.chunked = True
+            data.append(b'Transfer-Encoding: chunked\r\n')
+        if response.close_connection:
+            data.append(b'Connection: close\r\n')
+        data.append(b'\r\n')
+        self.transport.write(b''.join(data))
+
+    cdef write_chunk(self, HttpResponse response, bytes data):
+        assert response.streaming
+        if self.transport is None:
+            raise ConnectionAbortedError
+        if not data:
+            return
+        if response.chunked:
+            self.transport.write(b''.join((
+                f'{len(data):x}\r\n'.encode(), data, b'\r\n')))
+        else:
+            self.transport.write(data)
+
+    cdef finish_streaming(self, HttpResponse response):
+        if response.chunked and self.transport is not None:
+            self.transport.write(b'0\r\n\r\n')
+
     async def _handle_request(self, HttpRequest request):
         cdef:
             HttpResponse response = HttpResponse()
@@ -159,10 +228,21 @@ cdef class HttpProtocol:
         try:
             await self.handle_request(request, response)
         except Exception as ex:
-            self.unhandled_exception(ex)
+            if response.streaming:
+                # The response has been partially sent already;
+                # all we can do is to drop the connection.
+                if debug.flags.server:
+                    markup.dump(ex)
+                if self.transport is not None:
+                    self.close()
+            else:
+                self.unhandled_exception(ex)
             return
 
-        self.write(request, response)
+        if response.streaming:
+            self.finish_streaming(response)
+        else:
+            self.write(request, response)
         self.in_response = False
 
         if response.close_connection or not request.should_keep_alive:
@@ -19,12 +19,9 @@
 
 from __future__ import annotations
 
-import asyncio
-
 from edb.common import taskgroup
 
 from edb.server import baseport
-from edb.server import cache
 from edb.server import defines
 
 
@@ -46,11 +43,6 @@ class BaseHttpPort(baseport.Port):
                 f'concurrency must be greater than 0 and '
                 f'less than {defines.HTTP_PORT_MAX_CONCURRENCY}')
 
-        self._compilers = asyncio.LifoQueue()
-        self._pgcons = asyncio.LifoQueue()
-        self._compilers_list = []
-        self._pgcons_list = []
-
         self._nethost = nethost
         self._netport = netport
 
@@ -59,16 +51,6 @@ class BaseHttpPort(baseport.Port):
         self.concurrency = concurrency
 
         self._servers = []
-        self._query_cache = cache.StatementsCache(
-            maxsize=defines.HTTP_PORT_QUERY_CACHE_SIZE)
-
-    @property
-    def compilers(self):
-        return self._compilers
-
-    @property
-    def pgcons(self):
-        return self._pgcons
 
     @classmethod
     def get_proto_name(cls):
@@ -77,36 +59,48 @@ class BaseHttpPort(baseport.Port):
     def get_dbver(self):
         return self._dbindex.get_dbver(self.database)
 
+    async def update_database_schema(self, dbname, dbver, schema):
+        if dbname == self.database:
+            await super().update_database_schema(dbname, dbver, schema)
+
+    def lookup_compiled_query(self, key, eql=None):
+        return self._dbindex.lookup_compiled_query(self.database, key, eql)
+
+    async def compile_single_flight(self, key, compile, is_shareable):
+        return await self._dbindex.compile_single_flight(
+            self.database, key, compile, is_shareable)
+
+    def cache_compiled_query(self, key, compiled):
+        self._dbindex.cache_compiled_query(self.database, key, compiled)
+
+    def record_compile(self, eql, units):
+        self._dbindex.record_compile(self.database, eql, units)
+
+    def record_execute(self, query_unit, elapsed, rows, bytes_sent):
+        self._dbindex.record_execute(
+            self.database, query_unit, elapsed, rows, bytes_sent)
+
     def get_compiler_worker_cls(self):
         raise NotImplementedError
 
     def get_compiler_worker_name(self):
         return f'compiler-{self._netport}'
 
+    def get_compiler_pool_size(self):
+        return self.concurrency
+
     def build_protocol(self):
         raise NotImplementedError
 
-    async def start(self):
-        compilers = []
-        pgcons = []
-
-        await super().start()
-
-        async with taskgroup.TaskGroup() as g:
-            for _ in range(self.concurrency):
-                compilers.append(
-                    g.create_task(self.new_compiler(
-                        self.database, self.get_dbver())))
-                pgcons.append(
-                    g.create_task(self.get_server().new_pgcon(self.database)))
+    async def acquire_pgcon(self):
+        return await self.get_server().acquire_pgcon(self.database)
 
-        for com_task in compilers:
-            self._compilers.put_nowait(com_task.result())
-            self._compilers_list.append(com_task.result())
+    def release_pgcon(self, pgcon):
+        self.get_server().release_pgcon(
+            self.database, pgcon, discard=not pgcon.is_idle())
 
-        for con_task in pgcons:
-            self._pgcons.put_nowait(con_task.result())
-            self._pgcons_list.append(con_task.result())
+    async def start(self):
+        await super().start()
 
         nethost = await self._fix_localhost(self._nethost, self._netport)
         srv = await self._loop.create_server(
@@ -123,14 +117,4 @@ class BaseHttpPort(baseport.Port):
                     g.create_task(srv.wait_closed())
                 self._servers.clear()
         finally:
-            try:
-                async with taskgroup.TaskGroup() as g:
-                    for cmp in self._compilers_list:
-                        g.create_task(cmp.close())
-                    self._compilers_list.clear()
-
-                for pgcon in self._pgcons_list:
-                    pgcon.terminate()
-                self._pgcons_list.clear()
-            finally:
-                await super().stop()
+            await super().stop()
@@ -18,6 +18,7 @@
 
 
 import json
+import time
 import urllib.parse
 
 import immutables
@@ -29,16 +30,18 @@ from edb.common import debug
 from edb.common import markup
 
 from edb.server import compiler
+from edb.server import dbview
+from edb.server import defines
+from edb.server.compiler import normalization
 from edb.server.http import http
 from edb.server.http cimport http
 
 
 cdef class Protocol(http.HttpProtocol):
 
-    def __init__(self, loop, server, query_cache):
+    def __init__(self, loop, server):
         http.HttpProtocol.__init__(self, loop)
         self.server = server
-        self.query_cache = query_cache
 
     async def handle_request(self, http.HttpRequest request,
                              http.HttpResponse response):
@@ -104,8 +107,11 @@ cdef class Protocol(http.HttpProtocol):
         response.status = http.HTTPStatus.OK
         response.content_type = b'application/json'
         try:
-            result = await self.execute(query.encode(), variables)
+            await self.execute(query.encode(), variables, request, response)
         except Exception as ex:
+            if response.streaming:
+                raise
+
             if debug.flags.server:
                 markup.dump(ex)
 
@@ -121,39 +127,56 @@ cdef class Protocol(http.HttpProtocol):
             }
 
             response.body = json.dumps({'error': err_dct}).encode()
-        else:
-            response.body = b'{"data":' + result + b'}'
 
     async def compile(self, dbver, bytes query):
-        comp = await self.server.compilers.get()
+        units = await self.server.get_compiler_pool().call(
+            'compile_eql',
+            None,  # connection ID: no state to keep
+            self.server.database,
+            dbver,
+            query,
+            None,  # modaliases
+            None,  # session config
+            True,  # json mode
+            False, # expected cardinality is MANY
+            compiler.CompileStatementMode.SINGLE,
+            compiler.Capability.QUERY,
+            True,  # json parameters
+            True,  # one JSON value per row
+        )
+        self.server.record_compile(query, units)
+        return units
+
+    cdef bytes get_source_key(self, bytes query):
+        # Queries that differ only in formatting share a compiled
+        # query; those that cannot be lexed are cached by their text.
         try:
-            units = await comp.call(
-                'compile_eql',
-                dbver,
-                query,
-                None,  # modaliases
-                None,  # session config
-                True,  # json mode
-                False, # expected cardinality is MANY
-                compiler.CompileStatementMode.SINGLE,
-                compiler.Capability.QUERY,
-                True,  # json parameters
-            )
-            return units[0]
-        finally:
-            self.server.compilers.put_nowait(comp)
-
-    async def execute(self, bytes query, variables):
+            source = normalization.lex_source(query.decode())
+        except UnicodeDecodeError:
+            source = None
+        if source is None:
+            return query
+        return source.key
+
+    async def execute(self, bytes query, variables,
+                      http.HttpRequest request, http.HttpResponse response):
         dbver = self.server.get_dbver()
-        cache_key = (query, dbver)
+        cache_key = dbview.eql_cache_key(
+            self.get_source_key(query), True, False, None, None,
+            json_parameters=True, json_elements=True)
         use_prep_stmt = False
 
-        query_unit: compiler.QueryUnit = self.query_cache.get(
-            cache_key, None)
+        query_unit: compiler.QueryUnit = self.server.lookup_compiled_query(
+            cache_key, query)
 
         if query_unit is None:
-            query_unit = await self.compile(dbver, query)
-            self.query_cache[cache_key] = query_unit
+            units = await self.server.compile_single_flight(
+                cache_key,
+                lambda: self.compile(dbver, query),
+                lambda units: units[0].cacheable)
+            query_unit = units[0]
+            if query_unit.cacheable:
+                self.server.cache_compiled_query(cache_key, query_unit)
         else:
             # This is at least the second time this query is used.
             use_prep_stmt = True
@@ -167,16 +190,45 @@ cdef class Protocol(http.HttpProtocol):
                 else:
                     args.append(variables[name])
 
-        pgcon = await self.server.pgcons.get()
+        nrows = 0
+        nbytes = 0
+
+        async def write_rows(rows):
+            # Called for every batch of rows but the last one, i.e.
+            # only if the result is too big to be sent at once.
+            nonlocal nrows, nbytes
+            nrows += len(rows)
+            nbytes += sum(len(row) for row in rows)
+            if not response.streaming:
+                self.start_streaming(request, response)
+                # Rather than hold the backend connection while a slow
+                # client reads the result, buffer up to a limit.
+                self.transport.set_write_buffer_limits(
+                    high=defines.HTTP_STREAM_BUFFER_SIZE)
+                self.write_chunk(response, b'{"data":[' + b','.join(rows))
+            else:
+                self.write_chunk(response, b',' + b','.join(rows))
+            await self.drain()
+
+        pgcon = await self.server.acquire_pgcon()
         try:
-            data = await pgcon.parse_execute_json(
+            started = time.monotonic()
+            rows = await pgcon.parse_execute_json(
                 query_unit.sql[0], query_unit.sql_hash, query_unit.dbver,
-                use_prep_stmt, args)
+                use_prep_stmt, args, write_rows)
         finally:
-            self.server.pgcons.put_nowait(pgcon)
+            self.server.release_pgcon(pgcon)
 
-        if data is None:
-            raise errors.InternalServerError(
-                f'no data received for a JSON query {query_unit.sql[0]!r}')
+        self.server.record_execute(
+            query_unit,
+            time.monotonic() - started,
+            nrows + len(rows),
+            nbytes + sum(len(row) for row in rows))
 
-        return data
+        if response.streaming:
+            if rows:
+                self.write_chunk(response, b',' + b','.join(rows) + b']}')
+            else:
+                self.write_chunk(response, b']}')
+        else:
+            response.body = b'{"data":[' + b','.join(rows) + b']}'
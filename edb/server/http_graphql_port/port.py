@@ -28,7 +28,7 @@ from . import protocol
 class HttpGraphQLPort(http.BaseHttpPort):
 
     def build_protocol(self):
-        return protocol.Protocol(self._loop, self, self._query_cache)
+        return protocol.Protocol(self._loop, self)
 
     def get_compiler_worker_cls(self):
         return compiler.Compiler
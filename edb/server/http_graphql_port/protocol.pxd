@@ -18,10 +18,8 @@
 
 
 from edb.server.http cimport http
-from edb.server.cache cimport stmt_cache
 
 
 cdef class Protocol(http.HttpProtocol):
     cdef:
         object server
-        stmt_cache.StatementsCache query_cache
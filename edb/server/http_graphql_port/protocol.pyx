@@ -36,10 +36,9 @@ from . import compiler
 
 cdef class Protocol(http.HttpProtocol):
 
-    def __init__(self, loop, server, query_cache):
+    def __init__(self, loop, server):
         http.HttpProtocol.__init__(self, loop)
         self.server = server
-        self.query_cache = query_cache
 
     async def handle_request(self, http.HttpRequest request,
                              http.HttpResponse response):
@@ -147,29 +146,31 @@ cdef class Protocol(http.HttpProtocol):
             response.body = b'{"data":' + result + b'}'
 
     async def compile(self, dbver, query, operation_name, variables):
-        compiler = await self.server.compilers.get()
-        try:
-            return await compiler.call(
-                'compile_graphql',
-                dbver,
-                query,
-                operation_name,
-                variables)
-        finally:
-            self.server.compilers.put_nowait(compiler)
+        return await self.server.get_compiler_pool().call(
+            'compile_graphql',
+            self.server.database,
+            dbver,
+            query,
+            operation_name,
+            variables)
 
     async def execute(self, query, operation_name, variables):
         dbver = self.server.get_dbver()
-        cache_key = (query, operation_name, dbver)
+        cache_key = ('graphql', query, operation_name)
         use_prep_stmt = False
 
-        op: compiler.CompiledOperation = self.query_cache.get(
-            cache_key, None)
+        op: compiler.CompiledOperation = self.server.lookup_compiled_query(
+            cache_key)
 
         if op is None:
-            op = await self.compile(
-                dbver, query, operation_name, variables)
-            self.query_cache[cache_key] = op
+            op = await self.server.compile_single_flight(
+                cache_key,
+                lambda: self.compile(
+                    dbver, query, operation_name, variables),
+                # Operations that depend on the values of variables
+                # cannot be reused by requests with other variables.
+                lambda op: not op.cache_deps_vars)
+            self.server.cache_compiled_query(cache_key, op)
         else:
             if op.cache_deps_vars:
                 op = await self.compile(
@@ -191,13 +192,13 @@ cdef class Protocol(http.HttpProtocol):
                 else:
                     args.append(variables[name])
 
-        pgcon = await self.server.pgcons.get()
+        pgcon = await self.server.acquire_pgcon()
         try:
             data = await pgcon.parse_execute_json(
                 op.sql, op.sql_hash, op.dbver,
                 use_prep_stmt, args)
         finally:
-            self.server.pgcons.put_nowait(pgcon)
+            self.server.release_pgcon(pgcon)
 
         if data is None:
             raise errors.InternalServerError(
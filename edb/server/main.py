@@ -167,8 +167,11 @@ def _run_server(cluster, args, runstate_dir, internal_runstate_dir):
             runstate_dir=runstate_dir,
             internal_runstate_dir=internal_runstate_dir,
             max_backend_connections=args['max_backend_connections'],
+            compiler_buffer_min_size=args['compiler_buffer_min_size'],
+            compiler_buffer_max_size=args['compiler_buffer_max_size'],
             nethost=args['bind_address'],
             netport=args['port'],
+            metrics_port=args['metrics_port'],
         )
 
         loop.run_until_complete(ss.init())
@@ -349,6 +352,9 @@ _server_options = [
     click.option(
         '-p', '--port', type=int, default=None,
         help='port to listen on'),
+    click.option(
+        '--metrics-port', type=int, default=None,
+        help='port to serve Prometheus metrics on (disabled by default)'),
     click.option(
         '-b', '--background', is_flag=True, help='daemonize'),
     click.option(
@@ -363,7 +369,16 @@ _server_options = [
         help=('directory where UNIX sockets will be created '
               '("/run" on Linux by default)')),
     click.option(
-        '--max-backend-connections', type=int, default=100),
+        '--max-backend-connections', type=int, default=100,
+        help='maximum number of open connections to the backend server'),
+    click.option(
+        '--compiler-buffer-min-size', type=int, default=1,
+        help='minimum number of idle compiler processes kept ready '
+             'to be used by new connections'),
+    click.option(
+        '--compiler-buffer-max-size', type=int, default=4,
+        help='maximum number of idle compiler processes kept ready '
+             'to be used by new connections'),
 ]
 
 
@@ -392,6 +407,12 @@ def server_main(*, insecure=False, **kwargs):
 
     kwargs['insecure'] = insecure
 
+    if (kwargs['compiler_buffer_min_size'] < 0 or
+            kwargs['compiler_buffer_max_size'] <
+            kwargs['compiler_buffer_min_size']):
+        abort('--compiler-buffer-max-size must be greater than or equal '
+              'to --compiler-buffer-min-size, which must not be negative')
+
     if kwargs['background']:
         daemon_opts = {'detach_process': True}
         pidfile = os.path.join(
@@ -0,0 +1,156 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Server metrics in the Prometheus text exposition format.
+
+Counters and histograms are updated on hot paths, so updating them
+is just an addition (and a bisection for histograms).  Values that
+reflect the current state of the server (e.g. the number of open
+connections) are collected as gauges when the metrics are rendered.
+"""
+
+
+from __future__ import annotations
+
+import bisect
+import typing
+
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+Labels = typing.Mapping[str, str]
+
+
+def _render_labels(labels: typing.Optional[Labels]) -> str:
+    if not labels:
+        return ''
+    items = ','.join(
+        f'{name}="{_escape_label_value(str(value))}"'
+        for name, value in labels.items())
+    return f'{{{items}}}'
+
+
+def _escape_label_value(value: str) -> str:
+    return (value.replace('\\', '\\\\')
+                 .replace('\n', '\\n')
+                 .replace('"', '\\"'))
+
+
+def _render_header(out: typing.List[str], name: str, doc: str, kind: str):
+    out.append(f'# HELP {name} {doc}')
+    out.append(f'# TYPE {name} {kind}')
+
+
+def render_gauge(out: typing.List[str], name: str, doc: str,
+                 samples: typing.Iterable[
+                     typing.Tuple[typing.Optional[Labels], float]], *,
+                 kind: str='gauge'):
+    """Render a metric collected at scrape time.
+
+    *samples* is an iterable of (labels, value) pairs.
+    """
+    _render_header(out, name, doc, kind)
+    for labels, value in samples:
+        out.append(f'{name}{_render_labels(labels)} {value}')
+
+
+class Counter:
+
+    def __init__(self, name: str, doc: str):
+        self.name = name
+        self.doc = doc
+        self.value = 0
+
+    def inc(self, value=1):
+        self.value += value
+
+    def render(self, out: typing.List[str]):
+        _render_header(out, self.name, self.doc, 'counter')
+        out.append(f'{self.name} {self.value}')
+
+
+class Histogram:
+
+    def __init__(self, name: str, doc: str, *,
+                 buckets: typing.Sequence[float]=DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.buckets = tuple(buckets)
+        # The last slot counts values above the largest bucket.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, out: typing.List[str]):
+        _render_header(out, self.name, self.doc, 'histogram')
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            out.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        out.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        out.append(f'{self.name}_sum {self.sum}')
+        out.append(f'{self.name}_count {self.count}')
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def new_counter(self, name: str, doc: str) -> Counter:
+        counter = Counter(name, doc)
+        self._metrics.append(counter)
+        return counter
+
+    def new_histogram(self, name: str, doc: str, **kwargs) -> Histogram:
+        histogram = Histogram(name, doc, **kwargs)
+        self._metrics.append(histogram)
+        return histogram
+
+    def render(self, out: typing.List[str]):
+        for metric in self._metrics:
+            metric.render(out)
+
+
+registry = Registry()
+
+queries_compiled = registry.new_counter(
+    'edgedb_server_queries_compiled_total',
+    'Number of compiled query units.')
+
+compiled_query_cache_hits = registry.new_counter(
+    'edgedb_server_compiled_query_cache_hits_total',
+    'Number of queries found in the compiled query cache.')
+
+query_compilation_duration = registry.new_histogram(
+    'edgedb_server_query_compilation_duration_seconds',
+    'Time it takes to compile a query unit.')
+
+query_execution_duration = registry.new_histogram(
+    'edgedb_server_query_execution_duration_seconds',
+    'Time it takes to execute a query and send its result.')
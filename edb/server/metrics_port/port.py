@@ -0,0 +1,145 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from __future__ import annotations
+
+import logging
+
+from edb.common import taskgroup
+
+from edb.server import baseport
+from edb.server import metrics
+
+from . import protocol
+
+
+logger = logging.getLogger('edb.server')
+
+
+class MetricsPort(baseport.Port):
+    """Expose server metrics to Prometheus over HTTP."""
+
+    def __init__(self, nethost: str, netport: int, **kwargs):
+        super().__init__(**kwargs)
+        self._nethost = nethost
+        self._netport = netport
+        self._servers = []
+
+    def render_metrics(self) -> bytes:
+        server = self.get_server()
+        out = []
+
+        metrics.registry.render(out)
+
+        mgmt_ports = [port for port in server.get_ports()
+                      if hasattr(port, 'get_client_connections_count')]
+        metrics.render_gauge(
+            out, 'edgedb_server_client_connections',
+            'Number of open client connections.',
+            [(None, sum(port.get_client_connections_count()
+                        for port in mgmt_ports))])
+
+        pg_pool = server.get_pgcon_pool()
+        metrics.render_gauge(
+            out, 'edgedb_server_backend_connections',
+            'Number of open backend connections.',
+            [(None, pg_pool.current_capacity)])
+        metrics.render_gauge(
+            out, 'edgedb_server_backend_connections_idle',
+            'Number of idle backend connections.',
+            [(None, pg_pool.idle_count)])
+        metrics.render_gauge(
+            out, 'edgedb_server_backend_connections_max',
+            'Maximum number of backend connections.',
+            [(None, pg_pool.max_capacity)])
+        metrics.render_gauge(
+            out, 'edgedb_server_backend_connection_waiters',
+            'Number of requests waiting for a backend connection.',
+            [(None, pg_pool.waiters_count)])
+        metrics.render_gauge(
+            out, 'edgedb_server_backend_prepared_statements',
+            'Number of statements prepared on backend connections.',
+            [(None, sum(con.get_prep_stmts_count()
+                        for con in pg_pool.iter_connections()))])
+
+        metrics.render_gauge(
+            out, 'edgedb_server_compiled_query_cache_size',
+            'Number of queries in the compiled query cache.',
+            [({'database': dbname}, size)
+             for dbname, size in sorted(
+                 self._dbindex.get_compiled_query_cache_sizes().items())])
+
+        compilers = []
+        for port in server.get_ports():
+            stats = port.get_compiler_stats()
+            if stats is not None:
+                compilers.append(
+                    ({'pool': port.get_compiler_worker_name()}, stats))
+
+        for key, name, doc, kind in [
+            ('spawned', 'edgedb_server_compiler_processes_spawned_total',
+             'Number of spawned compiler processes.', 'counter'),
+            ('killed', 'edgedb_server_compiler_processes_killed_total',
+             'Number of terminated compiler processes.', 'counter'),
+            ('workers', 'edgedb_server_compiler_processes',
+             'Number of compiler processes in use.', 'gauge'),
+            ('buffered', 'edgedb_server_compiler_processes_buffered',
+             'Number of pre-spawned compiler processes.', 'gauge'),
+            ('calls', 'edgedb_server_compiler_calls',
+             'Number of compiler calls in flight.', 'gauge'),
+            ('waiters', 'edgedb_server_compiler_call_waiters',
+             'Number of compiler calls waiting for a worker.', 'gauge'),
+        ]:
+            metrics.render_gauge(
+                out, name, doc,
+                [(labels, stats[key]) for labels, stats in compilers
+                 if key in stats],
+                kind=kind)
+
+        out.append('')
+        return '\n'.join(out).encode()
+
+    async def start(self):
+        # Unlike other ports, this one does not compile queries,
+        # so it does not start a compiler pool.
+        if self._serving:
+            raise RuntimeError('already serving')
+        self._serving = True
+
+        nethost = await self._fix_localhost(self._nethost, self._netport)
+        srv = await self._loop.create_server(
+            lambda: protocol.Protocol(self._loop, self),
+            host=nethost, port=self._netport)
+        self._servers.append(srv)
+
+        if len(nethost) > 1:
+            host_str = f"{{{', '.join(nethost)}}}"
+        else:
+            host_str = next(iter(nethost))
+        logger.info('Serving metrics on %s:%s', host_str, self._netport)
+
+    async def stop(self):
+        try:
+            async with taskgroup.TaskGroup() as g:
+                for srv in self._servers:
+                    srv.close()
+                    g.create_task(srv.wait_closed())
+                self._servers.clear()
+        finally:
+            await super().stop()
@@ -72,10 +72,15 @@ cdef class EdgeConnection:
 
         object _msg_take_waiter
         object _startup_msg_waiter
+        object _write_waiter
 
         object _main_task
 
         object _last_anon_compiled
+        object _last_anon_extracted
+        bint _last_anon_parsed
+        dict _prepared_stmts
+        dict _cursors
         WriteBuffer _write_buf
 
         bint debug
@@ -87,6 +92,7 @@ cdef class EdgeConnection:
 
     cdef write(self, WriteBuffer buf)
     cdef flush(self)
+    cdef bint is_writing_paused(self)
     cdef abort(self)
     cdef close(self)
 
@@ -94,7 +100,7 @@ cdef class EdgeConnection:
 
     cdef pgcon_last_sync_status(self)
 
-    cdef WriteBuffer recode_bind_args(self, bytes bind_args)
+    cdef WriteBuffer recode_bind_args(self, bytes bind_args, extracted_args)
 
     cdef WriteBuffer make_describe_msg(self, query_unit)
     cdef WriteBuffer make_command_complete_msg(self, query_unit)
@@ -103,3 +109,12 @@ cdef class EdgeConnection:
     cdef dict parse_headers(self)
 
     cdef write_log(self, EdgeSeverity severity, uint32_t code, str message)
+
+    cdef _before_execute(self, query_unit)
+    cdef _normalize(self, bytes eql)
+    cdef _lookup_compiled_query(self, bytes eql, source,
+                                bint json_mode, bint expect_one)
+    cdef _get_extracted_args(self, query_unit, source)
+    cdef _get_prepared(self, bytes stmt_name)
+    cdef _check_cursor(self, query_unit)
+    cdef WriteBuffer make_portal_suspended_msg(self)
@@ -20,6 +20,7 @@ import asyncio
 import hashlib
 import json
 import logging
+import time
 import traceback
 
 cimport cython
@@ -46,9 +47,11 @@ from edb.server.pgproto.pgproto cimport (
 from edb.server.dbview cimport dbview
 
 from edb.server import config
+from edb.server import defines
 
 from edb.server import compiler
 from edb.server.compiler import errormech
+from edb.server.compiler import normalization
 from edb.server.pgcon cimport pgcon
 from edb.server.pgcon import errors as pgerror
 
@@ -62,6 +65,12 @@ from edgedb import scram
 
 
 DEF FLUSH_BUFFER_AFTER = 100_000
+
+# Execute message headers.
+DEF HEADER_ROW_LIMIT = 0xFF01
+DEF HEADER_RESUME_CURSOR = 0xFF02
+
+cdef bytes CURSOR_PORTAL_PREFIX = b'__edgedb_cursor_'
 cdef bytes ZERO_UUID = b'\x00' * 16
 cdef bytes EMPTY_TUPLE_UUID = s_obj.get_known_type_id('empty-tuple').bytes
 
@@ -95,8 +104,16 @@ cdef class EdgeConnection:
 
         self._main_task = None
         self._msg_take_waiter = None
+        self._write_waiter = None
 
         self._last_anon_compiled = None
+        self._last_anon_extracted = None
+        self._last_anon_parsed = False
+        # stmt_name ->
+        #     (eql, json_mode, expect_one, query_unit, extracted_args)
+        self._prepared_stmts = {}
+        # stmt_name -> (query_unit, txid) of a suspended cursor
+        self._cursors = {}
 
         self._write_buf = None
 
@@ -151,6 +168,14 @@ cdef class EdgeConnection:
             self._write_buf = None
             self._transport.write(buf)
 
+    cdef bint is_writing_paused(self):
+        return self._write_waiter is not None
+
+    async def wait_for_writable(self):
+        # Waits until the client has drained the transport buffer.
+        if self._write_waiter is not None:
+            await asyncio.shield(self._write_waiter)
+
     async def wait_for_message(self):
         if self.buffer.take_message():
             return
@@ -190,7 +215,7 @@ cdef class EdgeConnection:
             self.dbview = <dbview.DatabaseConnectionView>dbv
 
             self.backend = await self.port.new_backend(
-                dbname=database, dbver=self.dbview.dbver)
+                dbname=database, con_id=self._id)
 
             # The user has already been authenticated by other means
             # (such as the ability to write to a protected socket).
@@ -220,7 +245,8 @@ cdef class EdgeConnection:
             buf.write_buffer(msg_buf)
 
             msg_buf = WriteBuffer.new_message(b'K')
-            msg_buf.write_int32(0)  # TODO: should send ID of this connection
+            # The key can be used to cancel queries of this connection.
+            msg_buf.write_bytes(self.backend.cancel_key)
             msg_buf.end_message()
             buf.write_buffer(msg_buf)
 
@@ -228,7 +254,7 @@ cdef class EdgeConnection:
                 msg_buf = WriteBuffer.new_message(b'S')
                 msg_buf.write_len_prefixed_bytes(b'pgaddr')
                 msg_buf.write_len_prefixed_utf8(
-                    str(self.backend.pgcon.get_pgaddr()))
+                    str(self.port.get_server().get_pgaddr()))
                 msg_buf.end_message()
                 buf.write_buffer(msg_buf)
 
@@ -241,6 +267,13 @@ cdef class EdgeConnection:
             self.write(buf)
             self.flush()
 
+        elif mtype == b'K':
+            # CancelRequest
+            cancel_key = self.buffer.read_bytes(32)
+            self.buffer.finish_message()
+            await self.port.cancel_query(cancel_key)
+            self.close()
+
         else:
             self.fallthrough(False)
 
@@ -279,10 +312,14 @@ cdef class EdgeConnection:
     async def _get_role_record(self, user):
         role_query = self.port.get_server().get_sys_query('role')
 
-        json_data = await self.backend.pgcon.parse_execute_json(
-            role_query, b'__sys_role',
-            dbver=0, use_prep_stmt=True, args=(user,),
-        )
+        await self._acquire_pgcon()
+        try:
+            json_data = await self.backend.pgcon.parse_execute_json(
+                role_query, b'__sys_role',
+                dbver=0, use_prep_stmt=True, args=(user,),
+            )
+        finally:
+            await self._release_pgcon()
 
         if json_data is not None:
             return json.loads(json_data.decode('utf-8'))
@@ -501,6 +538,31 @@ cdef class EdgeConnection:
 
     #############
 
+    async def _acquire_pgcon(self):
+        if self.backend.pgcon is None:
+            await self.backend.acquire_pgcon(
+                self.dbview.get_session_state_sql())
+
+    async def _release_pgcon(self):
+        # The anonymous statement only exists on the connection
+        # it was parsed on.
+        self._last_anon_parsed = False
+        await self.backend.release_pgcon()
+
+    async def _maybe_release_pgcon(self):
+        if (self.backend is not None and
+                self.backend.pgcon is not None and
+                self.backend.pgcon.is_idle()):
+            await self._release_pgcon()
+
+    cdef _before_execute(self, query_unit):
+        if query_unit.has_set:
+            self.backend.mark_pgcon_dirty()
+        if query_unit.drop_db is not None:
+            self.port.get_server().prune_idle_pgcons(query_unit.drop_db)
+
+    #############
+
     async def _compile(self, bytes eql, bint json_mode, bint expect_one,
                        str stmt_mode):
 
@@ -508,16 +570,19 @@ cdef class EdgeConnection:
             self.dbview.raise_in_tx_error()
 
         if self.dbview.in_tx():
-            return await self.backend.compiler.call(
+            units = await self.backend.compiler.call_pinned(
                 'compile_eql_in_tx',
+                self._id,
                 self.dbview.txid,
                 eql,
                 json_mode,
                 expect_one,
                 stmt_mode)
         else:
-            return await self.backend.compiler.call(
+            units = await self.backend.compiler.call_and_pin(
                 'compile_eql',
+                self._id,
+                self.dbview.dbname,
                 self.dbview.dbver,
                 eql,
                 self.dbview.modaliases,
@@ -527,6 +592,9 @@ cdef class EdgeConnection:
                 stmt_mode,
                 CAP_ALL)
 
+        self.dbview.record_compile(eql, units)
+        return units
+
     async def _compile_rollback(self, bytes eql):
         assert self.dbview.in_tx_error()
         try:
@@ -588,6 +656,7 @@ cdef class EdgeConnection:
 
         for query_unit in units:
             self.dbview.start(query_unit)
+            self._before_execute(query_unit)
             try:
                 if query_unit.system_config:
                     await self._execute_system_config(query_unit)
@@ -617,12 +686,14 @@ cdef class EdgeConnection:
         self.write(packet)
         self.flush()
 
-    async def _parse(self, bytes eql, bint json_mode, bint expect_one):
+    async def _parse(self, bytes eql, bint json_mode, bint expect_one,
+                     bytes stmt_name=b''):
         if self.debug:
-            self.debug_print('PARSE', eql)
+            self.debug_print('PARSE', stmt_name, eql)
 
-        query_unit = self.dbview.lookup_compiled_query(
-            eql, json_mode, expect_one)
+        source = self._normalize(eql)
+        query_unit = self._lookup_compiled_query(
+            eql, source, json_mode, expect_one)
         cached = True
         if query_unit is None:
             # Cache miss; need to compile this query.
@@ -638,8 +709,11 @@ cdef class EdgeConnection:
                     # ROLLBACK in that 'eql' string.
                     self.dbview.raise_in_tx_error()
             else:
-                query_unit = await self._compile(
-                    eql, json_mode, expect_one, 'single')
+                query_unit = await self.dbview.compile_single_flight(
+                    source.key if source is not None else eql,
+                    json_mode, expect_one,
+                    lambda: self._compile(
+                        eql, json_mode, expect_one, 'single'))
                 query_unit = query_unit[0]
         elif self.dbview.in_tx_error():
             # We have a cached QueryUnit for this 'eql', but the current
@@ -649,23 +723,105 @@ cdef class EdgeConnection:
             if not (query_unit.tx_rollback or query_unit.tx_savepoint_rollback):
                 self.dbview.raise_in_tx_error()
 
-        await self.backend.pgcon.parse_execute(
-            1,           # =parse
-            0,           # =execute
-            query_unit,  # =query
-            self,        # =edgecon
-            None,        # =bind_data
-            0,           # =send_sync
-            0,           # =use_prep_stmt
-        )
+        extracted_args = self._get_extracted_args(query_unit, source)
 
         if not cached and query_unit.cacheable:
+            if extracted_args is not None:
+                # Shared by all queries that differ only in literals.
+                key = source.normalized.key
+            elif source is not None:
+                # Shared by all queries that differ only in formatting.
+                key = source.key
+            else:
+                key = eql
             self.dbview.cache_compiled_query(
-                eql, json_mode, expect_one, query_unit)
+                key, json_mode, expect_one, query_unit)
+
+        if stmt_name:
+            # Named statements are prepared on the backend connection
+            # by their first Execute, see _execute_prepared().
+            self._prepared_stmts[stmt_name] = (
+                eql, json_mode, expect_one, query_unit, extracted_args)
+        else:
+            # The statement is parsed on the backend connection by
+            # the Execute that follows: the connection is returned to
+            # the pool on Sync and might be another one by then.
+            self._last_anon_compiled = query_unit
+            self._last_anon_extracted = extracted_args
+            self._last_anon_parsed = False
+        return query_unit
+
+    cdef _normalize(self, bytes eql):
+        try:
+            return normalization.lex_source(eql.decode())
+        except UnicodeDecodeError:
+            # The compiler reports the error.
+            return None
 
-        self._last_anon_compiled = query_unit
+    cdef _lookup_compiled_query(self, bytes eql, source,
+                                bint json_mode, bint expect_one):
+        if source is None:
+            # Queries that cannot be lexed are cached by their text.
+            return self.dbview.lookup_compiled_query(
+                eql, json_mode, expect_one)
+
+        query_unit = None
+        if source.normalized is not None:
+            query_unit = self.dbview.lookup_compiled_query(
+                source.normalized.key, json_mode, expect_one, eql)
+        if query_unit is None:
+            # Queries whose literals could not be extracted are
+            # cached by the fingerprint of their tokens.
+            query_unit = self.dbview.lookup_compiled_query(
+                source.key, json_mode, expect_one, eql)
         return query_unit
 
+    cdef _get_extracted_args(self, query_unit, source):
+        # Return the literals to bind to the hidden parameters
+        # of *query_unit*, in the order of the parameters.
+        if query_unit.extracted_args is None:
+            return None
+        if source is None or source.normalized is None:
+            raise errors.QueryError(
+                f'parameter names starting with '
+                f'{normalization.PARAM_PREFIX!r} are reserved')
+        values = source.normalized.values
+        return [values[i] for i in query_unit.extracted_args]
+
+    cdef _get_prepared(self, bytes stmt_name):
+        try:
+            return self._prepared_stmts[stmt_name]
+        except KeyError:
+            raise errors.TypeSpecNotFoundError(
+                f'prepared statement {stmt_name.decode()!r} '
+                f'does not exist') from None
+
+    async def _execute_prepared(self, bytes stmt_name, bytes bind_args,
+                                bytes portal=b'', int32_t row_limit=0):
+        eql, json_mode, expect_one, query_unit, extracted_args = \
+            self._get_prepared(stmt_name)
+
+        if query_unit.dbver != self.dbview.dbver:
+            # The schema has changed since the statement was parsed.
+            new_unit = await self._parse(
+                eql, json_mode, expect_one, stmt_name)
+            if (new_unit.in_type_id != query_unit.in_type_id or
+                    new_unit.out_type_id != query_unit.out_type_id):
+                del self._prepared_stmts[stmt_name]
+                raise errors.TypeSpecNotFoundError(
+                    f'the type of prepared statement '
+                    f'{stmt_name.decode()!r} has changed; '
+                    f'the statement must be parsed again')
+            query_unit = new_unit
+            extracted_args = self._get_prepared(stmt_name)[4]
+
+        # Single-statement units are executed as named Postgres
+        # prepared statements, which backend connections keep
+        # across sessions.
+        return await self._execute(
+            query_unit, bind_args, True, bool(query_unit.sql_hash),
+            portal, row_limit, extracted_args)
+
     cdef parse_cardinality(self, bytes card):
         if card == b'm':
             return CARD_MANY
@@ -726,8 +882,6 @@ cdef class EdgeConnection:
             bint json_mode
             bytes eql
 
-        self._last_anon_compiled = None
-
         self.reject_headers()
 
         json_mode = self.parse_json_mode(self.buffer.read_byte())
@@ -736,15 +890,22 @@ cdef class EdgeConnection:
         )
 
         stmt_name = self.buffer.read_len_prefixed_bytes()
-        if stmt_name:
-            raise errors.UnsupportedFeatureError(
-                'prepared statements are not yet supported')
+        if not stmt_name:
+            self._last_anon_compiled = None
+            self._last_anon_extracted = None
+            self._last_anon_parsed = False
+        elif (stmt_name not in self._prepared_stmts and
+                len(self._prepared_stmts) >= defines.MAX_PREPARED_STATEMENTS):
+            raise errors.BinaryProtocolError(
+                f'too many prepared statements: at most '
+                f'{defines.MAX_PREPARED_STATEMENTS} are allowed per '
+                f'connection, close the unused ones')
 
         eql = self.buffer.read_len_prefixed_bytes()
         if not eql:
             raise errors.BinaryProtocolError('empty query')
 
-        query_unit = await self._parse(eql, json_mode, expect_one)
+        query_unit = await self._parse(eql, json_mode, expect_one, stmt_name)
 
         buf = WriteBuffer.new_message(b'1')  # ParseComplete
         buf.write_int16(0)  # no headers
@@ -777,6 +938,14 @@ cdef class EdgeConnection:
         msg.end_message()
         return msg
 
+    cdef WriteBuffer make_portal_suspended_msg(self):
+        cdef:
+            WriteBuffer msg
+
+        msg = WriteBuffer.new_message(b's')
+        msg.write_int16(0)  # no headers
+        return msg.end_message()
+
     cdef WriteBuffer make_command_complete_msg(self, query_unit):
         cdef:
             WriteBuffer msg
@@ -799,8 +968,9 @@ cdef class EdgeConnection:
             stmt_name = self.buffer.read_len_prefixed_bytes()
 
             if stmt_name:
-                raise errors.UnsupportedFeatureError(
-                    'prepared statements are not yet supported')
+                query_unit = self._get_prepared(stmt_name)[3]
+                msg = self.make_describe_msg(query_unit)
+                self.write(msg)
             else:
                 if self._last_anon_compiled is None:
                     raise errors.TypeSpecNotFoundError(
@@ -813,6 +983,36 @@ cdef class EdgeConnection:
             raise errors.BinaryProtocolError(
                 f'unsupported "describe" message mode {chr(rtype)!r}')
 
+    async def close_statement(self):
+        cdef:
+            char aspect
+
+        self.reject_headers()
+
+        aspect = self.buffer.read_byte()
+        if aspect != b'S':
+            raise errors.BinaryProtocolError(
+                f'unsupported "close" message aspect {chr(aspect)!r}')
+
+        stmt_name = self.buffer.read_len_prefixed_bytes()
+        self.buffer.finish_message()
+        if not stmt_name:
+            raise errors.BinaryProtocolError(
+                'the anonymous statement cannot be closed')
+
+        if self.debug:
+            self.debug_print('CLOSE', stmt_name)
+
+        # Closing a statement that does not exist is not an error.
+        self._prepared_stmts.pop(stmt_name, None)
+        # The backend portal of the cursor, if any, is closed at the
+        # end of the transaction.
+        self._cursors.pop(stmt_name, None)
+
+        msg = WriteBuffer.new_message(b'3')  # CloseComplete
+        msg.write_int16(0)  # no headers
+        self.write(msg.end_message())
+
     async def _execute_system_config(self, query_unit):
         data = await self.backend.pgcon.simple_query(
             b';'.join(query_unit.sql), ignore_data=False)
@@ -836,7 +1036,13 @@ cdef class EdgeConnection:
                 'change to take effect')
 
     async def _execute(self, query_unit, bind_args,
-                       bint parse, bint use_prep_stmt):
+                       bint parse, bint use_prep_stmt,
+                       bytes portal=b'', int32_t row_limit=0,
+                       extracted_args=None):
+        # Returns True if the query was executed in a cursor
+        # that got suspended after *row_limit* rows.
+        suspended = False
+
         if self.dbview.in_tx_error():
             if not (query_unit.tx_savepoint_rollback or query_unit.tx_rollback):
                 self.dbview.raise_in_tx_error()
@@ -853,7 +1059,11 @@ cdef class EdgeConnection:
             self.write(self.make_command_complete_msg(query_unit))
             return
 
-        bound_args_buf = self.recode_bind_args(bind_args)
+        if bind_args is None:
+            # Continuing a suspended cursor.
+            bound_args_buf = None
+        else:
+            bound_args_buf = self.recode_bind_args(bind_args, extracted_args)
 
         process_sync = False
         if self.buffer.take_message_type(b'S'):
@@ -863,11 +1073,13 @@ cdef class EdgeConnection:
 
         try:
             self.dbview.start(query_unit)
+            self._before_execute(query_unit)
             try:
                 if query_unit.system_config:
                     await self._execute_system_config(query_unit)
                 else:
-                    await self.backend.pgcon.parse_execute(
+                    started = time.monotonic()
+                    suspended = await self.backend.pgcon.parse_execute(
                         parse,              # =parse
                         1,                  # =execute
                         query_unit,         # =query
@@ -875,7 +1087,15 @@ cdef class EdgeConnection:
                         bound_args_buf,     # =bind_data
                         process_sync,       # =send_sync
                         use_prep_stmt,      # =use_prep_stmt
+                        portal,             # =portal
+                        row_limit,          # =row_limit
                     )
+                    if query_unit.sql_hash:
+                        self.dbview.record_execute(
+                            query_unit,
+                            time.monotonic() - started,
+                            self.backend.pgcon.last_result_rows,
+                            self.backend.pgcon.last_result_bytes)
                     if query_unit.config_ops is not None:
                         await self.dbview.apply_config_ops(
                             query_unit.config_ops)
@@ -903,7 +1123,10 @@ cdef class EdgeConnection:
             else:
                 self.dbview.on_success(query_unit)
 
-            self.write(self.make_command_complete_msg(query_unit))
+            if suspended:
+                self.write(self.make_portal_suspended_msg())
+            else:
+                self.write(self.make_command_complete_msg(query_unit))
 
             if process_sync:
                 self.write(self.pgcon_last_sync_status())
@@ -916,31 +1139,92 @@ cdef class EdgeConnection:
             if process_sync:
                 self.buffer.finish_message()
 
+        return bool(suspended)
+
+    cdef _check_cursor(self, query_unit):
+        if not self.dbview.in_tx():
+            raise errors.BinaryProtocolError(
+                'cursors can only be used within a transaction')
+        if (query_unit.cardinality is CARD_NA or
+                query_unit.system_config or len(query_unit.sql) != 1):
+            raise errors.UnsupportedFeatureError(
+                'this command cannot be executed in a cursor')
+
     async def execute(self):
         cdef:
             WriteBuffer bound_args_buf
             bint process_sync
+            int32_t row_limit = 0
+            bint resume = False
+            bytes portal = b''
 
-        self.reject_headers()
+        headers = self.parse_headers()
         stmt_name = self.buffer.read_len_prefixed_bytes()
         bind_args = self.buffer.read_len_prefixed_bytes()
         self.buffer.finish_message()
         query_unit = None
 
+        for key, value in headers.items():
+            if key == HEADER_ROW_LIMIT:
+                if len(value) != 4:
+                    raise errors.BinaryProtocolError(
+                        'invalid ROW_LIMIT header value')
+                row_limit = int.from_bytes(value, 'big', signed=True)
+                if row_limit <= 0:
+                    raise errors.BinaryProtocolError(
+                        'ROW_LIMIT is expected to be greater than 0')
+            elif key == HEADER_RESUME_CURSOR:
+                resume = True
+            else:
+                raise errors.BinaryProtocolError('unexpected headers')
+
         if self.debug:
-            self.debug_print('EXECUTE')
+            self.debug_print('EXECUTE', stmt_name, row_limit, resume)
+
+        if row_limit:
+            portal = CURSOR_PORTAL_PREFIX + stmt_name
+            cursor = self._cursors.pop(stmt_name, None)
+        elif resume:
+            raise errors.BinaryProtocolError(
+                'RESUME_CURSOR requires the ROW_LIMIT header')
+
+        if resume:
+            # Portals are closed at the end of the transaction and
+            # by a rollback to an earlier savepoint.
+            if (cursor is None or not self.dbview.in_tx() or
+                    cursor[1] != self.dbview.txid):
+                raise errors.BinaryProtocolError(
+                    'no suspended cursor found for the statement')
+            query_unit = cursor[0]
+            suspended = await self._execute(
+                query_unit, None, False, False, portal, row_limit)
+
+        elif stmt_name:
+            if row_limit:
+                self._check_cursor(self._get_prepared(stmt_name)[3])
+            suspended = await self._execute_prepared(
+                stmt_name, bind_args, portal, row_limit)
 
-        if stmt_name:
-            raise errors.UnsupportedFeatureError(
-                'prepared statements are not yet supported')
         else:
             if self._last_anon_compiled is None:
                 raise errors.BinaryProtocolError(
                     'no prepared anonymous statement found')
 
             query_unit = self._last_anon_compiled
+            if row_limit:
+                self._check_cursor(query_unit)
+
+            # The statement is parsed once per backend connection;
+            # see _release_pgcon().
+            suspended = await self._execute(
+                query_unit, bind_args, not self._last_anon_parsed, False,
+                portal, row_limit, self._last_anon_extracted)
+            self._last_anon_parsed = True
 
-        await self._execute(query_unit, bind_args, False, False)
+        if suspended:
+            if query_unit is None:
+                query_unit = self._get_prepared(stmt_name)[3]
+            self._cursors[stmt_name] = (query_unit, self.dbview.txid)
 
     async def opportunistic_execute(self):
         cdef:
@@ -964,13 +1248,17 @@ cdef class EdgeConnection:
         if not query:
             raise errors.BinaryProtocolError('empty query')
 
-        query_unit = self.dbview.lookup_compiled_query(
-            query, json_mode, expect_one)
+        source = self._normalize(query)
+        query_unit = self._lookup_compiled_query(
+            query, source, json_mode, expect_one)
         if query_unit is None:
             if self.debug:
                 self.debug_print('OPPORTUNISTIC EXECUTE /REPARSE', query)
 
             query_unit = await self._parse(query, json_mode, expect_one)
+            extracted_args = self._last_anon_extracted
+        else:
+            extracted_args = self._get_extracted_args(query_unit, source)
 
         if (query_unit.in_type_id != in_tid or
                 query_unit.out_type_id != out_tid):
@@ -985,15 +1273,17 @@ cdef class EdgeConnection:
             self.debug_print('OPPORTUNISTIC EXECUTE', query)
 
         await self._execute(
-            query_unit, bind_args, True, bool(query_unit.sql_hash))
+            query_unit, bind_args, True, bool(query_unit.sql_hash),
+            extracted_args=extracted_args)
 
     async def sync(self):
         self.buffer.consume_message()
 
-        await self.backend.pgcon.sync()
+        if self.backend.pgcon is not None:
+            await self.backend.pgcon.sync()
         self.write(self.pgcon_last_sync_status())
 
-        if self.debug:
+        if self.debug and self.backend.pgcon is not None:
             self.debug_print(
                 'SYNC', (<pgcon.PGProto>(self.backend.pgcon)).xact_status)
 
@@ -1029,6 +1319,10 @@ cdef class EdgeConnection:
 
             return
 
+        if self._transport is None:
+            # The connection was only used to send a cancel request.
+            return
+
         try:
             while True:
                 if not self.buffer.take_message():
@@ -1045,15 +1339,21 @@ cdef class EdgeConnection:
                         await self.describe()
 
                     elif mtype == b'E':
+                        await self._acquire_pgcon()
                         await self.execute()
 
                     elif mtype == b'O':
+                        await self._acquire_pgcon()
                         await self.opportunistic_execute()
 
                     elif mtype == b'Q':
                         flush_sync_on_error = True
+                        await self._acquire_pgcon()
                         await self.simple_query()
 
+                    elif mtype == b'C':
+                        await self.close_statement()
+
                     elif mtype == b'S':
                         await self.sync()
 
@@ -1096,6 +1396,8 @@ cdef class EdgeConnection:
                 else:
                     self.buffer.finish_message()
 
+                await self._maybe_release_pgcon()
+
         except asyncio.CancelledError:
             # Happens when the connection is aborted, the backend is
             # being closed and propagates CancelledError to all
@@ -1125,6 +1427,9 @@ cdef class EdgeConnection:
 
             self.abort()
 
+        finally:
+            self.dbview.close()
+
     async def recover_from_error(self):
         # Consume all messages until sync.
 
@@ -1213,13 +1518,15 @@ cdef class EdgeConnection:
 
     async def _interpret_backend_error(self, exc):
         if self.dbview.in_tx():
-            return await self.backend.compiler.call(
+            return await self.backend.compiler.call_pinned(
                 'interpret_backend_error_in_tx',
+                self._id,
                 self.dbview.txid,
                 exc.fields)
         else:
             return await self.backend.compiler.call(
                 'interpret_backend_error',
+                self.dbview.dbname,
                 self.dbview.dbver,
                 exc.fields)
 
@@ -1246,8 +1553,13 @@ cdef class EdgeConnection:
             pgcon.PGTransactionStatus xact_status
             WriteBuffer buf
 
-        xact_status = <pgcon.PGTransactionStatus>(
-            (<pgcon.PGProto>self.backend.pgcon).xact_status)
+        if self.backend.pgcon is None:
+            # Not holding a backend connection means that we
+            # are not in a transaction.
+            xact_status = pgcon.PQTRANS_IDLE
+        else:
+            xact_status = <pgcon.PGTransactionStatus>(
+                (<pgcon.PGProto>self.backend.pgcon).xact_status)
 
         buf = WriteBuffer.new_message(b'Z')
         buf.write_int16(0)  # no headers
@@ -1278,11 +1590,13 @@ cdef class EdgeConnection:
             raise errors.BinaryProtocolError(
                 f'unexpected message type {chr(mtype)!r}')
 
-    cdef WriteBuffer recode_bind_args(self, bytes bind_args):
+    cdef WriteBuffer recode_bind_args(self, bytes bind_args, extracted_args):
         cdef:
             FRBuffer in_buf
             WriteBuffer out_buf = WriteBuffer.new()
             int32_t argsnum
+            int32_t nextracted
+            int32_t i
             ssize_t in_len
 
         assert cpython.PyBytes_CheckExact(bind_args)
@@ -1291,17 +1605,32 @@ cdef class EdgeConnection:
             cpython.PyBytes_AS_STRING(bind_args),
             cpython.Py_SIZE(bind_args))
 
-        # all parameters are in binary
-        out_buf.write_int32(0x00010001)
-
         # number of elements in the tuple
         argsnum = hton.unpack_int32(frb_read(&in_buf, 4))
 
-        out_buf.write_int16(<int16_t>argsnum)
+        if extracted_args is None:
+            # all parameters are in binary
+            out_buf.write_int32(0x00010001)
+            out_buf.write_int16(<int16_t>argsnum)
+        else:
+            # Client arguments are in binary, extracted literals
+            # follow them in text.
+            nextracted = len(extracted_args)
+            out_buf.write_int16(<int16_t>(argsnum + nextracted))
+            for i in range(argsnum):
+                out_buf.write_int16(1)
+            for i in range(nextracted):
+                out_buf.write_int16(0)
+            out_buf.write_int16(<int16_t>(argsnum + nextracted))
 
         in_len = frb_get_len(&in_buf)
         out_buf.write_cstr(frb_read_all(&in_buf), in_len)
 
+        if extracted_args is not None:
+            for value in extracted_args:
+                out_buf.write_int32(<int32_t>len(value))
+                out_buf.write_bytes(value)
+
         # All columns are in binary format
         out_buf.write_int32(0x00010001)
         return out_buf
@@ -1319,13 +1648,22 @@ cdef class EdgeConnection:
             self._msg_take_waiter.set_exception(ConnectionAbortedError())
             self._msg_take_waiter = None
 
+        if self._write_waiter is not None:
+            if not self._write_waiter.done():
+                self._write_waiter.set_exception(ConnectionAbortedError())
+            self._write_waiter = None
+
         self.abort()
 
     def pause_writing(self):
-        pass
+        if self._write_waiter is None:
+            self._write_waiter = self.loop.create_future()
 
     def resume_writing(self):
-        pass
+        if self._write_waiter is not None:
+            if not self._write_waiter.done():
+                self._write_waiter.set_result(True)
+            self._write_waiter = None
 
     def data_received(self, data):
         self.buffer.feed_data(data)
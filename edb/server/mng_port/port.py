@@ -22,12 +22,15 @@ from __future__ import annotations
 import logging
 import os
 import os.path
+import secrets
 import stat
 import weakref
 
+from edb import errors
 from edb.common import taskgroup
 from edb.server import baseport
 from edb.server import compiler
+from edb.server import defines
 
 from . import edgecon
 
@@ -35,11 +38,85 @@ from . import edgecon
 logger = logging.getLogger('edb.server')
 
 
-class Backend:
+class CompilerConnection:
+    """Routes compiler calls of one client connection to the shared pool.
 
-    def __init__(self, pgcon, compiler):
-        self._pgcon = pgcon
+    Compiler workers are shared by all connections of the port.  The
+    only per-connection state that is kept inside a worker is the state
+    of an explicit transaction, so while the connection is in
+    a transaction its calls are sent to the worker that compiled the
+    most recent "compile_eql" request.
+
+    Workers keep the states until the connection is closed: a state is
+    left behind when a transaction ends without its worker compiling
+    the end of it (e.g. a failed transaction that is rolled back).
+    """
+
+    def __init__(self, pool, con_id):
+        self._pool = pool
+        self._con_id = con_id
+        self._worker = None
+        # Workers that might hold a state of this connection.
+        self._state_workers = set()
+
+    @property
+    def con_id(self):
+        return self._con_id
+
+    async def call(self, method_name, *args):
+        return await self._pool.call(method_name, *args)
+
+    async def call_and_pin(self, method_name, *args):
+        worker = await self._pool.acquire()
+        try:
+            self._worker = worker
+            self._state_workers.add(worker)
+            return await worker.call(method_name, *args)
+        finally:
+            self._pool.release(worker)
+
+    async def call_pinned(self, method_name, *args):
+        if self._worker is None:
+            raise errors.InternalServerError(
+                'no compiler worker holds the state of this connection')
+        return await self._pool.call(method_name, *args, worker=self._worker)
+
+    async def close(self):
+        workers = self._state_workers
+        self._worker = None
+        self._state_workers = set()
+        for worker in workers:
+            try:
+                await self._pool.call(
+                    'drop_connection_state', self._con_id, worker=worker)
+            except Exception:
+                # The worker might have been restarted or the pool is
+                # shutting down; either way the state is gone.
+                logger.debug('could not drop compiler state of '
+                             'connection %s', self._con_id, exc_info=True)
+
+
+class Backend:
+    """Backend resources of a client connection.
+
+    The Postgres connection is borrowed from the server-wide pool
+    for the duration of a transaction (or an implicit single-statement
+    transaction) and returned to the pool as soon as it is idle.
+    """
+
+    def __init__(self, server, dbname, compiler):
+        self._server = server
+        self._dbname = dbname
+        self._pgcon = None
+        # True if the session state of the borrowed connection
+        # might differ from the state of a freshly reset connection.
+        self._pgcon_dirty = False
+        # True if a cancel request has been sent for the borrowed
+        # connection.
+        self._pgcon_cancelled = False
         self._compiler = compiler
+        # The secret clients use to cancel queries of this connection.
+        self.cancel_key = secrets.token_bytes(32)
 
     @property
     def pgcon(self):
@@ -49,9 +126,65 @@ class Backend:
     def compiler(self):
         return self._compiler
 
+    async def acquire_pgcon(self, session_state_sql=None):
+        if self._pgcon is not None:
+            return self._pgcon
+
+        pgcon = await self._server.acquire_pgcon(self._dbname)
+        if session_state_sql:
+            try:
+                await pgcon.simple_query(session_state_sql, ignore_data=True)
+            except Exception:
+                self._server.release_pgcon(self._dbname, pgcon, discard=True)
+                raise
+            self._pgcon_dirty = True
+
+        self._pgcon = pgcon
+        return pgcon
+
+    def mark_pgcon_dirty(self):
+        self._pgcon_dirty = True
+
+    async def release_pgcon(self):
+        pgcon = self._pgcon
+        if pgcon is None:
+            return
+        self._pgcon = None
+
+        # A cancel request might reach Postgres after the query it
+        # was meant for has completed and interrupt the next one,
+        # so a cancelled connection is never reused.
+        discard = not pgcon.is_idle() or self._pgcon_cancelled
+        if not discard and self._pgcon_dirty:
+            try:
+                await pgcon.reset_session()
+            except Exception:
+                discard = True
+        self._pgcon_dirty = False
+        self._pgcon_cancelled = False
+
+        self._server.release_pgcon(self._dbname, pgcon, discard=discard)
+
+    async def cancel(self):
+        """Cancel the query running on the borrowed connection, if any."""
+        pgcon = self._pgcon
+        if pgcon is None or not pgcon.is_running_query():
+            return
+
+        self._pgcon_cancelled = True
+        try:
+            await pgcon.cancel()
+        except Exception:
+            logger.warning('could not send a cancel request to Postgres',
+                           exc_info=True)
+
     async def close(self):
-        self._pgcon.terminate()
-        await self._compiler.close()
+        try:
+            # Do not let an abandoned query run to completion.
+            await self.cancel()
+            await self.release_pgcon()
+        finally:
+            await self._compiler.close()
 
 
 class ManagementPort(baseport.Port):
@@ -66,6 +199,7 @@ class ManagementPort(baseport.Port):
 
         self._servers = []
         self._backends = weakref.WeakSet()
+        self._cancel_keys = weakref.WeakValueDictionary()
 
     def new_view(self, *, dbname, user, query_cache):
         return self._dbindex.new_view(
@@ -77,20 +211,29 @@ class ManagementPort(baseport.Port):
     def get_compiler_worker_name(self):
         return 'compiler-mng'
 
-    async def new_backend(self, *, dbname: str, dbver: int):
-        server = self.get_server()
+    def get_compiler_pool_size(self):
+        return max(os.cpu_count() or 1, defines.MIN_COMPILER_POOL_SIZE)
 
-        async with taskgroup.TaskGroup() as g:
-            new_pgcon_task = g.create_task(server.new_pgcon(dbname))
-            compiler_task = g.create_task(self.new_compiler(dbname, dbver))
+    async def new_backend(self, *, dbname: str, con_id: str):
+        server = self.get_server()
 
         backend = Backend(
-            new_pgcon_task.result(),
-            compiler_task.result())
+            server,
+            dbname,
+            CompilerConnection(self.get_compiler_pool(), con_id))
 
         self._backends.add(backend)
+        self._cancel_keys[backend.cancel_key] = backend
         return backend
 
+    async def cancel_query(self, cancel_key: bytes):
+        backend = self._cancel_keys.get(cancel_key)
+        if backend is not None:
+            await backend.cancel()
+
+    def get_client_connections_count(self):
+        return len(self._backends)
+
     def new_edgecon_id(self):
         self._edgecon_id += 1
         return str(self._edgecon_id)
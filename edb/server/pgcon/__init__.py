@@ -20,5 +20,6 @@
 from __future__ import annotations
 
 from .pgcon import connect
+from .pool import Pool
 
-__all__ = ('connect',)
+__all__ = ('connect', 'Pool')
@@ -57,11 +57,17 @@ cdef class PGProto:
         object connected_fut
 
         bint waiting_for_sync
+        bint sync_pending
         PGTransactionStatus xact_status
 
         readonly int32_t backend_pid
         readonly int32_t backend_secret
 
+        # The number of rows and bytes of result data sent to the
+        # client by the last parse_execute() call.
+        readonly uint64_t last_result_rows
+        readonly uint64_t last_result_bytes
+
         stmt_cache.StatementsCache prep_stmts
         list last_parse_prep_stmts
 
@@ -72,6 +78,7 @@ cdef class PGProto:
     cdef write(self, buf)
 
     cdef parse_error_message(self)
+    cdef parse_command_complete_rows(self)
     cdef parse_sync_message(self)
 
     cdef parse_notification(self)
@@ -80,3 +87,4 @@ cdef class PGProto:
     cdef before_prepare(self, stmt_name, dbver, WriteBuffer outbuf)
 
     cdef make_clean_stmt_message(self, bytes stmt_name)
+    cdef make_close_portal_message(self, bytes portal)
@@ -20,6 +20,7 @@
 import asyncio
 import codecs
 import json
+import logging
 
 cimport cython
 cimport cpython
@@ -55,8 +56,12 @@ from edb.common import debug
 from . import errors as pgerror
 
 
+logger = logging.getLogger('edb.server')
+
+
 DEF DATA_BUFFER_SIZE = 100_000
 DEF PREP_STMTS_CACHE = 100
+DEF CANCEL_REQUEST_CODE = 80877102
 
 
 cdef object CARD_NA = compiler.ResultCardinality.NOT_APPLICABLE
@@ -84,6 +89,24 @@ cdef bytes INIT_CON_SCRIPT = (b'''
 )
 
 
+# Brings the connection back to the state it was in right after
+# INIT_CON_SCRIPT; used when a pooled connection was used by a
+# session that had modified its state.
+cdef bytes RESET_CON_SCRIPT = (b'''
+    RESET ALL;
+
+    DELETE FROM _edgecon_current_savepoint;
+
+    DELETE FROM _edgecon_state;
+
+    INSERT INTO _edgecon_state(name, value, type)
+    VALUES ('', \'''' +
+       defines.DEFAULT_MODULE_ALIAS.replace("'", "''").encode() +
+    b'''\', 'A');
+    '''
+)
+
+
 async def connect(addr, dbname):
     loop = asyncio.get_running_loop()
 
@@ -130,6 +153,7 @@ cdef class PGProto:
         self.connected = False
 
         self.waiting_for_sync = False
+        self.sync_pending = False
         self.xact_status = PQTRANS_UNKNOWN
 
         self.backend_pid = -1
@@ -158,6 +182,58 @@ cdef class PGProto:
     def is_connected(self):
         return bool(self.connected and self.transport is not None)
 
+    def get_prep_stmts_count(self):
+        return len(self.prep_stmts)
+
+    def is_idle(self):
+        # True if the connection can be safely handed over to another
+        # session: it's not in a transaction and there are no
+        # unsynchronized extended-protocol messages.
+        return bool(
+            self.is_connected() and
+            not self.waiting_for_sync and
+            not self.sync_pending and
+            self.xact_status == PQTRANS_IDLE
+        )
+
+    async def reset_session(self):
+        await self.simple_query(RESET_CON_SCRIPT, ignore_data=True)
+
+    def is_running_query(self):
+        # True if we are waiting for Postgres to respond.
+        return self.msg_waiter is not None and not self.msg_waiter.done()
+
+    async def cancel(self):
+        # Ask Postgres to cancel the query running on this connection.
+        # The request is sent over a new connection with the secret key
+        # received in BackendKeyData.  Postgres does not report whether
+        # anything has been cancelled.
+        cdef WriteBuffer buf
+
+        _, writer = await asyncio.open_unix_connection(self.pgaddr)
+        try:
+            buf = WriteBuffer.new()
+            buf.write_int32(16)  # message length
+            buf.write_int32(CANCEL_REQUEST_CODE)
+            buf.write_int32(self.backend_pid)
+            buf.write_int32(self.backend_secret)
+            writer.write(bytes(buf))
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def cancel_and_abort(self):
+        # Stop the running query and drop the connection, for when
+        # nobody is going to read the rest of the result: draining it
+        # would let the query run to completion.
+        try:
+            await self.cancel()
+        except Exception:
+            logger.warning('could not send a cancel request to Postgres',
+                           exc_info=True)
+        finally:
+            self.abort()
+
     def abort(self):
         if not self.transport:
             return
@@ -231,7 +307,12 @@ cdef class PGProto:
         return parse, store_stmt
 
     async def parse_execute_json(self, sql, sql_hash, dbver,
-                                 use_prep_stmt, args):
+                                 use_prep_stmt, args, rows_sink=None):
+        # If *rows_sink* is given, the query is expected to return one
+        # JSON value per row.  Rows are collected in batches that are
+        # passed to the "rows_sink" coroutine function, and the last
+        # batch is returned.  Otherwise the query must return exactly
+        # one row with the entire result.
         cdef:
             WriteBuffer parse_buf
             WriteBuffer bind_buf
@@ -241,6 +322,8 @@ cdef class PGProto:
             ssize_t size
             bint parse = 1
             bint store_stmt = 0
+            list rows = []
+            ssize_t rows_size = 0
 
         self.before_command()
 
@@ -295,7 +378,43 @@ cdef class PGProto:
             mtype = self.buffer.get_message_type()
 
             try:
-                if mtype == b'D':
+                if mtype == b'D' and rows_sink is not None:
+                    # DataRow
+                    ncol = self.buffer.read_int16()
+                    coll = self.buffer.read_int32()
+                    if ncol != 1 or coll == -1:
+                        error = RuntimeError(
+                            f'received an unexpected DataRow '
+                            f'for a JSON query {sql!r}')
+                        self.buffer.discard_message()
+                        continue
+
+                    data = self.buffer.read_bytes(coll)
+                    if error is not None:
+                        continue
+
+                    rows.append(data)
+                    rows_size += coll
+                    if rows_size >= DATA_BUFFER_SIZE:
+                        batch = rows
+                        rows = []
+                        rows_size = 0
+                        # Do not read more rows than the consumer
+                        # can take.
+                        self.transport.pause_reading()
+                        try:
+                            await rows_sink(batch)
+                        except BaseException:
+                            # E.g. the client has disconnected: rather
+                            # than read the rest of the result for
+                            # nobody, stop the query and drop the
+                            # connection.
+                            await self.cancel_and_abort()
+                            raise
+                        if self.transport is not None:
+                            self.transport.resume_reading()
+
+                elif mtype == b'D':
                     # DataRow
                     if data is not None:
                         error = RuntimeError(
@@ -353,6 +472,8 @@ cdef class PGProto:
         if error is not None:
             raise error
 
+        if rows_sink is not None:
+            return rows
         return data
 
     async def parse_execute(self,
@@ -362,7 +483,13 @@ cdef class PGProto:
                             edgecon.EdgeConnection edgecon,
                             WriteBuffer bind_data,
                             bint send_sync,
-                            bint use_prep_stmt):
+                            bint use_prep_stmt,
+                            bytes portal=b'',
+                            int32_t row_limit=0):
+        # If *portal* is given, the query is bound to a named portal
+        # and at most *row_limit* rows are fetched.  A suspended portal
+        # is continued by passing no *bind_data* and no *parse* flag.
+        # Returns True if the portal was suspended.
 
         cdef:
             WriteBuffer packet
@@ -382,6 +509,9 @@ cdef class PGProto:
         if not parse and not execute:
             raise RuntimeError('invalid parse/execute call')
 
+        self.last_result_rows = 0
+        self.last_result_bytes = 0
+
         packet = WriteBuffer.new()
 
         if use_prep_stmt:
@@ -422,9 +552,18 @@ cdef class PGProto:
                 buf.write_int16(0)
                 packet.write_buffer(buf.end_message())
 
-        if execute:
-            assert bind_data is not None
+        if portal and msgs_num != 1:
+            raise errors.InternalServerError(
+                'cannot bind more than one SQL query to a portal')
+
+        if execute and bind_data is None:
+            assert portal and not parse
+            buf = WriteBuffer.new_message(b'E')
+            buf.write_bytestring(portal)
+            buf.write_int32(row_limit)
+            packet.write_buffer(buf.end_message())
 
+        elif execute:
             if stmt_name == b'' and msgs_num > 1:
                 for s in self.last_parse_prep_stmts:
                     buf = WriteBuffer.new_message(b'B')
@@ -439,15 +578,21 @@ cdef class PGProto:
                     packet.write_buffer(buf.end_message())
 
             else:
+                if portal:
+                    # The portal might be left open by a previous
+                    # execution of the same statement.
+                    packet.write_buffer(
+                        self.make_close_portal_message(portal))
+
                 buf = WriteBuffer.new_message(b'B')
-                buf.write_bytestring(b'')  # portal name
+                buf.write_bytestring(portal)  # portal name
                 buf.write_bytestring(stmt_name)  # statement name
                 buf.write_buffer(bind_data)
                 packet.write_buffer(buf.end_message())
 
                 buf = WriteBuffer.new_message(b'E')
-                buf.write_bytestring(b'')  # portal name
-                buf.write_int32(0)  # limit: 0 - return all rows
+                buf.write_bytestring(portal)  # portal name
+                buf.write_int32(row_limit)  # limit: 0 - return all rows
                 packet.write_buffer(buf.end_message())
 
         if send_sync:
@@ -455,11 +600,23 @@ cdef class PGProto:
             self.waiting_for_sync = True
         else:
             packet.write_bytes(FLUSH_MESSAGE)
+            self.sync_pending = True
         self.write(packet)
 
         try:
             buf = None
             while True:
+                if edgecon.is_writing_paused():
+                    # The client is not keeping up with the result;
+                    # stop reading from Postgres until it catches up
+                    # so that the result is never buffered in full.
+                    try:
+                        await self.wait_for_client(edgecon)
+                    except ConnectionAbortedError:
+                        # The client has disconnected.
+                        await self.cancel_and_abort()
+                        raise
+
                 if not self.buffer.take_message():
                     await self.wait_for_message()
                 mtype = self.buffer.get_message_type()
@@ -478,13 +635,16 @@ cdef class PGProto:
 
                         self.buffer.redirect_messages(buf, b'D')
                         if buf.len() >= DATA_BUFFER_SIZE:
+                            self.last_result_bytes += buf.len()
                             edgecon.write(buf)
                             buf = None
 
                     elif mtype == b'C' and execute:  ## result
                         # CommandComplete
-                        self.buffer.discard_message()
+                        self.last_result_rows += \
+                            self.parse_command_complete_rows()
                         if buf is not None:
+                            self.last_result_bytes += buf.len()
                             edgecon.write(buf)
                             buf = None
                         msgs_executed += 1
@@ -512,7 +672,12 @@ cdef class PGProto:
                     elif mtype == b's' and execute:  ## result
                         # PortalSuspended
                         self.buffer.discard_message()
-                        return
+                        self.last_result_rows += <uint64_t>row_limit
+                        if buf is not None:
+                            self.last_result_bytes += buf.len()
+                            edgecon.write(buf)
+                            buf = None
+                        return True
 
                     elif mtype == b'2' and execute:
                         # BindComplete
@@ -533,7 +698,7 @@ cdef class PGProto:
                 finally:
                     self.buffer.finish_message()
         finally:
-            if send_sync:
+            if send_sync and self.transport is not None:
                 await self.wait_for_sync()
 
     async def simple_query(self, bytes sql, bint ignore_data):
@@ -746,12 +911,23 @@ cdef class PGProto:
         self.buffer.finish_message()
         return parsed
 
+    cdef parse_command_complete_rows(self):
+        # The command tag ends with the number of rows for commands
+        # that return or affect rows, e.g. "SELECT 10".
+        tag = self.buffer.read_null_str()
+        self.buffer.finish_message()
+        rows = tag.rpartition(b' ')[2]
+        if rows.isdigit():
+            return int(rows)
+        return 0
+
     cdef parse_sync_message(self):
         cdef char status
 
         if not self.waiting_for_sync:
             raise RuntimeError('unexpected sync')
         self.waiting_for_sync = False
+        self.sync_pending = False
 
         assert self.buffer.get_message_type() == b'Z'
 
@@ -778,12 +954,27 @@ cdef class PGProto:
         buf.write_bytestring(stmt_name)
         return buf.end_message()
 
+    cdef make_close_portal_message(self, bytes portal):
+        cdef WriteBuffer buf
+        buf = WriteBuffer.new_message(b'C')
+        buf.write_byte(b'P')
+        buf.write_bytestring(portal)
+        return buf.end_message()
+
     async def wait_for_message(self):
         if self.buffer.take_message():
             return
         self.msg_waiter = self.loop.create_future()
         await self.msg_waiter
 
+    async def wait_for_client(self, edgecon.EdgeConnection edgecon):
+        self.transport.pause_reading()
+        try:
+            await edgecon.wait_for_writable()
+        finally:
+            if self.transport is not None:
+                self.transport.resume_reading()
+
     def connection_made(self, transport):
         if self.transport is not None:
             raise RuntimeError('connection_made: invalid connection status')
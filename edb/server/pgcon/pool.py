@@ -0,0 +1,213 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import typing
+
+
+logger = logging.getLogger('edb.server')
+
+
+class Pool:
+    """A server-wide pool of backend connections.
+
+    Connections are kept per database; the total number of open
+    connections (for all databases) never exceeds *max_capacity*.
+    Waiters are served strictly in the order they arrived.  When the
+    pool is at capacity and the head waiter needs a database that has
+    no idle connections, an idle connection to another database is
+    closed to make room for it.
+    """
+
+    def __init__(self, *, connect: typing.Callable, max_capacity: int):
+        if max_capacity <= 0:
+            raise ValueError(
+                f'max_capacity is expected to be greater than 0, '
+                f'got {max_capacity}')
+
+        self._connect = connect
+        self._max_capacity = max_capacity
+
+        # Number of open connections plus connections being opened.
+        self._cur_capacity = 0
+
+        # All open connections.
+        self._conns = set()
+        # dbname -> deque of idle connections.
+        self._idle = {}
+        self._waiters = collections.deque()
+        # Tasks opening new connections.
+        self._connect_tasks = set()
+
+        self._closed = False
+
+    @property
+    def max_capacity(self):
+        return self._max_capacity
+
+    @property
+    def current_capacity(self):
+        return self._cur_capacity
+
+    @property
+    def idle_count(self):
+        return sum(len(cons) for cons in self._idle.values())
+
+    @property
+    def waiters_count(self):
+        return sum(1 for waiter, _ in self._waiters if not waiter.done())
+
+    def iter_connections(self):
+        return iter(tuple(self._conns))
+
+    async def acquire(self, dbname: str):
+        if self._closed:
+            raise RuntimeError('backend connection pool is closed')
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append((waiter, dbname))
+        self._dispatch()
+
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if (waiter.done() and not waiter.cancelled()
+                    and waiter.exception() is None):
+                # We got a connection right before the cancellation;
+                # give it back.
+                self.release(dbname, waiter.result())
+            raise
+
+    def release(self, dbname: str, conn, *, discard: bool = False):
+        if self._closed or discard or not conn.is_connected():
+            self._discard(conn)
+        else:
+            self._idle.setdefault(dbname, collections.deque()).append(conn)
+
+        self._dispatch()
+
+    def prune_idle(self, dbname: str):
+        """Close all idle connections to the *dbname* database."""
+        idle = self._idle.pop(dbname, None)
+        if idle:
+            for conn in idle:
+                self._discard(conn)
+            self._dispatch()
+
+    def close(self):
+        self._closed = True
+
+        for idle in self._idle.values():
+            for conn in idle:
+                self._discard(conn)
+        self._idle.clear()
+
+        while self._waiters:
+            waiter, _ = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(
+                    RuntimeError('backend connection pool is closed'))
+
+        for task in self._connect_tasks:
+            task.cancel()
+
+    def _discard(self, conn):
+        self._cur_capacity -= 1
+        self._conns.discard(conn)
+        conn.terminate()
+
+    def _steal_idle(self):
+        # Close an idle connection to some other database so that
+        # its slot can be reused.
+        for dbname, idle in self._idle.items():
+            if idle:
+                # The leftmost connection is the one idling the longest.
+                self._discard(idle.popleft())
+                if not idle:
+                    del self._idle[dbname]
+                return True
+        return False
+
+    def _dispatch(self):
+        while self._waiters:
+            waiter, dbname = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+                continue
+
+            idle = self._idle.get(dbname)
+            if idle:
+                self._waiters.popleft()
+                waiter.set_result(idle.pop())
+                continue
+
+            if (self._cur_capacity < self._max_capacity
+                    or self._steal_idle()):
+                self._waiters.popleft()
+                self._cur_capacity += 1
+                task = asyncio.get_running_loop().create_task(
+                    self._connect_for(waiter, dbname))
+                self._connect_tasks.add(task)
+                task.add_done_callback(self._on_connect_done)
+                continue
+
+            # The head waiter has to wait for a connection to be
+            # released; don't let anyone jump the queue.
+            break
+
+    def _on_connect_done(self, task):
+        self._connect_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(
+                'unexpected error in the backend connection pool',
+                exc_info=task.exception())
+
+    async def _connect_for(self, waiter, dbname):
+        try:
+            conn = await self._connect(dbname)
+        except asyncio.CancelledError:
+            # The pool is being closed.
+            self._cur_capacity -= 1
+            if not waiter.done():
+                waiter.set_exception(
+                    RuntimeError('backend connection pool is closed'))
+            raise
+        except Exception as ex:
+            self._cur_capacity -= 1
+            if not waiter.done():
+                waiter.set_exception(ex)
+            else:
+                logger.warning(
+                    'could not open a backend connection to %r', dbname,
+                    exc_info=True)
+            self._dispatch()
+            return
+
+        self._conns.add(conn)
+
+        if waiter.done() or self._closed:
+            # The waiter went away while we were connecting.
+            self.release(dbname, conn)
+        else:
+            waiter.set_result(conn)
@@ -22,48 +22,121 @@ from __future__ import annotations
 import asyncio
 import os
 import struct
+import typing
 
 
-_len_unpacker = struct.Struct('!I').unpack
+_len_unpack_from = struct.Struct('!I').unpack_from
 _len_packer = struct.Struct('!I').pack
 
+# Every message starts with the length of its payload followed by
+# the ID of the request it is (or replies to).  Replies can arrive
+# in any order, so multiple requests can be in flight on one
+# connection.
+_header_struct = struct.Struct('!IQ')
+_header_unpack_from = _header_struct.unpack_from
+_header_pack = _header_struct.pack
+HEADER_SIZE = _header_struct.size
+
+# The size of the preallocated receive buffer.  Messages that do not
+# fit in it are received directly into a dedicated buffer.
+RECV_BUFFER_SIZE = 256 * 1024
+# Do not ask the transport to read less than this many bytes.
+MIN_RECV_SIZE = 16 * 1024
+
 
 class PoolClosedError(Exception):
     pass
 
 
-class BaseFramedProtocol(asyncio.Protocol):
+class BaseFramedProtocol(asyncio.BufferedProtocol):
+    """A protocol for framed messages tagged with request IDs.
+
+    Data is received into a preallocated buffer and messages are cut
+    out of it with a single copy.  A message that does not fit in the
+    buffer is received directly into a buffer of its own, which is then
+    passed to process_message() without copying.
+    """
 
     def __init__(self, *, loop, con_waiter=None):
         self._loop = loop
-        self._buffer = b''
+        self._buffer = bytearray(RECV_BUFFER_SIZE)
+        self._view = memoryview(self._buffer)
+        # Unprocessed data is self._buffer[self._start:self._end].
+        self._start = 0
+        self._end = 0
+        # The buffer of a large message being received and the number
+        # of bytes received so far.
+        self._large_msg = None
+        self._large_msg_len = 0
+        self._large_msg_id = 0
         self._transport = None
         self._con_waiter = con_waiter
-        self._curmsg_len = -1
         self._closed = False
 
-    def process_message(self, msg):
+    def process_message(self, req_id, msg):
         raise NotImplementedError
 
-    def data_received(self, data):
-        # TODO: rewrite to avoid buffer copies.
-        self._buffer += data
-        while self._buffer:
-            if self._curmsg_len == -1:
-                if len(self._buffer) >= 4:
-                    self._curmsg_len = _len_unpacker(self._buffer[:4])[0]
-                    self._buffer = self._buffer[4:]
-                else:
-                    return
-
-            if self._curmsg_len > 0 and len(self._buffer) >= self._curmsg_len:
-                msg = self._buffer[:self._curmsg_len]
-                self._buffer = self._buffer[self._curmsg_len:]
-                self._curmsg_len = -1
-                self.process_message(msg)
+    def get_buffer(self, sizehint):
+        if self._large_msg is not None:
+            return memoryview(self._large_msg)[self._large_msg_len:]
+
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif len(self._buffer) - self._end < MIN_RECV_SIZE:
+            # Move the incomplete message to the start of the buffer.
+            size = self._end - self._start
+            self._view[:size] = self._view[self._start:self._end]
+            self._start = 0
+            self._end = size
+
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes):
+        if self._large_msg is not None:
+            self._large_msg_len += nbytes
+            if self._large_msg_len == len(self._large_msg):
+                msg = self._large_msg
+                self._large_msg = None
+                self.process_message(self._large_msg_id, msg)
+            return
+
+        self._end += nbytes
+        self._process_buffer()
+
+    def _process_buffer(self):
+        while self._end - self._start >= HEADER_SIZE:
+            msg_len, req_id = _header_unpack_from(self._buffer, self._start)
+            msg_start = self._start + HEADER_SIZE
+            msg_end = msg_start + msg_len
+
+            if msg_end <= self._end:
+                self._start = msg_end
+                self.process_message(
+                    req_id, bytes(self._view[msg_start:msg_end]))
+
+            elif msg_len > len(self._buffer) - MIN_RECV_SIZE:
+                # Receive the rest of the message into its own buffer.
+                received = self._end - msg_start
+                self._large_msg = bytearray(msg_len)
+                self._large_msg[:received] = self._view[msg_start:self._end]
+                self._large_msg_len = received
+                self._large_msg_id = req_id
+                self._start = self._end = 0
+                return
+
             else:
                 return
 
+    def data_received(self, data):
+        # Used by transports that do not support buffered protocols.
+        data = memoryview(data)
+        while data:
+            buf = self.get_buffer(len(data))
+            nbytes = min(len(buf), len(data))
+            buf[:nbytes] = data[:nbytes]
+            data = data[nbytes:]
+            self.buffer_updated(nbytes)
+
     def connection_made(self, tr):
         self._transport = tr
         if self._con_waiter is not None:
@@ -86,42 +159,49 @@ class HubProtocol(BaseFramedProtocol):
 
     def __init__(self, *, loop, on_pid):
         super().__init__(loop=loop)
-        self._msg_waiter = None
+        # Waiters of the requests in flight, keyed by request ID.
+        self._msg_waiters = {}
+        self._next_req_id = 1
         self._on_pid = on_pid
         self._pid = None
 
     def send(self, waiter, payload: bytes):
-        if self._msg_waiter is not None and not self._msg_waiter.done():
-            raise RuntimeError('FramedProtocol: another send() is in progress')
-        self._msg_waiter = waiter
-        self._transport.writelines((_len_packer(len(payload)), payload))
-
-    def process_message(self, msg):
-        if self._msg_waiter is not None and not self._msg_waiter.done():
-            self._msg_waiter.set_result(msg)
-            self._msg_waiter = None
-
-    def data_received(self, data):
+        req_id = self._next_req_id
+        self._next_req_id += 1
+        self._msg_waiters[req_id] = waiter
+        self._transport.writelines(
+            (_header_pack(len(payload), req_id), payload))
+
+    def process_message(self, req_id, msg):
+        # The waiter is missing or done if the call was cancelled.
+        waiter = self._msg_waiters.pop(req_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(msg)
+
+    def _process_buffer(self):
         if self._pid is None:
-            pid_data = data[:4]
-            data = data[4:]
-            self._pid = _len_unpacker(pid_data)[0]
+            # A worker starts by sending its PID.
+            if self._end - self._start < 4:
+                return
+            self._pid = _len_unpack_from(self._buffer, self._start)[0]
+            self._start += 4
             self._on_pid(self, self._transport, self._pid)
-            if data:
-                super().data_received(data)
-        else:
-            super().data_received(data)
+
+        super()._process_buffer()
 
     def connection_lost(self, exc):
         super().connection_lost(exc)
 
-        if self._msg_waiter is not None:
+        waiters = self._msg_waiters
+        self._msg_waiters = {}
+        for waiter in waiters.values():
+            if waiter.done():
+                continue
             if exc is not None:
-                self._msg_waiter.set_exception(exc)
+                waiter.set_exception(exc)
             else:
-                self._msg_waiter.set_exception(ConnectionError(
+                waiter.set_exception(ConnectionError(
                     'lost connection to the worker during a call'))
-            self._msg_waiter = None
 
 
 class WorkerProtocol(BaseFramedProtocol):
@@ -131,11 +211,12 @@ class WorkerProtocol(BaseFramedProtocol):
         self._con = con
         super().__init__(loop=loop, con_waiter=con_waiter)
 
-    def reply(self, payload: bytes):
-        self._transport.writelines((_len_packer(len(payload)), payload))
+    def reply(self, req_id, payload: bytes):
+        self._transport.writelines(
+            (_header_pack(len(payload), req_id), payload))
 
-    def process_message(self, msg):
-        self._con._on_message(msg)
+    def process_message(self, req_id, msg):
+        self._con._on_message(req_id, msg)
 
     def connection_made(self, tr):
         super().connection_made(tr)
@@ -177,18 +258,18 @@ class WorkerConnection:
     def is_closed(self):
         return self._protocol._closed
 
-    def _on_message(self, msg: bytes):
-        self._msgs.put_nowait(msg)
+    def _on_message(self, req_id, msg: bytes):
+        self._msgs.put_nowait((req_id, msg))
 
     def _on_connection_lost(self, exc):
         self._con_lost_fut.set_exception(
             PoolClosedError('connection to the pool is closed'))
         self._con_lost_fut._log_traceback = False
 
-    async def reply(self, data):
-        self._protocol.reply(data)
+    async def reply(self, req_id, data):
+        self._protocol.reply(req_id, data)
 
-    async def next_request(self) -> bytes:
+    async def next_request(self) -> typing.Tuple[int, bytes]:
         getter = self._loop.create_task(self._msgs.get())
         await asyncio.wait(
             [getter, self._con_lost_fut],
@@ -0,0 +1,138 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""A template process that forks preloaded workers on request.
+
+The fork server creates an instance of the worker class (loading
+everything the worker needs, e.g. the std schema and the parser
+tables) and then connects to the control socket of its manager.
+For every "spawn" line received it forks a worker process and
+replies with its PID; it also reaps the forked workers and reports
+their exit status.  Forked workers share the preloaded state with
+the fork server copy-on-write.
+"""
+
+
+from __future__ import annotations
+
+import argparse
+import base64
+import os
+import pickle
+import selectors
+import signal
+import socket
+
+from . import amsg
+from . import worker
+
+
+def run_child(cls, cls_args, sockname, instance):
+    try:
+        worker.run_worker(cls, cls_args, sockname, instance=instance)
+    except amsg.PoolClosedError:
+        os._exit(0)
+    except BaseException:
+        os._exit(1)
+    os._exit(0)
+
+
+def _report_exits(control):
+    # The manager cannot wait for the workers, which are not its
+    # children, so their exit status is reported to it.
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        if os.WIFSIGNALED(status):
+            returncode = -os.WTERMSIG(status)
+        else:
+            returncode = os.WEXITSTATUS(status)
+        control.sendall(b'exit %d %d\n' % (pid, returncode))
+
+
+def serve(cls, cls_args, sockname, control_sockname):
+    instance = cls(*cls_args)
+
+    control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    control.connect(control_sockname)
+
+    # SIGCHLD wakes up the select() below.
+    sigchld_r, sigchld_w = os.pipe()
+    os.set_blocking(sigchld_r, False)
+    os.set_blocking(sigchld_w, False)
+    signal.set_wakeup_fd(sigchld_w)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    sel = selectors.DefaultSelector()
+    sel.register(control, selectors.EVENT_READ)
+    sel.register(sigchld_r, selectors.EVENT_READ)
+
+    buf = b''
+    while True:
+        for key, _ in sel.select():
+            if key.fileobj == sigchld_r:
+                try:
+                    os.read(sigchld_r, 4096)
+                except BlockingIOError:
+                    pass
+                _report_exits(control)
+                continue
+
+            data = control.recv(4096)
+            if not data:
+                # The manager has gone away.
+                return
+
+            *reqs, buf = (buf + data).split(b'\n')
+            for _ in reqs:
+                pid = os.fork()
+                if pid == 0:
+                    signal.set_wakeup_fd(-1)
+                    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                    sel.close()
+                    os.close(sigchld_r)
+                    os.close(sigchld_w)
+                    control.close()
+                    run_child(cls, cls_args, sockname, instance)
+                else:
+                    # Sent before the exit of the worker can be
+                    # reported.
+                    control.sendall(b'pid %d\n' % pid)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cls-name')
+    parser.add_argument('--cls-args')
+    parser.add_argument('--sockname')
+    parser.add_argument('--control-sockname')
+    args = parser.parse_args()
+
+    cls = worker.load_class(args.cls_name)
+    cls_args = pickle.loads(base64.b64decode(args.cls_args))
+
+    serve(cls, cls_args, args.sockname, args.control_sockname)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,8 +22,10 @@ from __future__ import annotations
 import asyncio
 import base64
 import collections
+import logging
 import os.path
 import pickle
+import signal
 import subprocess
 import sys
 import time
@@ -33,12 +35,27 @@ from edb.common import supervisor
 from edb.common import taskgroup
 
 from . import amsg
+from . import serialization
 
 
 BUFFER_POOL_SIZE = 4
+MIN_BUFFER_POOL_SIZE = 1
+# Spawn requests observed within this window (in seconds) determine
+# the target size of the buffer of pre-spawned workers.
+BUFFER_DEMAND_WINDOW = 60.0
+# Buffered workers that have been idle for longer than this are
+# terminated if the buffer is larger than its target size.
+WORKER_IDLE_TIMEOUT = 120.0
+REAP_INTERVAL = 10.0
 PROCESS_INITIAL_RESPONSE_TIMEOUT = 60.0
 KILL_TIMEOUT = 10.0
 WORKER_MOD = __name__.rpartition('.')[0] + '.worker'
+FORKSERVER_MOD = __name__.rpartition('.')[0] + '.forkserver'
+# The number of calls a worker of a Pool runs concurrently.
+MAX_CALLS_PER_WORKER = 4
+
+
+logger = logging.getLogger('edb.server')
 
 
 # Inherit sys.path so that import system can find worker class
@@ -47,6 +64,12 @@ _ENV = os.environ.copy()
 _ENV['PYTHONPATH'] = ':'.join(sys.path)
 
 
+def _get_env():
+    if debug.flags.server:
+        return {'EDGEDB_DEBUG_SERVER': '1', **_ENV}
+    return _ENV
+
+
 class Worker:
 
     def __init__(self, manager, server, command_args):
@@ -58,6 +81,8 @@ class Worker:
         self._last_used = time.monotonic()
         self._closed = False
         self._sup = None
+        self._encoder = serialization.RequestEncoder()
+        self._spawn_lock = asyncio.Lock()
 
     async def _kill_proc(self, proc):
         try:
@@ -78,14 +103,23 @@ class Worker:
             self._manager._sup.create_task(self._kill_proc(self._proc))
             self._proc = None
 
-        env = _ENV
-        if debug.flags.server:
-            env = {'EDGEDB_DEBUG_SERVER': '1', **_ENV}
+        # A new process does not know any of the previously sent maps.
+        self._encoder = serialization.RequestEncoder()
 
-        self._proc = await asyncio.create_subprocess_exec(
-            *self._command_args,
-            env=env,
-            stdin=subprocess.DEVNULL)
+        forkserver = self._manager._forkserver
+        if forkserver is not None:
+            try:
+                self._proc = await forkserver.spawn()
+            except Exception:
+                logger.warning(
+                    'could not fork a worker, spawning a new process',
+                    exc_info=True)
+
+        if self._proc is None:
+            self._proc = await asyncio.create_subprocess_exec(
+                *self._command_args,
+                env=_get_env(),
+                stdin=subprocess.DEVNULL)
         try:
             self._con = await asyncio.wait_for(
                 self._server.get_by_pid(self._proc.pid),
@@ -104,9 +138,12 @@ class Worker:
         assert not self._closed
 
         if self._con.is_closed():
-            await self._spawn()
+            # Concurrent calls must not respawn the process twice.
+            async with self._spawn_lock:
+                if self._con.is_closed():
+                    await self._spawn()
 
-        msg = pickle.dumps((method_name, args))
+        msg = self._encoder.dumps((method_name, args))
         data = await self._con.request(msg)
         status, *data = pickle.loads(data)
 
@@ -137,10 +174,171 @@ class Worker:
             pass
 
 
+class ForkedProcess:
+    """A handle of a worker process forked by the fork server.
+
+    The process is not our child, so we cannot waitpid() it: the fork
+    server reaps it and reports its exit status.
+    """
+
+    def __init__(self, pid, loop):
+        self.pid = pid
+        self.returncode = None
+        self._exited = loop.create_future()
+
+    def _set_returncode(self, returncode):
+        if self.returncode is None:
+            self.returncode = returncode
+            self._exited.set_result(returncode)
+
+    def _send_signal(self, sig):
+        if self.returncode is not None:
+            # The PID might have been reused by now.
+            raise ProcessLookupError(self.pid)
+        os.kill(self.pid, sig)
+
+    def kill(self):
+        self._send_signal(signal.SIGKILL)
+
+    def terminate(self):
+        self._send_signal(signal.SIGTERM)
+
+    async def wait(self):
+        return await asyncio.shield(self._exited)
+
+
+class ForkServer:
+
+    def __init__(self, *, loop, command_args, control_sockname):
+        self._loop = loop
+        self._command_args = command_args
+        self._control_sockname = control_sockname
+        self._proc = None
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._lock = asyncio.Lock()
+        # Futures of spawn requests, in the order of their replies.
+        self._spawn_waiters = collections.deque()
+        # Running forked workers by PID.
+        self._children = {}
+
+    async def start(self):
+        con_waiter = self._loop.create_future()
+
+        def on_connect(reader, writer):
+            if con_waiter.done():
+                writer.close()
+            else:
+                con_waiter.set_result((reader, writer))
+
+        server = await asyncio.start_unix_server(
+            on_connect, self._control_sockname)
+        try:
+            self._proc = await asyncio.create_subprocess_exec(
+                *self._command_args,
+                '--control-sockname', self._control_sockname,
+                env=_get_env(),
+                stdin=subprocess.DEVNULL)
+            proc_waiter = self._loop.create_task(self._proc.wait())
+            try:
+                await asyncio.wait(
+                    [con_waiter, proc_waiter],
+                    timeout=PROCESS_INITIAL_RESPONSE_TIMEOUT,
+                    return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                proc_waiter.cancel()
+
+            if not con_waiter.done():
+                con_waiter.cancel()
+                if self._proc.returncode is None:
+                    self._proc.kill()
+                    raise RuntimeError('fork server has not connected')
+                raise RuntimeError(
+                    f'fork server has exited with exit code '
+                    f'{self._proc.returncode}')
+        finally:
+            server.close()
+            await server.wait_closed()
+
+        self._reader, self._writer = con_waiter.result()
+        self._reader_task = self._loop.create_task(self._read_replies())
+
+    async def _read_replies(self):
+        # The fork server replies to every spawn request with
+        # "pid <PID>" and reports exited workers with
+        # "exit <PID> <RETURNCODE>".
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    return
+                kind, *args = line.split()
+                if kind == b'pid':
+                    proc = ForkedProcess(int(args[0]), self._loop)
+                    self._children[proc.pid] = proc
+                    waiter = self._spawn_waiters.popleft()
+                    if waiter.done():
+                        # The spawn request was cancelled.
+                        self._kill_child(proc)
+                    else:
+                        waiter.set_result(proc)
+                elif kind == b'exit':
+                    proc = self._children.pop(int(args[0]), None)
+                    if proc is not None:
+                        proc._set_returncode(int(args[1]))
+        finally:
+            while self._spawn_waiters:
+                waiter = self._spawn_waiters.popleft()
+                if not waiter.done():
+                    waiter.set_exception(
+                        RuntimeError('fork server has exited'))
+
+            # Nobody could report the exit of the remaining workers.
+            for proc in self._children.values():
+                self._kill_child(proc)
+                proc._set_returncode(-signal.SIGKILL)
+            self._children.clear()
+
+    def _kill_child(self, proc):
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+    async def spawn(self) -> ForkedProcess:
+        if self._reader_task is None or self._reader_task.done():
+            raise RuntimeError('fork server has exited')
+
+        waiter = self._loop.create_future()
+        async with self._lock:
+            self._spawn_waiters.append(waiter)
+            self._writer.write(b'spawn\n')
+            await self._writer.drain()
+        return await waiter
+
+    async def stop(self):
+        # The fork server exits when the control connection is closed.
+        self._writer.close()
+        try:
+            await asyncio.wait_for(self._proc.wait(), KILL_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._proc.kill()
+        await self._reader_task
+
+
 class Manager:
 
     def __init__(self, *, worker_cls, worker_args,
-                 loop, name, runstate_dir, pool_size=BUFFER_POOL_SIZE):
+                 loop, name, runstate_dir,
+                 min_pool_size=MIN_BUFFER_POOL_SIZE,
+                 max_pool_size=BUFFER_POOL_SIZE,
+                 use_forkserver=True):
+
+        if min_pool_size < 0 or max_pool_size < min_pool_size:
+            raise ValueError(
+                f'invalid buffer pool size bounds: '
+                f'min={min_pool_size}, max={max_pool_size}')
 
         self._worker_cls = worker_cls
         self._worker_args = worker_args
@@ -153,8 +351,13 @@ class Manager:
         self._poolsock_name = os.path.join(
             self._runstate_dir, f'{name}.socket')
 
-        self._pool_size = pool_size
+        self._min_pool_size = min_pool_size
+        self._max_pool_size = max_pool_size
         self._workers_pool = collections.deque()
+        self._pool_spawning = 0
+        # Timestamps of recent spawn_worker() calls.
+        self._spawn_requests = collections.deque()
+        self._reaper = None
         self._workers = set()
 
         self._server = amsg.Server(self._poolsock_name, loop)
@@ -166,9 +369,7 @@ class Manager:
 
         self._sup = None
 
-        self._worker_command_args = [
-            sys.executable, '-m', WORKER_MOD,
-
+        worker_args = [
             '--cls-name',
             f'{self._worker_cls.__module__}.{self._worker_cls.__name__}',
 
@@ -176,6 +377,18 @@ class Manager:
             '--sockname', self._poolsock_name
         ]
 
+        self._worker_command_args = [
+            sys.executable, '-m', WORKER_MOD, *worker_args]
+
+        self._forkserver = None
+        if use_forkserver and hasattr(os, 'fork'):
+            self._forkserver = ForkServer(
+                loop=loop,
+                command_args=[sys.executable, '-m', FORKSERVER_MOD,
+                              *worker_args],
+                control_sockname=os.path.join(
+                    self._runstate_dir, f'{name}.forkserver.socket'))
+
     def iter_workers(self):
         return iter(frozenset(self._workers))
 
@@ -187,21 +400,76 @@ class Manager:
         await worker._spawn()
         return worker
 
+    def get_stats(self):
+        return {
+            'spawned': self._stats_spawned,
+            'killed': self._stats_killed,
+            'workers': len(self._workers),
+            'buffered': len(self._workers_pool),
+            'buffer_target': self._get_target_pool_size(),
+        }
+
+    def _get_target_pool_size(self):
+        """Return the desired number of pre-spawned workers.
+
+        The buffer is sized after the number of workers requested
+        within the last BUFFER_DEMAND_WINDOW seconds.
+        """
+        horizon = time.monotonic() - BUFFER_DEMAND_WINDOW
+        requests = self._spawn_requests
+        while requests and requests[0] < horizon:
+            requests.popleft()
+
+        return max(self._min_pool_size,
+                   min(self._max_pool_size, len(requests)))
+
+    def _refill_pool(self):
+        missing = (self._get_target_pool_size() -
+                   len(self._workers_pool) - self._pool_spawning)
+        for _ in range(missing):
+            self._pool_spawning += 1
+            self._sup.create_task(self._spawn_for_pool())
+
     async def _spawn_for_pool(self):
-        worker = await self._spawn_worker()
+        try:
+            worker = await self._spawn_worker()
+        finally:
+            self._pool_spawning -= 1
         self._workers_pool.appendleft(worker)
         return worker
 
+    async def _reap_idle_workers(self):
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            self._reap_idle()
+
+    def _reap_idle(self):
+        # The oldest buffered workers are at the right end.
+        now = time.monotonic()
+        excess = len(self._workers_pool) - self._get_target_pool_size()
+        while (excess > 0 and
+                now - self._workers_pool[-1]._last_used >
+                WORKER_IDLE_TIMEOUT):
+            worker = self._workers_pool.pop()
+            excess -= 1
+            self._sup.create_task(worker.close())
+
+        self._refill_pool()
+
     async def spawn_worker(self):
         if not self._running:
             raise RuntimeError('cannot spawn a worker: not running')
 
+        self._spawn_requests.append(time.monotonic())
+
         if self._workers_pool:
             worker = self._workers_pool.pop()
-            self._sup.create_task(self._spawn_for_pool())
         else:
             worker = await self._spawn_worker()
 
+        self._refill_pool()
+
+        worker._last_used = time.monotonic()
         self._workers.add(worker)
         return worker
 
@@ -211,15 +479,34 @@ class Manager:
         await self._server.start()
         self._running = True
 
-        if self._pool_size:
+        if self._forkserver is not None:
+            try:
+                await self._forkserver.start()
+            except Exception:
+                logger.warning(
+                    'could not start the fork server, workers will be '
+                    'spawned as new processes', exc_info=True)
+                self._forkserver = None
+
+        if self._min_pool_size:
             async with taskgroup.TaskGroup(name='manager-start') as g:
-                for _ in range(self._pool_size):
+                for _ in range(self._min_pool_size):
+                    self._pool_spawning += 1
                     g.create_task(self._spawn_for_pool())
 
+        self._reaper = self._loop.create_task(self._reap_idle_workers())
+
     async def stop(self):
         if not self._running:
             return
 
+        self._reaper.cancel()
+        try:
+            await self._reaper
+        except asyncio.CancelledError:
+            pass
+        self._reaper = None
+
         await self._sup.wait()
 
         await self._server.stop()
@@ -237,9 +524,136 @@ class Manager:
         self._workers.clear()
         self._running = False
 
+        if self._forkserver is not None:
+            await self._forkserver.stop()
+
+
+class Pool:
+    """A fixed-size set of workers shared by many clients.
+
+    Every worker can run up to *max_calls_per_worker* calls at once;
+    a call is sent to the least busy worker.  A client can ask for
+    a specific worker (e.g. the one that holds its state), in which
+    case it waits until that worker can take another call.
+    """
+
+    def __init__(self, manager, *, size,
+                 max_calls_per_worker=MAX_CALLS_PER_WORKER):
+        if size <= 0:
+            raise ValueError(
+                f'pool size is expected to be greater than 0, got {size}')
+        if max_calls_per_worker <= 0:
+            raise ValueError(
+                f'max_calls_per_worker is expected to be greater than 0, '
+                f'got {max_calls_per_worker}')
+
+        self._manager = manager
+        self._size = size
+        self._max_calls = max_calls_per_worker
+        self._loop = manager._loop
+
+        self._workers = []
+        # The number of calls in flight, per worker.
+        self._calls = {}
+        self._waiters = collections.deque()
+
+    def get_size(self):
+        return self._size
+
+    def get_stats(self):
+        return {
+            'size': self._size,
+            'calls': sum(self._calls.values()),
+            'waiters': sum(1 for waiter, _ in self._waiters
+                           if not waiter.done()),
+        }
+
+    def iter_workers(self):
+        return iter(tuple(self._workers))
+
+    async def start(self):
+        async with taskgroup.TaskGroup(
+                name=f'{self._manager._name}-pool-start') as g:
+            tasks = [
+                g.create_task(self._manager.spawn_worker())
+                for _ in range(self._size)
+            ]
+
+        for task in tasks:
+            worker = task.result()
+            self._workers.append(worker)
+            self._calls[worker] = 0
+
+    def _get_available(self, worker=None):
+        if worker is None:
+            worker = min(self._workers, key=self._calls.__getitem__)
+        if self._calls[worker] < self._max_calls:
+            return worker
+        return None
+
+    async def acquire(self, worker=None):
+        if not self._waiters:
+            available = self._get_available(worker)
+            if available is not None:
+                self._calls[available] += 1
+                return available
+
+        # Queued calls are served first, in order.
+        waiter = self._loop.create_future()
+        self._waiters.append((waiter, worker))
+        self._wakeup_waiters()
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            try:
+                self._waiters.remove((waiter, worker))
+            except ValueError:
+                pass
+            if waiter.done() and not waiter.cancelled():
+                # The worker was handed over to us right before
+                # the cancellation; give it back.
+                self.release(waiter.result())
+            raise
+
+    def release(self, worker):
+        self._calls[worker] -= 1
+        self._wakeup_waiters()
+
+    def _wakeup_waiters(self):
+        waiters = self._waiters
+        self._waiters = collections.deque()
+        for waiter, wanted in waiters:
+            if waiter.done():
+                continue
+            available = self._get_available(wanted)
+            if available is None:
+                self._waiters.append((waiter, wanted))
+            else:
+                self._calls[available] += 1
+                waiter.set_result(available)
+
+    async def call(self, method_name, *args, worker=None):
+        worker = await self.acquire(worker)
+        try:
+            return await worker.call(method_name, *args)
+        finally:
+            self.release(worker)
+
+    async def call_all(self, method_name, *args):
+        """Call a method on every worker of the pool.
+
+        Returns a list of results or exceptions, one per worker.
+        """
+        return await asyncio.gather(
+            *(self.call(method_name, *args, worker=worker)
+              for worker in self._workers),
+            return_exceptions=True)
+
 
 async def create_manager(*, runstate_dir: str, name: str,
-                         worker_cls: type, worker_args: tuple) -> Manager:
+                         worker_cls: type, worker_args: tuple,
+                         min_pool_size: int = MIN_BUFFER_POOL_SIZE,
+                         max_pool_size: int = BUFFER_POOL_SIZE) -> Manager:
 
     loop = asyncio.get_running_loop()
     pool = Manager(
@@ -247,7 +661,15 @@ async def create_manager(*, runstate_dir: str, name: str,
         runstate_dir=runstate_dir,
         worker_cls=worker_cls,
         worker_args=worker_args,
-        name=name)
+        name=name,
+        min_pool_size=min_pool_size,
+        max_pool_size=max_pool_size)
+
+    await pool.start()
+    return pool
+
 
+async def create_pool(manager: Manager, *, size: int) -> Pool:
+    pool = Pool(manager, size=size)
     await pool.start()
     return pool
@@ -0,0 +1,107 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Serialization of requests sent to worker processes.
+
+Requests often carry the same immutable mappings (e.g. module aliases
+and session configuration of a connection).  The first time a mapping
+object is sent to a worker it is assigned a number, and subsequent
+requests refer to it by that number instead of pickling it again.
+Mappings are interned by identity: equal mappings can have values of
+different types, like 1 and True, that must not be confused.  An encoder
+must only be used with one worker process, and the worker must decode
+requests in the order they were encoded.
+"""
+
+
+from __future__ import annotations
+
+import io
+import pickle
+
+import immutables
+
+
+MAX_INTERNED_MAPS = 1000
+
+
+class _RequestPickler(pickle.Pickler):
+
+    def __init__(self, file, maps):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._maps = maps
+
+    def persistent_id(self, obj):
+        if type(obj) is not immutables.Map or not obj:
+            return None
+
+        interned = self._maps.get(id(obj))
+        if interned is not None:
+            return interned[0]
+        elif len(self._maps) >= MAX_INTERNED_MAPS:
+            return None
+
+        idx = len(self._maps)
+        # The mapping is kept alive so that its id is not reused.
+        self._maps[id(obj)] = (idx, obj)
+        return (idx, dict(obj))
+
+
+class _RequestUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, maps):
+        super().__init__(file)
+        self._maps = maps
+
+    def persistent_load(self, pid):
+        if isinstance(pid, int):
+            return self._maps[pid]
+
+        idx, items = pid
+        obj = self._maps[idx] = immutables.Map(items)
+        return obj
+
+
+class RequestEncoder:
+
+    def __init__(self):
+        self._maps = {}
+
+    def dumps(self, obj) -> bytes:
+        known = len(self._maps)
+        f = io.BytesIO()
+        try:
+            _RequestPickler(f, self._maps).dump(obj)
+        except BaseException:
+            # The request will not reach the worker: forget the
+            # mappings it would have defined.
+            self._maps = {
+                key: interned for key, interned in self._maps.items()
+                if interned[0] < known}
+            raise
+        return f.getvalue()
+
+
+class RequestDecoder:
+
+    def __init__(self):
+        self._maps = {}
+
+    def loads(self, data):
+        return _RequestUnpickler(io.BytesIO(data), self._maps).load()
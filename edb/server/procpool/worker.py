@@ -35,6 +35,7 @@ from edb.common import devmode
 from edb.common import markup
 
 from . import amsg
+from . import serialization
 
 
 def load_class(cls_name):
@@ -44,54 +45,71 @@ def load_class(cls_name):
     return cls
 
 
-async def worker(cls, cls_args, sockname):
+def _get_error_data(ex):
+    prepare_exception(ex)
+    if debug.flags.server:
+        markup.dump(ex)
+    return (
+        1,
+        ex,
+        traceback.format_exc()
+    )
+
+
+async def _reply(con, req_id, data):
+    try:
+        pickled = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as ex:
+        ex_tb = traceback.format_exc()
+        ex_str = f'{ex}:\n\n{ex_tb}'
+        pickled = pickle.dumps((2, ex_str))
+
+    await con.reply(req_id, pickled)
+
+
+async def _call(con, req_id, meth, args):
+    try:
+        res = await meth(*args)
+        data = (0, res)
+    except Exception as ex:
+        data = _get_error_data(ex)
+
+    await _reply(con, req_id, data)
+
+
+async def worker(cls, cls_args, sockname, instance=None):
     loop = asyncio.get_running_loop()
     loop.add_signal_handler(signal.SIGTERM, on_terminate_worker)
 
     con = await amsg.worker_connect(sockname)
     try:
-        worker = cls(*cls_args)
+        if instance is not None:
+            # Created by the fork server.
+            worker = instance
+        else:
+            worker = cls(*cls_args)
+
+        decoder = serialization.RequestDecoder()
+        # Calls are run concurrently, so that a call waiting for I/O
+        # (e.g. schema introspection) does not hold up the others.
+        calls = set()
 
         while True:
             try:
-                req = await con.next_request()
+                req_id, req = await con.next_request()
             except amsg.PoolClosedError:
                 os._exit(0)
 
             try:
-                methname, args = pickle.loads(req)
+                # Requests must be decoded in the order they were sent.
+                methname, args = decoder.loads(req)
                 meth = getattr(worker, methname)
             except Exception as ex:
-                prepare_exception(ex)
-                if debug.flags.server:
-                    markup.dump(ex)
-                data = (
-                    1,
-                    ex,
-                    traceback.format_exc()
-                )
+                await _reply(con, req_id, _get_error_data(ex))
             else:
-                try:
-                    res = await meth(*args)
-                    data = (0, res)
-                except Exception as ex:
-                    prepare_exception(ex)
-                    if debug.flags.server:
-                        markup.dump(ex)
-                    data = (
-                        1,
-                        ex,
-                        traceback.format_exc()
-                    )
-
-            try:
-                pickled = pickle.dumps(data)
-            except Exception as ex:
-                ex_tb = traceback.format_exc()
-                ex_str = f'{ex}:\n\n{ex_tb}'
-                pickled = pickle.dumps((2, ex_str))
-
-            await con.reply(pickled)
+                call = loop.create_task(_call(con, req_id, meth, args))
+                calls.add(call)
+                call.add_done_callback(calls.discard)
     finally:
         con.abort()
 
@@ -101,10 +119,10 @@ def on_terminate_worker():
     os._exit(-1)
 
 
-def run_worker(cls, cls_args, sockname):
+def run_worker(cls, cls_args, sockname, *, instance=None):
     asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     with devmode.CoverageConfig.enable_coverage_if_requested():
-        asyncio.run(worker(cls, cls_args, sockname))
+        asyncio.run(worker(cls, cls_args, sockname, instance))
 
 
 def prepare_exception(ex):
@@ -0,0 +1,214 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+"""Aggregated statistics of queries.
+
+Statistics are kept in memory per database and query hash, and are
+periodically saved as JSON to the data directory, where the
+"sys::QueryStats" view reads them from.  Files are written in a
+dedicated thread.
+"""
+
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import tempfile
+import typing
+
+from edb.server import defines
+from edb.server import metrics
+
+
+logger = logging.getLogger('edb.server')
+
+
+STATS_FILE = 'query_stats.json'
+# Statistics are saved at most once per this many seconds.
+SAVE_INTERVAL = 1.0
+# Longer query texts are truncated.
+MAX_QUERY_TEXT_LEN = 1000
+
+COMPILE_STAGES = (
+    'parse',
+    'compile_ast_to_ir',
+    'compile_ir_to_sql',
+    'codegen',
+    'describe',
+)
+
+
+def _get_query_text(eql: bytes) -> str:
+    text = eql.decode('utf-8', errors='replace').strip()
+    if len(text) > MAX_QUERY_TEXT_LEN:
+        text = text[:MAX_QUERY_TEXT_LEN] + '...'
+    return text
+
+
+class QueryStats:
+
+    def __init__(self, datadir: str):
+        self._path = os.path.join(datadir, STATS_FILE)
+        # Least recently updated entries are evicted first.
+        self._stats = collections.OrderedDict()
+        self._save_handle = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='edgedb-query-stats')
+        # The view expects the file to exist.
+        self._save()
+
+    def _get_entry(
+            self, dbname: str, query_hash: bytes,
+            eql: typing.Optional[bytes]=None) -> typing.Dict[str, typing.Any]:
+        key = (dbname, query_hash)
+        entry = self._stats.get(key)
+        if entry is not None:
+            self._stats.move_to_end(key)
+            if entry['query'] is None and eql is not None:
+                entry['query'] = _get_query_text(eql)
+        else:
+            entry = {
+                'database': dbname,
+                'query_hash': query_hash.decode('latin1'),
+                'query': None if eql is None else _get_query_text(eql),
+                'compile_count': 0,
+                'compile_time_total': 0.0,
+                'compile_time_max': 0.0,
+                'cache_hits': 0,
+                'calls': 0,
+                'exec_time_total': 0.0,
+                'exec_time_max': 0.0,
+                'rows': 0,
+                'bytes_sent': 0,
+            }
+            for stage in COMPILE_STAGES:
+                entry[f'{stage}_time'] = 0.0
+            self._stats[key] = entry
+            if len(self._stats) > defines.MAX_QUERY_STATS:
+                self._stats.popitem(last=False)
+        return entry
+
+    def record_compile(self, dbname: str, eql: bytes, units):
+        """Record the compile timings of *units* compiled from *eql*."""
+        for unit in units:
+            timings = unit.compile_timings
+            if not timings:
+                continue
+
+            total = sum(timings.values())
+            metrics.queries_compiled.inc()
+            metrics.query_compilation_duration.observe(total)
+
+            if total >= defines.SLOW_COMPILE_LOG_THRESHOLD:
+                logger.warning(
+                    'slow compilation of a query in database %r '
+                    'took %.3fs (%s): %s',
+                    dbname, total,
+                    ', '.join(f'{stage}: {elapsed:.3f}s'
+                              for stage, elapsed in timings.items()),
+                    _get_query_text(eql))
+
+            if not unit.sql_hash:
+                # Only single queries have a stable hash.
+                continue
+
+            entry = self._get_entry(dbname, unit.sql_hash, eql)
+            entry['compile_count'] += 1
+            entry['compile_time_total'] += total
+            entry['compile_time_max'] = max(entry['compile_time_max'], total)
+            for stage, elapsed in timings.items():
+                entry[f'{stage}_time'] += elapsed
+
+            self._schedule_save()
+
+    def record_cache_hit(self, dbname: str, eql: typing.Optional[bytes],
+                         unit):
+        """Record that *unit* was found in the compiled query cache.
+
+        Only the hits of EdgeQL queries, for which *eql* is given,
+        are recorded per query.
+        """
+        metrics.compiled_query_cache_hits.inc()
+        if eql is None or not unit.sql_hash:
+            return
+        entry = self._get_entry(dbname, unit.sql_hash, eql)
+        entry['cache_hits'] += 1
+        self._schedule_save()
+
+    def record_execute(self, dbname: str, unit, elapsed: float,
+                       rows: int, bytes_sent: int):
+        """Record an execution of *unit* that took *elapsed* seconds."""
+        metrics.query_execution_duration.observe(elapsed)
+        if not unit.sql_hash:
+            return
+        entry = self._get_entry(dbname, unit.sql_hash)
+        entry['calls'] += 1
+        entry['exec_time_total'] += elapsed
+        entry['exec_time_max'] = max(entry['exec_time_max'], elapsed)
+        entry['rows'] += rows
+        entry['bytes_sent'] += bytes_sent
+        self._schedule_save()
+
+    def drop_database(self, dbname: str):
+        for key in [key for key in self._stats if key[0] == dbname]:
+            del self._stats[key]
+        self._schedule_save()
+
+    def _schedule_save(self):
+        if self._save_handle is None:
+            self._save_handle = asyncio.get_running_loop().call_later(
+                SAVE_INTERVAL, self._save)
+
+    def _save(self):
+        self._save_handle = None
+        # Entries are copied, as they keep being updated while
+        # the copies are being written.
+        entries = [dict(entry) for entry in self._stats.values()]
+        self._executor.submit(self._write, entries).add_done_callback(
+            _log_errors)
+
+    def _write(self, entries):
+        # Runs in the I/O thread.
+        data = json.dumps(entries)
+        dirname = os.path.dirname(self._path)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.stats-')
+        try:
+            with os.fdopen(fd, 'wt') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def close(self):
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        self._executor.shutdown(wait=True)
+
+
+def _log_errors(fut):
+    if not fut.cancelled() and fut.exception() is not None:
+        logger.warning(
+            'could not save query statistics', exc_info=fut.exception())
@@ -33,6 +33,7 @@ from edb.server import config
 from edb.server import defines
 from edb.server import http_edgeql_port
 from edb.server import http_graphql_port
+from edb.server import metrics_port
 from edb.server import mng_port
 from edb.server import pgcon
 
@@ -47,7 +48,10 @@ class Server:
     def __init__(self, *, loop, cluster, runstate_dir,
                  internal_runstate_dir,
                  max_backend_connections,
-                 nethost, netport):
+                 nethost, netport,
+                 metrics_port=None,
+                 compiler_buffer_min_size=1,
+                 compiler_buffer_max_size=4):
 
         self._loop = loop
 
@@ -63,10 +67,17 @@ class Server:
         self._runstate_dir = runstate_dir
         self._internal_runstate_dir = internal_runstate_dir
         self._max_backend_connections = max_backend_connections
+        self._compiler_buffer_min_size = compiler_buffer_min_size
+        self._compiler_buffer_max_size = compiler_buffer_max_size
+        self._pg_pool = pgcon.Pool(
+            connect=self.new_pgcon,
+            max_capacity=max_backend_connections,
+        )
 
         self._mgmt_port = None
         self._mgmt_host_addr = nethost
         self._mgmt_port_no = netport
+        self._metrics_port_no = metrics_port
 
         self._ports = []
         self._sys_conf_ports = {}
@@ -90,6 +101,13 @@ class Server:
             netport=self._mgmt_port_no,
         )
 
+        if self._metrics_port_no:
+            self._ports.append(self._new_port(
+                metrics_port.MetricsPort,
+                nethost=self._mgmt_host_addr,
+                netport=self._metrics_port_no,
+            ))
+
     def _populate_sys_auth(self):
         self._sys_auth = tuple(sorted(
             self._dbindex.get_sys_config().get('auth', ()),
@@ -108,17 +126,24 @@ class Server:
 
         return os.path.join(host, f'.s.PGSQL.{port}')
 
+    def get_compiler_buffer_size(self):
+        """Return the bounds of the buffer of idle compiler processes."""
+        return self._compiler_buffer_min_size, self._compiler_buffer_max_size
+
+    def get_pgaddr(self):
+        return self._pg_addr
+
     async def new_pgcon(self, dbname):
         return await pgcon.connect(self._pg_addr, dbname)
 
-    async def new_compiler(self, dbname, dbver):
-        compiler_worker = await self._compiler_manager.spawn_worker()
-        try:
-            await compiler_worker.call('connect', dbname, dbver)
-        except Exception:
-            await compiler_worker.close()
-            raise
-        return compiler_worker
+    async def acquire_pgcon(self, dbname):
+        return await self._pg_pool.acquire(dbname)
+
+    def release_pgcon(self, dbname, conn, *, discard=False):
+        self._pg_pool.release(dbname, conn, discard=discard)
+
+    def prune_idle_pgcons(self, dbname):
+        self._pg_pool.prune_idle(dbname)
 
     def _new_port(self, portcls, **kwargs):
         return portcls(
@@ -264,6 +289,29 @@ class Server:
     def get_datadir(self):
         return self._pg_data_dir
 
+    def get_internal_runstate_dir(self):
+        return self._internal_runstate_dir
+
+    def get_compiler_pool(self):
+        if self._mgmt_port is None:
+            return None
+        return self._mgmt_port.get_compiler_pool()
+
+    def get_pgcon_pool(self):
+        return self._pg_pool
+
+    def get_ports(self):
+        ports = [self._mgmt_port, *self._ports, *self._sys_conf_ports.values()]
+        return [port for port in ports if port is not None]
+
+    async def update_database_schema(self, dbname, dbver, schema):
+        ports = [self._mgmt_port, *self._ports, *self._sys_conf_ports.values()]
+        async with taskgroup.TaskGroup() as g:
+            for port in ports:
+                if port is not None:
+                    g.create_task(
+                        port.update_database_schema(dbname, dbver, schema))
+
     def add_port(self, portcls, **kwargs):
         if self._serving:
             raise RuntimeError(
@@ -303,6 +351,9 @@ class Server:
             g.create_task(self._mgmt_port.stop())
             self._mgmt_port = None
 
+        self._pg_pool.close()
+        self._dbindex.close()
+
     async def get_auth_method(self, user, database, conn):
         authlist = self._sys_auth
 
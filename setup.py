@@ -507,6 +507,12 @@ setuptools.setup(
             ["edb/server/http_graphql_port/protocol.pyx"],
             extra_compile_args=EXT_CFLAGS,
             extra_link_args=EXT_LDFLAGS),
+
+        distutils_extension.Extension(
+            "edb.server.metrics_port.protocol",
+            ["edb/server/metrics_port/protocol.pyx"],
+            extra_compile_args=EXT_CFLAGS,
+            extra_link_args=EXT_LDFLAGS),
     ],
     install_requires=RUNTIME_DEPS,
     extras_require=EXTRA_DEPS,
@@ -17,6 +17,7 @@
 #
 
 
+import asyncio
 import os.path
 
 from edb.testbase import server as tb
@@ -1099,6 +1100,53 @@ class TestIntrospection(tb.QueryTestCase):
             [True]
         )
 
+    async def test_edgeql_introspection_meta_19(self):
+        await self.con.fetchall('SELECT "introspection_meta_19";')
+
+        # The server saves the statistics periodically.
+        for _ in range(50):
+            stats = await self.con.fetchall('''
+                SELECT sys::QueryStats {
+                    compile_count,
+                    compile_time,
+                    parse_time,
+                }
+                FILTER .query = 'SELECT "introspection_meta_19";'
+            ''')
+            if stats:
+                break
+            await asyncio.sleep(0.1)
+
+        self.assertEqual(len(stats), 1)
+        self.assertGreaterEqual(stats[0].compile_count, 1)
+        self.assertGreaterEqual(stats[0].compile_time, stats[0].parse_time)
+
+    async def test_edgeql_introspection_meta_20(self):
+        for _ in range(3):
+            await self.con.fetchall('SELECT {1, 2, 3} + 0 * 20;')
+
+        # The server saves the statistics periodically.
+        for _ in range(50):
+            stats = await self.con.fetchall('''
+                SELECT sys::QueryStats {
+                    calls,
+                    cache_hits,
+                    rows,
+                    bytes_sent,
+                }
+                FILTER .query = 'SELECT {1, 2, 3} + 0 * 20;'
+                    AND .calls >= 3
+            ''')
+            if stats:
+                break
+            await asyncio.sleep(0.1)
+
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0].calls, 3)
+        self.assertGreaterEqual(stats[0].cache_hits, 1)
+        self.assertEqual(stats[0].rows, 9)
+        self.assertGreater(stats[0].bytes_sent, 0)
+
     async def test_edgeql_introspection_meta_default_01(self):
         await self.assert_query_result(
             r'''
@@ -0,0 +1,85 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os.path
+
+from edb.testbase import lang as tb
+
+from edb.edgeql import ast as qlast
+from edb.edgeql import codegen as qlcodegen
+from edb.edgeql import compiler
+from edb.edgeql import parser as qlparser
+from edb.edgeql.compiler import astutils
+
+
+class TestEdgeQLIRSchemaExpr(tb.BaseEdgeQLCompilerTest):
+    """Unit tests for the cache of parsed schema expressions."""
+
+    SCHEMA = os.path.join(os.path.dirname(__file__), 'schemas',
+                          'cards.esdl')
+
+    def setUp(self):
+        super().setUp()
+        astutils._schema_expr_cache.clear()
+
+    def get_expr_text(self, typename, ptrname):
+        objtype = self.schema.get(typename)
+        ptr = objtype.getptr(self.schema, ptrname)
+        return ptr.get_expr(self.schema).text
+
+    def test_edgeql_ir_schema_expr_01(self):
+        text = "<str>.cost ++ ' ' ++ .element"
+        expected = qlcodegen.generate_source(qlparser.parse(text))
+
+        tree1 = astutils.parse_schema_expr(text)
+        tree2 = astutils.parse_schema_expr(text)
+        self.assertIn(text, astutils._schema_expr_cache)
+        self.assertIsNot(tree1, tree2)
+        self.assertEqual(qlcodegen.generate_source(tree2), expected)
+
+        # Changes to a returned tree do not leak into the cache.
+        tree2.op = '='
+        tree2.right = qlast.StringConstant(value='x')
+        self.assertEqual(
+            qlcodegen.generate_source(astutils.parse_schema_expr(text)),
+            expected)
+
+    def test_edgeql_ir_schema_expr_02(self):
+        text = self.get_expr_text('test::Card', 'elemental_cost')
+        query = 'WITH MODULE test SELECT Card { name, elemental_cost }'
+
+        ir1 = compiler.compile_to_ir(query, self.schema)
+        self.assertIn(text, astutils._schema_expr_cache)
+
+        # Queries that refer to the computable reuse its parsed tree.
+        ir2 = compiler.compile_to_ir(query, self.schema)
+        self.assertEqual(len(astutils._schema_expr_cache), 1)
+        self.assertEqual(ir1.cardinality, ir2.cardinality)
+        self.assertEqual(
+            ir1.stype.get_name(ir1.schema), ir2.stype.get_name(ir2.schema))
+
+    def test_edgeql_ir_schema_expr_03(self):
+        view = self.schema.get('test::EarthOrFireCard')
+        text = view.get_expr(self.schema).text
+
+        for _ in range(2):
+            compiler.compile_to_ir(
+                'WITH MODULE test SELECT EarthOrFireCard { name }',
+                self.schema)
+            self.assertIn(text, astutils._schema_expr_cache)
@@ -17,7 +17,10 @@
 #
 
 
+import json
 import os
+import socket
+import urllib.parse
 
 import edgedb
 
@@ -222,3 +225,102 @@ class TestHttpEdgeQL(tb.EdgeQLTestCase):
                     bad := sys::sleep(0)
                 };
             """)
+
+    def test_http_edgeql_stream_01(self):
+        # Results that do not fit in a single batch are streamed
+        # with the chunked transfer encoding.
+        query = r"""
+            WITH
+                a := {0, 1, 2, 3, 4, 5, 6, 7, 8, 9},
+                b := {0, 1, 2, 3, 4, 5, 6, 7, 8, 9},
+                c := {0, 1, 2, 3, 4, 5, 6, 7, 8, 9}
+            SELECT str_repeat('x', 200) ++ <str>(a * 100 + b * 10 + c);
+        """
+        expected = sorted('x' * 200 + str(i) for i in range(1000))
+
+        with self.http_con() as con:
+            for _ in range(2):  # the connection is kept alive
+                data, headers, status = self.http_con_request(
+                    con, {'query': query})
+
+                self.assertEqual(status, 200)
+                self.assertEqual(headers['transfer-encoding'], 'chunked')
+                self.assertNotIn('content-length', headers)
+                self.assertEqual(sorted(json.loads(data)['data']), expected)
+
+            data, headers, status = self.http_con_request(
+                con, {'query': 'SELECT 1;'})
+            self.assertEqual(status, 200)
+            self.assertNotIn('transfer-encoding', headers)
+            self.assertEqual(json.loads(data), {'data': [1]})
+
+    def test_http_edgeql_stream_02(self):
+        # Streamed results are buffered for clients that do not read
+        # them yet; other requests are served in the meantime.
+        query = r"""
+            WITH
+                a := {0, 1, 2, 3, 4, 5, 6, 7, 8, 9},
+                b := {0, 1, 2, 3, 4, 5, 6, 7, 8, 9},
+                c := {0, 1, 2, 3, 4, 5, 6, 7, 8, 9}
+            SELECT str_repeat('y', 200) ++ <str>(a * 100 + b * 10 + c);
+        """
+
+        slow_cons = []
+        try:
+            for _ in range(8):
+                sock = socket.create_connection(
+                    (self.http_host, self.http_port))
+                slow_cons.append(sock)
+                sock.sendall(
+                    f'GET /?{urllib.parse.urlencode({"query": query})} '
+                    f'HTTP/1.1\r\nHost: {self.http_host}\r\n'
+                    f'Connection: close\r\n\r\n'.encode())
+
+            for _ in range(3):
+                self.assert_edgeql_query_result('SELECT 1;', [1])
+
+            for sock in slow_cons:
+                with sock.makefile('rb') as f:
+                    response = f.read()
+                head, _, body = response.partition(b'\r\n\r\n')
+                self.assertIn(b'Transfer-Encoding: chunked', head)
+                self.assertTrue(body.endswith(b'0\r\n\r\n'))
+        finally:
+            for sock in slow_cons:
+                sock.close()
+
+    def test_http_edgeql_stream_03(self):
+        # Clients that go away in the middle of a large result do
+        # not keep the query running on the backend.
+        query = r"""
+            WITH
+                a := {0, 1, 2, 3, 4, 5, 6, 7, 8, 9},
+                b := {0, 1, 2, 3, 4, 5, 6, 7, 8, 9},
+                c := {0, 1, 2, 3, 4, 5, 6, 7, 8, 9},
+                d := {0, 1, 2, 3, 4, 5, 6, 7, 8, 9}
+            SELECT str_repeat('z', 1000) ++
+                <str>(a * 1000 + b * 100 + c * 10 + d);
+        """
+
+        for _ in range(3):
+            slow_cons = []
+            try:
+                for _ in range(8):
+                    sock = socket.create_connection(
+                        (self.http_host, self.http_port))
+                    slow_cons.append(sock)
+                    sock.sendall(
+                        f'GET /?{urllib.parse.urlencode({"query": query})} '
+                        f'HTTP/1.1\r\nHost: {self.http_host}\r\n'
+                        f'Connection: close\r\n\r\n'.encode())
+
+                # Wait for the first chunk of every response.
+                for sock in slow_cons:
+                    self.assertTrue(sock.recv(1))
+            finally:
+                for sock in slow_cons:
+                    sock.close()
+
+            # The backend connections of the abandoned queries are
+            # available again.
+            self.assert_edgeql_query_result('SELECT 1;', [1])
@@ -489,6 +489,28 @@ class TestGraphQLFunctional(tb.GraphQLTestCase):
             }],
         })
 
+    def test_graphql_functional_query_17(self):
+        # The second run of a query is served from the compiled
+        # query cache.
+        for operation_name in ['names', 'names', 'values', 'values']:
+            result = self.graphql_query(
+                r"""
+                    query names {
+                        Setting {
+                            name
+                        }
+                    }
+
+                    query values {
+                        Setting {
+                            value
+                        }
+                    }
+                """,
+                operation_name=operation_name,
+            )
+            self.assertEqual(len(result['Setting']), 2)
+
     def test_graphql_functional_view_01(self):
         self.assert_graphql_query_result(
             r"""
@@ -0,0 +1,131 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import tempfile
+import types
+import unittest
+
+from edb.server import metrics
+from edb.server import querystats
+
+
+class TestServerMetrics(unittest.TestCase):
+
+    def render(self, metric):
+        out = []
+        metric.render(out)
+        return out
+
+    def test_server_metrics_counter_01(self):
+        counter = metrics.Counter('test_total', 'Test counter.')
+        counter.inc()
+        counter.inc(2)
+
+        self.assertEqual(self.render(counter), [
+            '# HELP test_total Test counter.',
+            '# TYPE test_total counter',
+            'test_total 3',
+        ])
+
+    def test_server_metrics_histogram_01(self):
+        histogram = metrics.Histogram(
+            'test_seconds', 'Test histogram.', buckets=(0.1, 1.0, 10.0))
+        for value in (0.05, 0.1, 0.5, 1.0, 20.0):
+            histogram.observe(value)
+
+        # Buckets are cumulative and their upper bounds are inclusive.
+        self.assertEqual(self.render(histogram), [
+            '# HELP test_seconds Test histogram.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="0.1"} 2',
+            'test_seconds_bucket{le="1.0"} 4',
+            'test_seconds_bucket{le="10.0"} 4',
+            'test_seconds_bucket{le="+Inf"} 5',
+            'test_seconds_sum 21.65',
+            'test_seconds_count 5',
+        ])
+
+    def test_server_metrics_histogram_02(self):
+        histogram = metrics.Histogram('test_seconds', 'Test histogram.')
+
+        out = self.render(histogram)
+        self.assertEqual(
+            len(out), 2 + len(metrics.DEFAULT_BUCKETS) + 3)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 0', out)
+        self.assertIn('test_seconds_count 0', out)
+
+    def test_server_metrics_gauge_01(self):
+        out = []
+        metrics.render_gauge(out, 'test_connections', 'Test gauge.', [
+            (None, 3),
+            ({'db': 'main', 'port': 5656}, 1),
+            ({'name': 'a"b\\c\nd'}, 2),
+        ])
+
+        # Label values are escaped.
+        self.assertEqual(out, [
+            '# HELP test_connections Test gauge.',
+            '# TYPE test_connections gauge',
+            'test_connections 3',
+            'test_connections{db="main",port="5656"} 1',
+            'test_connections{name="a\\"b\\\\c\\nd"} 2',
+        ])
+
+    def test_server_metrics_registry_01(self):
+        registry = metrics.Registry()
+        counter = registry.new_counter('test_total', 'Test counter.')
+        histogram = registry.new_histogram(
+            'test_seconds', 'Test histogram.', buckets=(1.0,))
+        counter.inc()
+        histogram.observe(0.5)
+
+        out = []
+        registry.render(out)
+        self.assertEqual(out, [
+            '# HELP test_total Test counter.',
+            '# TYPE test_total counter',
+            'test_total 1',
+            '# HELP test_seconds Test histogram.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="1.0"} 1',
+            'test_seconds_bucket{le="+Inf"} 1',
+            'test_seconds_sum 0.5',
+            'test_seconds_count 1',
+        ])
+
+
+class TestQueryStats(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.stats = querystats.QueryStats(self._tmpdir.name)
+
+    def tearDown(self):
+        self.stats.close()
+        self._tmpdir.cleanup()
+
+    def test_server_querystats_01(self):
+        unit = types.SimpleNamespace(sql_hash=b'hash')
+        hits = metrics.compiled_query_cache_hits.value
+
+        # Cache hits of queries other than EdgeQL ones, e.g. GraphQL
+        # operations, are only counted in metrics.
+        self.stats.record_cache_hit('db', None, unit)
+        self.assertEqual(metrics.compiled_query_cache_hits.value, hits + 1)
+        self.assertEqual(len(self.stats._stats), 0)
@@ -0,0 +1,160 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import asyncio
+
+from edb.server.pgcon import pool as pgpool
+from edb.testbase import server as tb
+
+
+class FakeConnection:
+
+    def __init__(self, dbname):
+        self.dbname = dbname
+        self.terminated = False
+
+    def is_connected(self):
+        return not self.terminated
+
+    def terminate(self):
+        self.terminated = True
+
+
+class TestBackendConnectionPool(tb.TestCase):
+
+    def make_pool(self, max_capacity, *, connect=None):
+        self.connected = []
+
+        async def default_connect(dbname):
+            await asyncio.sleep(0)
+            conn = FakeConnection(dbname)
+            self.connected.append(conn)
+            return conn
+
+        return pgpool.Pool(
+            connect=connect or default_connect, max_capacity=max_capacity)
+
+    async def test_server_pool_01(self):
+        pool = self.make_pool(2)
+
+        conn1 = await pool.acquire('db')
+        conn2 = await pool.acquire('db')
+        self.assertIsNot(conn1, conn2)
+        self.assertEqual(pool.current_capacity, 2)
+
+        # The pool is at capacity: waiters are served in order as
+        # connections are released.
+        waiter1 = asyncio.ensure_future(pool.acquire('db'))
+        waiter2 = asyncio.ensure_future(pool.acquire('db'))
+        await asyncio.sleep(0.01)
+        self.assertEqual(pool.waiters_count, 2)
+        self.assertFalse(waiter1.done())
+
+        pool.release('db', conn2)
+        self.assertIs(await waiter1, conn2)
+        self.assertFalse(waiter2.done())
+
+        pool.release('db', conn1)
+        self.assertIs(await waiter2, conn1)
+        self.assertEqual(len(self.connected), 2)
+
+        pool.close()
+
+    async def test_server_pool_02(self):
+        pool = self.make_pool(1)
+
+        conn1 = await pool.acquire('db1')
+        pool.release('db1', conn1)
+        self.assertEqual(pool.idle_count, 1)
+
+        # An idle connection to another database is closed to make
+        # room for a new one.
+        conn2 = await pool.acquire('db2')
+        self.assertEqual(conn2.dbname, 'db2')
+        self.assertTrue(conn1.terminated)
+        self.assertEqual(pool.current_capacity, 1)
+        self.assertEqual(pool.idle_count, 0)
+
+        # Discarded connections free their slot.
+        pool.release('db2', conn2, discard=True)
+        self.assertTrue(conn2.terminated)
+        self.assertEqual(pool.current_capacity, 0)
+
+        pool.close()
+
+    async def test_server_pool_03(self):
+        attempts = 0
+
+        async def connect(dbname):
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                raise ConnectionRefusedError('no backend')
+            return FakeConnection(dbname)
+
+        pool = self.make_pool(1, connect=connect)
+
+        # Connection errors are raised in the waiter and the slot
+        # is freed.
+        with self.assertRaises(ConnectionRefusedError):
+            await pool.acquire('db')
+        self.assertEqual(pool.current_capacity, 0)
+
+        conn = await pool.acquire('db')
+        self.assertEqual(conn.dbname, 'db')
+
+        pool.close()
+
+    async def test_server_pool_04(self):
+        connecting = asyncio.Event()
+
+        async def connect(dbname):
+            connecting.set()
+            await asyncio.sleep(10)
+
+        pool = self.make_pool(1, connect=connect)
+
+        waiter = asyncio.ensure_future(pool.acquire('db'))
+        await connecting.wait()
+
+        # Closing the pool stops pending connection attempts.
+        pool.close()
+        with self.assertRaises(RuntimeError):
+            await waiter
+        await asyncio.sleep(0)
+        self.assertEqual(pool.current_capacity, 0)
+        self.assertFalse(pool._connect_tasks)
+
+        with self.assertRaises(RuntimeError):
+            await pool.acquire('db')
+
+    async def test_server_pool_05(self):
+        pool = self.make_pool(1)
+
+        waiter = asyncio.ensure_future(pool.acquire('db'))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0.01)
+
+        # The connection opened for a cancelled waiter is kept idle.
+        self.assertEqual(pool.current_capacity, 1)
+        self.assertEqual(pool.idle_count, 1)
+        self.assertIs(await pool.acquire('db'), self.connected[0])
+
+        pool.close()
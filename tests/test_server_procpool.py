@@ -0,0 +1,857 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import asyncio
+import os
+import pickle
+import signal
+import struct
+import sys
+import tempfile
+import time
+import unittest
+
+import immutables
+
+from edb import edgeql
+from edb import errors
+from edb.common import supervisor
+from edb.server.compiler import compiler
+from edb.server.mng_port import port as mng_port
+from edb.server.procpool import amsg
+from edb.server.procpool import pool as procpool
+from edb.server.procpool import serialization
+from edb.testbase import server as tb
+
+
+class FramedProtocol(amsg.BaseFramedProtocol):
+
+    def __init__(self):
+        super().__init__(loop=None)
+        self.messages = []
+
+    def process_message(self, req_id, msg):
+        self.messages.append((req_id, bytes(msg)))
+
+    def feed(self, data, *, chunk_size=None):
+        # Emulates a transport that fills the buffers returned by
+        # get_buffer() with at most *chunk_size* bytes at a time.
+        data = memoryview(data)
+        while data:
+            buf = self.get_buffer(-1)
+            nbytes = min(len(buf), len(data))
+            if chunk_size is not None:
+                nbytes = min(nbytes, chunk_size)
+            buf[:nbytes] = data[:nbytes]
+            data = data[nbytes:]
+            self.buffer_updated(nbytes)
+
+
+def frame(req_id, payload):
+    return struct.pack('!IQ', len(payload), req_id) + payload
+
+
+class TestFramedProtocol(unittest.TestCase):
+
+    def test_server_procpool_framing_01(self):
+        proto = FramedProtocol()
+        msgs = [(1, b'a'), (2, b''), (7, b'bc' * 100)]
+
+        proto.feed(b''.join(frame(*msg) for msg in msgs))
+        self.assertEqual(proto.messages, msgs)
+
+        # Messages split at every byte are reassembled.
+        proto.messages.clear()
+        proto.feed(b''.join(frame(*msg) for msg in msgs), chunk_size=1)
+        self.assertEqual(proto.messages, msgs)
+
+    def test_server_procpool_framing_02(self):
+        proto = FramedProtocol()
+        payload = bytes(range(256)) * 1000
+        msgs = [(i, payload[:i * 1000]) for i in range(1, 20)]
+
+        # The buffer wraps around many times; incomplete messages are
+        # moved to its start.
+        data = b''.join(frame(*msg) for msg in msgs) * 10
+        proto.feed(data, chunk_size=10007)
+        self.assertEqual(proto.messages, msgs * 10)
+        self.assertIsNone(proto._large_msg)
+
+    def test_server_procpool_framing_03(self):
+        proto = FramedProtocol()
+        large = bytes(range(256)) * (amsg.RECV_BUFFER_SIZE // 256 * 3)
+        msgs = [(1, b'before'), (2, large), (3, b'after'), (4, large)]
+
+        # Messages larger than the buffer are received into buffers
+        # of their own.
+        for chunk_size in (None, 4096, 65537):
+            proto.messages.clear()
+            proto.feed(
+                b''.join(frame(*msg) for msg in msgs),
+                chunk_size=chunk_size)
+            self.assertEqual(proto.messages, msgs)
+            self.assertIsNone(proto._large_msg)
+
+    def test_server_procpool_framing_04(self):
+        pids = []
+        proto = amsg.HubProtocol(
+            loop=None, on_pid=lambda proto, tr, pid: pids.append(pid))
+        loop = asyncio.new_event_loop()
+        try:
+            waiter = loop.create_future()
+            proto._msg_waiters[5] = waiter
+
+            # Workers send their PID first.
+            data = struct.pack('!I', 1234) + frame(5, b'reply')
+            for i in range(len(data)):
+                buf = proto.get_buffer(-1)
+                buf[:1] = data[i:i + 1]
+                proto.buffer_updated(1)
+
+            self.assertEqual(pids, [1234])
+            self.assertEqual(waiter.result(), b'reply')
+        finally:
+            loop.close()
+
+
+class TestRequestSerialization(unittest.TestCase):
+
+    def roundtrip(self, encoder, decoder, obj):
+        data = encoder.dumps(obj)
+        return data, decoder.loads(data)
+
+    def test_server_procpool_serialization_01(self):
+        encoder = serialization.RequestEncoder()
+        decoder = serialization.RequestDecoder()
+        config = immutables.Map({'a': 1, 'b': immutables.Map({'c': 'd'})})
+
+        data1, result = self.roundtrip(encoder, decoder, ('q1', config))
+        self.assertEqual(result, ('q1', config))
+
+        # A mapping sent before is referred to by its number.
+        data2, result = self.roundtrip(encoder, decoder, ('q2', config))
+        self.assertEqual(result, ('q2', config))
+        self.assertLess(len(data2), len(data1))
+
+        # A new, equal mapping is sent again.
+        data3, result = self.roundtrip(
+            encoder, decoder, ('q3', immutables.Map(config)))
+        self.assertEqual(result, ('q3', config))
+        self.assertGreater(len(data3), len(data2))
+
+    def test_server_procpool_serialization_02(self):
+        encoder = serialization.RequestEncoder()
+        decoder = serialization.RequestDecoder()
+
+        # Equal mappings with values of different types are not
+        # confused.
+        for value in (1, True, 1.0, 1, True, 1.0):
+            _, result = self.roundtrip(
+                encoder, decoder, immutables.Map({'x': value}))
+            self.assertIs(type(result['x']), type(value))
+
+    def test_server_procpool_serialization_03(self):
+        encoder = serialization.RequestEncoder()
+        decoder = serialization.RequestDecoder()
+        config = immutables.Map({'a': 1})
+
+        # A request that cannot be encoded does not define mappings
+        # the worker never receives.
+        with self.assertRaises((pickle.PicklingError, AttributeError,
+                                TypeError)):
+            encoder.dumps((config, lambda: None))
+
+        _, result = self.roundtrip(encoder, decoder, config)
+        self.assertEqual(result, config)
+
+
+class FakeTransport:
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writelines(self, data):
+        for chunk in data:
+            self.data.extend(chunk)
+
+
+class TestHubProtocol(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.pids = []
+        self.proto = amsg.HubProtocol(
+            loop=self.loop,
+            on_pid=lambda proto, tr, pid: self.pids.append(pid))
+        self.transport = FakeTransport()
+        self.proto.connection_made(self.transport)
+        self.proto.data_received(struct.pack('!I', 42))
+
+    def tearDown(self):
+        self.loop.close()
+
+    def send(self, payload):
+        waiter = self.loop.create_future()
+        self.proto.send(waiter, payload)
+        return waiter
+
+    def sent(self):
+        # Returns the (request ID, payload) of the sent messages.
+        data = bytes(self.transport.data)
+        messages = []
+        while data:
+            msg_len, req_id = struct.unpack_from('!IQ', data)
+            end = amsg.HEADER_SIZE + msg_len
+            messages.append((req_id, data[amsg.HEADER_SIZE:end]))
+            data = data[end:]
+        return messages
+
+    def reply(self, req_id, payload):
+        self.proto.data_received(
+            struct.pack('!IQ', len(payload), req_id) + payload)
+
+    def test_server_procpool_multiplexing_01(self):
+        self.assertEqual(self.pids, [42])
+
+        w1 = self.send(b'request-1')
+        w2 = self.send(b'request-2')
+        w3 = self.send(b'request-3')
+        (id1, msg1), (id2, msg2), (id3, msg3) = self.sent()
+        self.assertEqual(len({id1, id2, id3}), 3)
+        self.assertEqual([msg1, msg2, msg3],
+                         [b'request-1', b'request-2', b'request-3'])
+
+        # Replies are matched with their requests by ID, in
+        # whatever order they arrive.
+        self.reply(id3, b'reply-3')
+        self.assertFalse(w1.done())
+        self.assertFalse(w2.done())
+        self.assertEqual(w3.result(), b'reply-3')
+
+        self.reply(id1, b'reply-1')
+        self.reply(id2, b'reply-2')
+        self.assertEqual(w1.result(), b'reply-1')
+        self.assertEqual(w2.result(), b'reply-2')
+        self.assertEqual(self.proto._msg_waiters, {})
+
+    def test_server_procpool_multiplexing_02(self):
+        w1 = self.send(b'request-1')
+        w2 = self.send(b'request-2')
+        (id1, _), (id2, _) = self.sent()
+
+        # The reply to a cancelled call is dropped.
+        w1.cancel()
+        self.reply(id1, b'reply-1')
+        self.reply(id1, b'unexpected')
+        self.assertFalse(w2.done())
+
+        self.reply(id2, b'reply-2')
+        self.assertEqual(w2.result(), b'reply-2')
+
+    def test_server_procpool_multiplexing_03(self):
+        w1 = self.send(b'request-1')
+        w2 = self.send(b'request-2')
+
+        # All calls in flight fail when the worker goes away.
+        self.proto.connection_lost(None)
+        for waiter in (w1, w2):
+            with self.assertRaises(ConnectionError):
+                waiter.result()
+        self.assertTrue(self.proto._closed)
+
+
+class FakeWorker:
+
+    def __init__(self, manager):
+        self._manager = manager
+        self._last_used = time.monotonic()
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+        self._manager._stats_killed += 1
+        self._manager._workers.discard(self)
+
+
+class FakeManager(procpool.Manager):
+
+    async def _spawn_worker(self):
+        self._stats_spawned += 1
+        await asyncio.sleep(0)
+        return FakeWorker(self)
+
+
+class TestProcPoolManager(tb.TestCase):
+
+    async def start_manager(self, *, min_pool_size, max_pool_size):
+        manager = FakeManager(
+            worker_cls=object, worker_args=(),
+            loop=asyncio.get_running_loop(), name='test',
+            runstate_dir='/nonexistent',
+            min_pool_size=min_pool_size, max_pool_size=max_pool_size,
+            use_forkserver=False)
+        # Start the manager without a socket server and a reaper task.
+        manager._sup = await supervisor.Supervisor.create()
+        manager._running = True
+        manager._refill_pool()
+        await self.settle(manager)
+        return manager
+
+    async def settle(self, manager):
+        while manager._pool_spawning:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    async def test_server_procpool_manager_01(self):
+        manager = await self.start_manager(min_pool_size=1, max_pool_size=3)
+        self.assertEqual(manager.get_stats(), {
+            'spawned': 1,
+            'killed': 0,
+            'workers': 0,
+            'buffered': 1,
+            'buffer_target': 1,
+        })
+
+        # The buffer follows the recent demand for workers, up to
+        # its maximum size.
+        workers = []
+        for _ in range(5):
+            workers.append(await manager.spawn_worker())
+            await self.settle(manager)
+
+        stats = manager.get_stats()
+        self.assertEqual(stats['workers'], 5)
+        self.assertEqual(stats['buffer_target'], 3)
+        self.assertEqual(stats['buffered'], 3)
+        self.assertEqual(stats['spawned'], 8)
+
+        # Requests older than the demand window do not count.
+        manager._spawn_requests = type(manager._spawn_requests)(
+            t - procpool.BUFFER_DEMAND_WINDOW - 1
+            for t in manager._spawn_requests)
+        self.assertEqual(manager.get_stats()['buffer_target'], 1)
+
+        await manager._sup.cancel()
+
+    async def test_server_procpool_manager_02(self):
+        manager = await self.start_manager(min_pool_size=1, max_pool_size=3)
+        for _ in range(3):
+            await manager.spawn_worker()
+            await self.settle(manager)
+        self.assertEqual(len(manager._workers_pool), 3)
+
+        # Nothing is reaped while the demand is high.
+        manager._reap_idle()
+        await self.settle(manager)
+        self.assertEqual(manager.get_stats()['killed'], 0)
+
+        manager._spawn_requests.clear()
+        buffered = list(manager._workers_pool)
+        # The oldest buffered worker is at the right end.
+        expired = time.monotonic() - procpool.WORKER_IDLE_TIMEOUT - 1
+        buffered[-1]._last_used = expired
+        buffered[-2]._last_used = expired
+
+        # Workers idle for too long are terminated, but only down to
+        # the target size.
+        manager._reap_idle()
+        await self.settle(manager)
+        self.assertEqual(list(manager._workers_pool), buffered[:1])
+        self.assertTrue(buffered[-1].closed)
+        self.assertTrue(buffered[-2].closed)
+
+        stats = manager.get_stats()
+        self.assertEqual(stats['killed'], 2)
+        self.assertEqual(stats['buffered'], 1)
+        self.assertEqual(stats['buffer_target'], 1)
+
+        # Workers that are not idle for long enough are kept.
+        manager._min_pool_size = 0
+        manager._reap_idle()
+        await self.settle(manager)
+        self.assertEqual(list(manager._workers_pool), buffered[:1])
+
+        await manager._sup.cancel()
+
+
+class FakeCallWorker:
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = []
+        self.gate = None
+
+    async def call(self, method_name, *args):
+        self.calls.append((method_name, *args))
+        if self.gate is not None:
+            await self.gate.wait()
+        return self.name
+
+
+class FakePoolManager:
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._name = 'test'
+        self._spawned = 0
+
+    async def spawn_worker(self):
+        self._spawned += 1
+        return FakeCallWorker(f'w{self._spawned}')
+
+
+class TestProcPool(tb.TestCase):
+
+    async def start_pool(self, *, size, max_calls_per_worker):
+        pool = procpool.Pool(
+            FakePoolManager(), size=size,
+            max_calls_per_worker=max_calls_per_worker)
+        await pool.start()
+        return pool
+
+    async def test_server_procpool_pool_01(self):
+        pool = await self.start_pool(size=2, max_calls_per_worker=2)
+        w1, w2 = pool.iter_workers()
+        gate = asyncio.Event()
+        w1.gate = w2.gate = gate
+
+        # Calls are spread over the least busy workers, up to
+        # max_calls_per_worker calls per worker.
+        calls = [asyncio.ensure_future(pool.call('m', i)) for i in range(5)]
+        await asyncio.sleep(0.01)
+        self.assertEqual(len(w1.calls), 2)
+        self.assertEqual(len(w2.calls), 2)
+        self.assertEqual(pool.get_stats(), {
+            'size': 2, 'calls': 4, 'waiters': 1})
+
+        gate.set()
+        results = await asyncio.gather(*calls)
+        self.assertEqual(
+            sorted(results),
+            ['w1'] * len(w1.calls) + ['w2'] * len(w2.calls))
+        self.assertEqual(len(w1.calls) + len(w2.calls), 5)
+        self.assertEqual(pool.get_stats(), {
+            'size': 2, 'calls': 0, 'waiters': 0})
+
+    async def test_server_procpool_pool_02(self):
+        pool = await self.start_pool(size=2, max_calls_per_worker=1)
+        w1, w2 = pool.iter_workers()
+        w1.gate = asyncio.Event()
+
+        busy = asyncio.ensure_future(pool.call('m', worker=w1))
+        await asyncio.sleep(0)
+
+        # A call for a busy worker waits for that worker even though
+        # another one is free.
+        pinned = asyncio.ensure_future(pool.call('pinned', worker=w1))
+        await asyncio.sleep(0.01)
+        self.assertFalse(pinned.done())
+        self.assertEqual(await pool.call('free'), 'w2')
+
+        w1.gate.set()
+        self.assertEqual(await busy, 'w1')
+        self.assertEqual(await pinned, 'w1')
+        self.assertEqual(w1.calls, [('m',), ('pinned',)])
+
+    async def test_server_procpool_pool_03(self):
+        pool = await self.start_pool(size=2, max_calls_per_worker=2)
+        self.assertEqual(sorted(await pool.call_all('m', 1)), ['w1', 'w2'])
+        for worker in pool.iter_workers():
+            self.assertEqual(worker.calls, [('m', 1)])
+
+    async def test_server_procpool_pool_04(self):
+        pool = await self.start_pool(size=1, max_calls_per_worker=1)
+        (w1,) = pool.iter_workers()
+        order = []
+
+        async def acquire(name, worker=None):
+            worker = await pool.acquire(worker)
+            order.append(name)
+            return worker
+
+        await pool.acquire()
+        waiters = [
+            asyncio.ensure_future(acquire('a', w1)),
+            asyncio.ensure_future(acquire('b')),
+        ]
+        await asyncio.sleep(0)
+
+        # A slot released to a queued call is not taken by a call
+        # that comes after it.
+        pool.release(w1)
+        waiters.append(asyncio.ensure_future(acquire('c')))
+        for _ in range(3):
+            await asyncio.sleep(0.01)
+            pool.release(await waiters.pop(0))
+        self.assertEqual(order, ['a', 'b', 'c'])
+        self.assertEqual(pool.get_stats(), {
+            'size': 1, 'calls': 0, 'waiters': 0})
+
+    async def test_server_procpool_pool_05(self):
+        pool = await self.start_pool(size=1, max_calls_per_worker=1)
+        (w1,) = pool.iter_workers()
+
+        await pool.acquire()
+        waiter = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+
+        # A slot freed while calls are queued goes to the queue even
+        # if it shows up before the queue has been woken up.
+        pool._calls[w1] -= 1
+        late = asyncio.ensure_future(pool.acquire())
+        await asyncio.sleep(0)
+        self.assertIs(await asyncio.wait_for(waiter, 1), w1)
+        self.assertFalse(late.done())
+
+        pool.release(w1)
+        self.assertIs(await late, w1)
+
+
+class TestCompilerConnection(tb.TestCase):
+
+    async def test_server_procpool_compiler_connection_01(self):
+        pool = procpool.Pool(FakePoolManager(), size=2)
+        await pool.start()
+        w1, w2 = pool.iter_workers()
+        con = mng_port.CompilerConnection(pool, 'con1')
+
+        with self.assertRaises(errors.InternalServerError):
+            await con.call_pinned('m')
+
+        # The worker that compiled the last request of the
+        # connection keeps its state.
+        pinned = await con.call_and_pin('compile_eql')
+        for _ in range(3):
+            self.assertEqual(await con.call_pinned('compile'), pinned)
+
+        await con.close()
+        worker = w1 if pinned == 'w1' else w2
+        self.assertEqual(worker.calls[-1], ('drop_connection_state', 'con1'))
+
+        # Closing the connection unpins it.
+        with self.assertRaises(errors.InternalServerError):
+            await con.call_pinned('m')
+
+    async def test_server_procpool_compiler_connection_02(self):
+        pool = procpool.Pool(FakePoolManager(), size=2)
+        await pool.start()
+        workers = {w.name: w for w in pool.iter_workers()}
+        con = mng_port.CompilerConnection(pool, 'con1')
+
+        first = workers[await con.call_and_pin('compile_eql')]
+
+        # A busy worker is not picked for the next transaction; the
+        # first one might still hold a state that was left behind.
+        first.gate = asyncio.Event()
+        busy = asyncio.ensure_future(pool.call('m', worker=first))
+        await asyncio.sleep(0)
+        second = workers[await con.call_and_pin('compile_eql')]
+        self.assertIsNot(second, first)
+        first.gate.set()
+        await busy
+        first.gate = None
+
+        await con.close()
+        for worker in (first, second):
+            self.assertEqual(
+                worker.calls[-1], ('drop_connection_state', 'con1'))
+
+
+class FakeTransaction:
+
+    def __init__(self, txid, implicit):
+        self.id = txid
+        self.implicit = implicit
+
+    def is_implicit(self):
+        return self.implicit
+
+
+class FakeConnectionState:
+
+    def __init__(self, txid, implicit=False):
+        self.tx = FakeTransaction(txid, implicit)
+
+    def current_tx(self):
+        return self.tx
+
+    def can_rollback_to_savepoint(self, txid):
+        return False
+
+
+class TestCompilerConnectionStates(tb.TestCase):
+
+    async def test_server_procpool_compiler_states_01(self):
+        comp = compiler.Compiler({}, None)
+
+        state = FakeConnectionState(1)
+        comp._save_state('con1', state)
+        self.assertIs(comp._load_state('con1', 1), state)
+
+        with self.assertRaises(errors.InternalServerError):
+            comp._load_state('con1', 2)
+
+        # States of implicit transactions are not kept.
+        comp._save_state('con1', FakeConnectionState(3, implicit=True))
+        with self.assertRaises(errors.InternalServerError):
+            comp._load_state('con1', 3)
+
+        comp._save_state('con2', FakeConnectionState(4))
+        await comp.drop_connection_state('con2')
+        with self.assertRaises(errors.InternalServerError):
+            comp._load_state('con2', 4)
+
+    async def test_server_procpool_compiler_states_02(self):
+        comp = compiler.Compiler({}, None)
+
+        # States of open transactions are never evicted, however many
+        # connections there are.
+        for i in range(20_000):
+            comp._save_state(f'con{i}', FakeConnectionState(i))
+        for i in range(20_000):
+            comp._load_state(f'con{i}', i)
+        for i in range(20_000):
+            await comp.drop_connection_state(f'con{i}')
+        self.assertEqual(comp._con_states, {})
+
+
+class TestCompilerParseCache(unittest.TestCase):
+
+    def test_server_procpool_compiler_parse_cache_01(self):
+        comp = compiler.Compiler({}, None)
+
+        statements = comp._parse_block('SELECT 1;')
+        self.assertEqual(len(statements), 1)
+        self.assertIn('SELECT 1;', comp._parse_cache)
+
+        # A cached text is not parsed again.
+        comp._parse_cache['SELECT 1;'] = pickle.dumps(
+            edgeql.parse_block('SELECT 2;'))
+        statements = comp._parse_block('SELECT 1;')
+        self.assertEqual(statements[0].result.value, '2')
+
+    def test_server_procpool_compiler_parse_cache_02(self):
+        comp = compiler.Compiler({}, None)
+        query = 'SELECT 1 LIMIT 2;'
+
+        # Every caller gets its own tree, which it is free to modify.
+        statements = comp._parse_block(query)
+        statements[0].limit.value = '3'
+
+        for _ in range(2):
+            cached = comp._parse_block(query)
+            self.assertIsNot(cached[0], statements[0])
+            self.assertEqual(cached[0].limit.value, '2')
+            cached[0].limit = None
+
+
+class TestCompilerDatabaseLoading(tb.TestCase):
+
+    def make_compiler(self, load):
+        comp = compiler.Compiler({}, None)
+        self.loads = []
+
+        async def load_database(dbname, dbver):
+            self.loads.append((dbname, dbver))
+            return await load(dbname, dbver)
+
+        comp._load_database = load_database
+        return comp
+
+    async def test_server_procpool_compiler_loading_01(self):
+        loaded = asyncio.Event()
+
+        async def load(dbname, dbver):
+            await loaded.wait()
+            return (dbname, dbver)
+
+        comp = self.make_compiler(load)
+
+        # Concurrent calls introspect a schema only once.
+        calls = [
+            asyncio.ensure_future(comp._get_database('db', 1))
+            for _ in range(3)
+        ]
+        other = asyncio.ensure_future(comp._get_database('db', 2))
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.loads, [('db', 1), ('db', 2)])
+
+        # A cancelled call does not cancel the loading for others.
+        calls[0].cancel()
+        loaded.set()
+        self.assertEqual(
+            await asyncio.gather(*calls[1:]), [('db', 1), ('db', 1)])
+        self.assertEqual(await other, ('db', 2))
+        self.assertEqual(comp._dbs_loading, {})
+
+    async def test_server_procpool_compiler_loading_02(self):
+        attempts = 0
+
+        async def load(dbname, dbver):
+            nonlocal attempts
+            attempts += 1
+            await asyncio.sleep(0.01)
+            if attempts == 1:
+                raise ConnectionError('no backend')
+            return (dbname, dbver)
+
+        comp = self.make_compiler(load)
+
+        # Every waiting call gets the error of a failed loading.
+        results = await asyncio.gather(
+            comp._get_database('db', 1),
+            comp._get_database('db', 1),
+            return_exceptions=True)
+        self.assertEqual(len(self.loads), 1)
+        for result in results:
+            self.assertIsInstance(result, ConnectionError)
+
+        # A failed loading is not kept.
+        self.assertEqual(await comp._get_database('db', 1), ('db', 1))
+        self.assertEqual(len(self.loads), 2)
+
+
+class EchoWorker:
+
+    def __init__(self, *args):
+        pass
+
+    async def echo(self, value):
+        return value
+
+    async def getpid(self):
+        return os.getpid()
+
+
+class TestForkServer(tb.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+        super().tearDown()
+
+    async def start_manager(self):
+        # No buffered workers: every worker is spawned on request.
+        return await procpool.create_manager(
+            runstate_dir=self._tmpdir.name, name='test',
+            worker_cls=EchoWorker, worker_args=(),
+            min_pool_size=0, max_pool_size=0)
+
+    async def wait_closed(self, worker):
+        while not worker._con.is_closed():
+            await asyncio.sleep(0.01)
+
+    async def test_server_procpool_forkserver_01(self):
+        manager = await self.start_manager()
+        try:
+            worker = await manager.spawn_worker()
+
+            # Workers are forked from the fork server.
+            self.assertIsInstance(worker._proc, procpool.ForkedProcess)
+            self.assertNotEqual(
+                worker.get_pid(), manager._forkserver._proc.pid)
+            self.assertEqual(await worker.call('getpid'), worker.get_pid())
+            self.assertEqual(await worker.call('echo', 'a'), 'a')
+        finally:
+            await manager.stop()
+
+    async def test_server_procpool_forkserver_02(self):
+        manager = await self.start_manager()
+        try:
+            worker = await manager.spawn_worker()
+            proc = worker._proc
+            pid = worker.get_pid()
+
+            # Forked workers are reaped by the fork server, which
+            # reports their exit status.
+            proc.kill()
+            self.assertEqual(
+                await asyncio.wait_for(proc.wait(), 10), -signal.SIGKILL)
+            self.assertEqual(proc.returncode, -signal.SIGKILL)
+            with self.assertRaises(ProcessLookupError):
+                os.kill(pid, 0)
+
+            # An exited process is never signalled, as its PID might
+            # have been reused.
+            with self.assertRaises(ProcessLookupError):
+                proc.terminate()
+
+            # The next call forks a new worker.
+            await asyncio.wait_for(self.wait_closed(worker), 10)
+            self.assertEqual(await worker.call('echo', 1), 1)
+            self.assertNotEqual(worker.get_pid(), pid)
+            self.assertIsInstance(worker._proc, procpool.ForkedProcess)
+        finally:
+            await manager.stop()
+
+    async def test_server_procpool_forkserver_03(self):
+        manager = await self.start_manager()
+        try:
+            async def spawn():
+                raise RuntimeError('fork server has exited')
+
+            manager._forkserver.spawn = spawn
+
+            # Workers are started with exec if forking fails.
+            with self.assertLogs('edb.server', level='WARNING'):
+                worker = await manager.spawn_worker()
+            self.assertNotIsInstance(worker._proc, procpool.ForkedProcess)
+            self.assertEqual(await worker.call('getpid'), worker.get_pid())
+            self.assertEqual(await worker.call('echo', 'a'), 'a')
+        finally:
+            await manager.stop()
+
+    async def test_server_procpool_forkserver_04(self):
+        manager = procpool.Manager(
+            loop=asyncio.get_running_loop(),
+            runstate_dir=self._tmpdir.name, name='test',
+            worker_cls=EchoWorker, worker_args=(),
+            min_pool_size=0, max_pool_size=0)
+        manager._forkserver._command_args = [
+            sys.executable, '-c', 'raise SystemExit(1)']
+
+        # Workers are started with exec if the fork server cannot
+        # be started.
+        with self.assertLogs('edb.server', level='WARNING'):
+            await manager.start()
+        try:
+            self.assertIsNone(manager._forkserver)
+            worker = await manager.spawn_worker()
+            self.assertNotIsInstance(worker._proc, procpool.ForkedProcess)
+            self.assertEqual(await worker.call('echo', 'a'), 'a')
+        finally:
+            await manager.stop()
+
+    async def test_server_procpool_forkserver_05(self):
+        manager = await self.start_manager()
+        try:
+            worker = await manager.spawn_worker()
+            proc = worker._proc
+
+            # The exit status of a forked worker that exits on its
+            # own is reported too; on SIGTERM workers call
+            # os._exit(-1).
+            os.kill(worker.get_pid(), signal.SIGTERM)
+            self.assertEqual(await asyncio.wait_for(proc.wait(), 10), 255)
+            self.assertEqual(manager._forkserver._children, {})
+        finally:
+            await manager.stop()
@@ -18,14 +18,145 @@
 
 import asyncio
 import json
+import struct
 
 import edgedb
 
+from edb import errors
 from edb.common import taskgroup as tg
 from edb.testbase import server as tb
 from edb.tools import test
 
 
+def _bytes(data: bytes) -> bytes:
+    return struct.pack('!i', len(data)) + data
+
+
+def _headers(headers=None) -> bytes:
+    headers = headers or {}
+    return struct.pack('!h', len(headers)) + b''.join(
+        struct.pack('!H', key) + _bytes(value)
+        for key, value in headers.items())
+
+
+# Encoded arguments of a statement without parameters.
+NO_ARGS = struct.pack('!i', 0)
+
+HEADER_ROW_LIMIT = 0xFF01
+HEADER_RESUME_CURSOR = 0xFF02
+
+
+class RawConnection(asyncio.Protocol):
+    """Binary protocol messages sent over an authenticated connection.
+
+    Takes over the transport of an edgedb client connection to send
+    messages that the client does not support.
+    """
+
+    def __init__(self, con=None):
+        self._transport = None
+        self._buffer = bytearray()
+        self._waiter = None
+        self._lost = False
+        if con is not None:
+            self._transport = con._transport
+            self._transport.set_protocol(self)
+
+    @classmethod
+    async def open(cls, host, port):
+        # A new connection that has not gone through the handshake.
+        _, raw = await asyncio.get_running_loop().create_connection(
+            cls, host, port)
+        return raw
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def data_received(self, data):
+        self._buffer.extend(data)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def connection_lost(self, exc):
+        self._lost = True
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_exception(ConnectionAbortedError())
+
+    def close(self):
+        self._transport.close()
+
+    def send(self, mtype: bytes, *fields: bytes):
+        data = b''.join(fields)
+        self._transport.write(mtype + struct.pack('!i', len(data) + 4) + data)
+
+    def handshake(self):
+        # Protocol version 1.0 without extensions.
+        self.send(b'V', struct.pack('!hhh', 1, 0, 0))
+
+    def connect(self, user: str, database: str):
+        self.send(b'0', _bytes(user.encode()), _bytes(database.encode()))
+
+    def cancel(self, key: bytes):
+        self.send(b'K', key)
+
+    def prepare(self, name: bytes, query: str, io_format=b'b'):
+        self.send(b'P', _headers(), io_format, b'm', _bytes(name),
+                  _bytes(query.encode()))
+
+    def execute(self, name: bytes, args=NO_ARGS, headers=None):
+        self.send(b'E', _headers(headers), _bytes(name), _bytes(args))
+
+    def close_statement(self, name: bytes):
+        self.send(b'C', _headers(), b'S', _bytes(name))
+
+    def sync(self):
+        self.send(b'S')
+
+    async def recv(self):
+        while True:
+            if len(self._buffer) >= 5:
+                mtype = bytes(self._buffer[:1])
+                (length,) = struct.unpack('!i', self._buffer[1:5])
+                if len(self._buffer) >= length + 1:
+                    body = bytes(self._buffer[5:length + 1])
+                    del self._buffer[:length + 1]
+                    return mtype, body
+            if self._lost:
+                raise ConnectionAbortedError()
+            self._waiter = asyncio.get_running_loop().create_future()
+            await self._waiter
+
+    async def recv_until_ready(self):
+        # Returns the messages received up to ReadyForCommand.
+        messages = []
+        while True:
+            mtype, body = await self.recv()
+            if mtype == b'Z':
+                return messages
+            messages.append((mtype, body))
+
+    @staticmethod
+    def parse_data(body: bytes):
+        (num,) = struct.unpack('!h', body[:2])
+        pos = 2
+        elements = []
+        for _ in range(num):
+            (length,) = struct.unpack('!i', body[pos:pos + 4])
+            elements.append(body[pos + 4:pos + 4 + length])
+            pos += 4 + length
+        return elements
+
+    @staticmethod
+    def parse_error_code(body: bytes) -> int:
+        (code,) = struct.unpack('!I', body[1:5])
+        return code
+
+    @staticmethod
+    def parse_error(body: bytes) -> str:
+        (length,) = struct.unpack('!i', body[5:9])
+        return body[9:9 + length].decode()
+
+
 class TestServerProto(tb.QueryTestCase):
 
     ISOLATED_METHODS = False
@@ -598,6 +729,33 @@ class TestServerProto(tb.QueryTestCase):
                     'select sys::advisory_unlock(<int64>$0)', lock_key),
                 [True])
 
+    async def test_server_proto_statement_timeout_01(self):
+        con2 = await self.connect(database=self.con.dbname)
+        try:
+            await con2.execute('''
+                CONFIGURE SESSION SET statement_timeout := '100ms';
+            ''')
+
+            # Postgres cancels the query and the error is reported
+            # as a timeout.
+            with self.assertRaises(edgedb.QueryTimeoutError):
+                await con2.fetchall('SELECT sys::sleep(10)')
+
+            # The connection is still usable after the timeout.
+            self.assertEqual(await con2.fetchone('SELECT 1'), 1)
+
+            # Other sessions are not affected.
+            self.assertEqual(
+                await self.con.fetchall('SELECT sys::sleep(0.3)'), [True])
+
+            await con2.execute('''
+                CONFIGURE SESSION RESET statement_timeout;
+            ''')
+            self.assertEqual(
+                await con2.fetchall('SELECT sys::sleep(0.3)'), [True])
+        finally:
+            await con2.close()
+
     async def test_server_proto_log_message_01(self):
         msgs = []
 
@@ -1739,6 +1897,484 @@ class TestServerProto(tb.QueryTestCase):
                     SELECT <test::upper_str>'123_hello';
                 """)
 
+    async def test_server_proto_compile_single_flight_01(self):
+        # Identical queries compiled concurrently are compiled once.
+        query = 'SELECT (compile_single_flight_01 := true);'
+        cons = [await self.connect(database=self.con.dbname)
+                for _ in range(5)]
+        try:
+            results = await asyncio.gather(
+                *[con.fetchall_json(query) for con in cons])
+        finally:
+            for con in cons:
+                await con.close()
+
+        for result in results:
+            self.assertEqual(
+                json.loads(result), [{'compile_single_flight_01': True}])
+
+        # The server saves the statistics periodically.
+        for _ in range(50):
+            stats = await self.con.fetchall('''
+                SELECT sys::QueryStats { compile_count }
+                FILTER .query = <str>$query
+            ''', query=query)
+            if stats:
+                break
+            await asyncio.sleep(0.1)
+
+        self.assertEqual([s.compile_count for s in stats], [1])
+
+    async def test_server_proto_compile_single_flight_02(self):
+        # Queries that differ only in formatting share compilations,
+        # but every query gets an error with positions in its own text.
+        queries = [
+            'SELECT compile_single_flight_02;',
+            '\n\nSELECT   compile_single_flight_02;',
+            '# comment\nSELECT compile_single_flight_02;',
+        ] * 2
+        cons = [await self.connect(database=self.con.dbname)
+                for _ in queries]
+        try:
+            results = await asyncio.gather(
+                *[con.fetchall(query) for con, query in zip(cons, queries)],
+                return_exceptions=True)
+        finally:
+            for con in cons:
+                await con.close()
+
+        for result in results:
+            self.assertIsInstance(result, edgedb.InvalidReferenceError)
+            self.assertIn('compile_single_flight_02', str(result))
+        self.assertEqual(
+            [(result._line, result._col) for result in results],
+            [(1, 8), (3, 10), (2, 8)] * 2)
+
+    async def raw_connect(self):
+        con = await self.connect(database=self.con.dbname)
+        return RawConnection(con)
+
+    async def test_server_proto_named_stmt_01(self):
+        raw = await self.raw_connect()
+        try:
+            raw.prepare(b'q1', 'SELECT 40 + 2;')
+            raw.prepare(b'q2', 'SELECT "named";', io_format=b'j')
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'1', b'1'])
+
+            for _ in range(2):
+                # Named statements are kept when the anonymous
+                # statement is replaced.
+                raw.prepare(b'', 'SELECT 1;')
+                raw.execute(b'q1')
+                raw.execute(b'q2')
+                raw.sync()
+                messages = await raw.recv_until_ready()
+                self.assertEqual(
+                    [m for m, _ in messages],
+                    [b'1', b'D', b'C', b'D', b'C'])
+                self.assertEqual(
+                    raw.parse_data(messages[1][1]), [struct.pack('!q', 42)])
+                self.assertIn(b'named', raw.parse_data(messages[3][1])[0])
+        finally:
+            raw.close()
+
+    async def test_server_proto_named_stmt_02(self):
+        raw = await self.raw_connect()
+        try:
+            raw.prepare(b'q1', 'SELECT 1;')
+            raw.sync()
+            await raw.recv_until_ready()
+
+            raw.close_statement(b'q1')
+            # Closing a statement that does not exist is not an error.
+            raw.close_statement(b'q1')
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'3', b'3'])
+
+            raw.execute(b'q1')
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'E'])
+            self.assertIn('does not exist', raw.parse_error(messages[0][1]))
+
+            # The name can be used again.
+            raw.prepare(b'q1', 'SELECT 2;')
+            raw.execute(b'q1')
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'1', b'D', b'C'])
+            self.assertEqual(
+                raw.parse_data(messages[1][1]), [struct.pack('!q', 2)])
+
+            # The anonymous statement cannot be closed.
+            raw.close_statement(b'')
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'E'])
+            self.assertIn('anonymous', raw.parse_error(messages[0][1]))
+        finally:
+            raw.close()
+
+    async def test_server_proto_named_stmt_03(self):
+        raw = await self.raw_connect()
+        try:
+            names = [f'q{i}'.encode() for i in range(1001)]
+            for name in names:
+                raw.prepare(name, 'SELECT 1;')
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual(
+                [m for m, _ in messages], [b'1'] * 1000 + [b'E'])
+            self.assertIn(
+                'too many prepared statements',
+                raw.parse_error(messages[-1][1]))
+
+            # Existing statements can be replaced, and closing one
+            # makes room for another.
+            raw.prepare(names[0], 'SELECT 2;')
+            raw.close_statement(names[1])
+            raw.prepare(names[1000], 'SELECT 3;')
+            raw.execute(names[1000])
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual(
+                [m for m, _ in messages], [b'1', b'3', b'1', b'D', b'C'])
+        finally:
+            raw.close()
+
+    async def test_server_proto_named_stmt_04(self):
+        raw = await self.raw_connect()
+        try:
+            self.assertEqual(
+                await self.raw_run(raw, 'START TRANSACTION;'), [b'1', b'C'])
+
+            raw.prepare(b'c', 'SELECT {1, 2, 3};')
+            self.fetch_cursor(raw, b'c', 1)
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'1', b'D', b's'])
+
+            # Closing a name that was never prepared is not an error
+            # and leaves the other statements and cursors alone.
+            raw.close_statement(b'never_prepared')
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'3'])
+
+            self.fetch_cursor(raw, b'c', 1, resume=True)
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'D', b's'])
+            self.assertEqual(self.get_rows(messages), [2])
+
+            # Closing a statement closes its cursor too.
+            raw.close_statement(b'c')
+            self.fetch_cursor(raw, b'c', 1, resume=True)
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'3', b'E'])
+            self.assertIn(
+                'no suspended cursor', raw.parse_error(messages[1][1]))
+
+            self.assertEqual(
+                await self.raw_run(raw, 'ROLLBACK;'), [b'1', b'C'])
+
+            raw.send(b'C', _headers(), b'X', _bytes(b'c'))
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'E'])
+            self.assertIn('aspect', raw.parse_error(messages[0][1]))
+        finally:
+            raw.close()
+
+    async def raw_run(self, raw, query):
+        raw.prepare(b'', query)
+        raw.execute(b'')
+        raw.sync()
+        return [m for m, _ in await raw.recv_until_ready()]
+
+    def fetch_cursor(self, raw, name, row_limit, *, resume=False):
+        headers = {HEADER_ROW_LIMIT: struct.pack('!i', row_limit)}
+        if resume:
+            headers[HEADER_RESUME_CURSOR] = b''
+        raw.execute(name, headers=headers)
+
+    def get_rows(self, messages):
+        return [
+            struct.unpack('!q', RawConnection.parse_data(body)[0])[0]
+            for mtype, body in messages if mtype == b'D'
+        ]
+
+    def big_result_query(self):
+        # 10000 rows of about 1KB, much more than socket buffers hold.
+        digits = '{0, 1, 2, 3, 4, 5, 6, 7, 8, 9}'
+        return f'''
+            WITH
+                a := {digits},
+                b := {digits},
+                c := {digits},
+                d := {digits}
+            SELECT
+                str_repeat('x', 1000) ++
+                <str>(a + b * 10 + c * 100 + d * 1000);
+        '''
+
+    async def test_server_proto_backpressure_01(self):
+        raw = await self.raw_connect()
+        try:
+            # The client does not read the result for a while: the
+            # server stops reading from Postgres until it catches up.
+            raw._transport.pause_reading()
+            raw.prepare(b'', self.big_result_query())
+            raw.execute(b'')
+            raw.sync()
+            await asyncio.sleep(0.5)
+            raw._transport.resume_reading()
+
+            messages = await raw.recv_until_ready()
+            rows = [body for mtype, body in messages if mtype == b'D']
+            self.assertEqual(len(rows), 10000)
+            self.assertEqual(
+                sorted(int(raw.parse_data(row)[0][1000:]) for row in rows),
+                list(range(10000)))
+            self.assertEqual(messages[-1][0], b'C')
+
+            self.assertEqual(
+                await self.raw_run(raw, 'SELECT 1;'), [b'1', b'D', b'C'])
+        finally:
+            raw.close()
+
+    async def test_server_proto_backpressure_02(self):
+        lock_key = tb.gen_lock_key()
+        raw = await self.raw_connect()
+        try:
+            self.assertEqual(
+                await self.raw_run(raw, 'START TRANSACTION;'), [b'1', b'C'])
+            self.assertEqual(
+                await self.raw_run(
+                    raw, f'SELECT sys::advisory_lock({lock_key});'),
+                [b'1', b'D', b'C'])
+
+            raw._transport.pause_reading()
+            raw.prepare(b'', self.big_result_query())
+            raw.execute(b'')
+            raw.sync()
+            await asyncio.sleep(0.5)
+        finally:
+            # The client goes away in the middle of the result.
+            raw.close()
+
+        # The query is cancelled and its backend connection dropped,
+        # which releases the lock.
+        self.assertEqual(
+            await asyncio.wait_for(
+                self.con.fetchall(
+                    'SELECT sys::advisory_lock(<int64>$0)', lock_key),
+                10),
+            [True])
+        self.assertEqual(
+            await self.con.fetchall(
+                'SELECT sys::advisory_unlock(<int64>$0)', lock_key),
+            [True])
+
+    async def test_server_proto_cursor_01(self):
+        raw = await self.raw_connect()
+        try:
+            self.assertEqual(
+                await self.raw_run(raw, 'START TRANSACTION;'), [b'1', b'C'])
+
+            raw.prepare(b'c', 'SELECT {1, 2, 3, 4, 5};')
+            self.fetch_cursor(raw, b'c', 2)
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual(
+                [m for m, _ in messages], [b'1', b'D', b'D', b's'])
+            self.assertEqual(self.get_rows(messages), [1, 2])
+
+            # The suspended cursor is resumed across Sync messages.
+            self.fetch_cursor(raw, b'c', 2, resume=True)
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'D', b'D', b's'])
+            self.assertEqual(self.get_rows(messages), [3, 4])
+
+            self.fetch_cursor(raw, b'c', 2, resume=True)
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'D', b'C'])
+            self.assertEqual(self.get_rows(messages), [5])
+
+            # An exhausted cursor cannot be resumed.
+            self.fetch_cursor(raw, b'c', 2, resume=True)
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'E'])
+            self.assertIn(
+                'no suspended cursor', raw.parse_error(messages[0][1]))
+        finally:
+            raw.close()
+
+    async def test_server_proto_cursor_02(self):
+        raw = await self.raw_connect()
+        try:
+            # Cursors are closed at the end of a transaction, so
+            # they cannot be opened outside of one.
+            raw.prepare(b'c', 'SELECT {1, 2, 3};')
+            self.fetch_cursor(raw, b'c', 2)
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'1', b'E'])
+            self.assertIn(
+                'within a transaction', raw.parse_error(messages[1][1]))
+
+            self.fetch_cursor(raw, b'c', 2, resume=True)
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'E'])
+            self.assertIn(
+                'no suspended cursor', raw.parse_error(messages[0][1]))
+
+            raw.execute(b'c', headers={HEADER_RESUME_CURSOR: b''})
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'E'])
+            self.assertIn(
+                'requires the ROW_LIMIT header',
+                raw.parse_error(messages[0][1]))
+
+            # The statement can still be executed without a cursor.
+            raw.execute(b'c')
+            raw.sync()
+            messages = await raw.recv_until_ready()
+            self.assertEqual(self.get_rows(messages), [1, 2, 3])
+        finally:
+            raw.close()
+
+    async def test_server_proto_cursor_03(self):
+        raw = await self.raw_connect()
+        try:
+            for end in ['COMMIT;', 'ROLLBACK;']:
+                self.assertEqual(
+                    await self.raw_run(raw, 'START TRANSACTION;'),
+                    [b'1', b'C'])
+
+                raw.prepare(b'c', 'SELECT {1, 2, 3};')
+                self.fetch_cursor(raw, b'c', 1)
+                raw.sync()
+                messages = await raw.recv_until_ready()
+                self.assertEqual(
+                    [m for m, _ in messages], [b'1', b'D', b's'])
+
+                self.assertEqual(await self.raw_run(raw, end), [b'1', b'C'])
+
+                # Cursors do not survive the end of their transaction,
+                # not even in the next transaction.
+                self.assertEqual(
+                    await self.raw_run(raw, 'START TRANSACTION;'),
+                    [b'1', b'C'])
+                self.fetch_cursor(raw, b'c', 1, resume=True)
+                raw.sync()
+                messages = await raw.recv_until_ready()
+                self.assertEqual([m for m, _ in messages], [b'E'])
+                self.assertIn(
+                    'no suspended cursor', raw.parse_error(messages[0][1]))
+
+                self.assertEqual(
+                    await self.raw_run(raw, 'ROLLBACK;'), [b'1', b'C'])
+        finally:
+            raw.close()
+
+    async def test_server_proto_query_normalization_01(self):
+        # Queries that differ only in literals share a compiled query;
+        # make sure every one of them gets its own values.
+        for i in range(3):
+            self.assertEqual(
+                await self.con.fetchone(f'SELECT {i} + 10'),
+                i + 10)
+            self.assertEqual(
+                await self.con.fetchone(f'SELECT -{i}.5 * 2'),
+                -(i + 0.5) * 2)
+            self.assertEqual(
+                await self.con.fetchone(f'SELECT <str>{i}n'),
+                str(i))
+            self.assertEqual(
+                await self.con.fetchone(f'SELECT "a{i}" ++ r"\\n"'),
+                f'a{i}\\n')
+            self.assertEqual(
+                await self.con.fetchone(f"SELECT 'it\\'s {i}\\n'"),
+                f"it's {i}\n")
+
+    async def test_server_proto_query_normalization_02(self):
+        await self.con.execute('''
+            INSERT test::Tmp { tmp := 'norm_1' };
+            INSERT test::Tmp { tmp := 'norm_2' };
+        ''')
+
+        try:
+            for name in ['norm_1', 'norm_2']:
+                # A constant LIMIT 1 makes the result a singleton.
+                self.assertEqual(
+                    await self.con.fetchone(f'''
+                        SELECT test::Tmp.tmp
+                        FILTER test::Tmp.tmp = '{name}'
+                        LIMIT 1
+                    '''),
+                    name)
+
+                self.assertEqual(
+                    await self.con.fetchone(f'''
+                        SELECT test::Tmp.tmp
+                        FILTER test::Tmp.tmp = '{name}'
+                        LIMIT ((1))
+                    '''),
+                    name)
+
+                self.assertEqual(
+                    await self.con.fetchone(f'''
+                        SELECT ('{name}', 1).0
+                    '''),
+                    name)
+        finally:
+            await self.con.execute('''
+                DELETE test::Tmp;
+            ''')
+
+    async def test_server_proto_query_normalization_03(self):
+        with self.assertRaisesRegex(edgedb.QueryError,
+                                    r'parameter names.*are reserved'):
+            await self.con.fetchone(
+                'SELECT <str>$__edb_arg_0', __edb_arg_0='a')
+
+        # Literals of queries with parameters are left in place.
+        self.assertEqual(
+            await self.con.fetchall('SELECT <str>$x ++ "b"', x='a'),
+            edgedb.Set(['ab']))
+
+    async def test_server_proto_query_normalization_04(self):
+        # Queries that differ only in formatting share a compiled query.
+        queries = [
+            'SELECT (1, 2).1 LIMIT 1',
+            'SELECT (1,2).1 LIMIT 1',
+            '  SELECT\n( 1 , 2 ).1  # comment\nLIMIT 1  ',
+            'SELECT (1, 2).1 LIMIT 1 # comment',
+        ]
+        for query in queries:
+            self.assertEqual(await self.con.fetchone(query), 2)
+            self.assertEqual(
+                await self.con.fetchall(query),
+                edgedb.Set([2]))
+
+    async def test_server_proto_query_normalization_05(self):
+        # Keywords can be identifiers, which are case-sensitive, so
+        # queries that differ in their case must not share a
+        # compiled query.
+        for name in ['Abstract', 'abstract', 'ABSTRACT', 'Abstract']:
+            r = await self.con.fetchall_json(f'SELECT ({name} := 1)')
+            self.assertEqual(json.loads(r), [{name: 1}])
+
 
 class TestServerProtoDDL(tb.NonIsolatedDDLTestCase):
 
@@ -2198,3 +2834,228 @@ class TestServerProtoDDL(tb.NonIsolatedDDLTestCase):
 
         finally:
             await self.con.execute('ROLLBACK')
+
+    async def _wait_for_compile_count(self, query, count):
+        # The server saves the statistics periodically.
+        for _ in range(50):
+            stats = await self.con.fetchall('''
+                SELECT sys::QueryStats { compile_count }
+                FILTER .query = <str>$query
+            ''', query=query)
+            if stats and stats[0].compile_count >= count:
+                break
+            await asyncio.sleep(0.1)
+        return [s.compile_count for s in stats]
+
+    async def test_server_proto_query_cache_warmup_01(self):
+        # Queries that were served from the cache are recompiled
+        # after DDL, the others are left to their next use.
+        hot_query = 'SELECT (query_cache_warmup_01_hot := true);'
+        cold_query = 'SELECT (query_cache_warmup_01_cold := true);'
+
+        for _ in range(5):
+            await self.con.fetchall_json(hot_query)
+        await self.con.fetchall_json(cold_query)
+
+        self.assertEqual(
+            await self._wait_for_compile_count(hot_query, 1), [1])
+        self.assertEqual(
+            await self._wait_for_compile_count(cold_query, 1), [1])
+
+        await self.con.execute('''
+            CREATE TYPE test::CacheWarmup_01;
+        ''')
+        try:
+            self.assertEqual(
+                await self._wait_for_compile_count(hot_query, 2), [2])
+            self.assertEqual(
+                await self._wait_for_compile_count(cold_query, 1), [1])
+
+            # The recompiled query is served from the cache.
+            self.assertEqual(
+                json.loads(await self.con.fetchall_json(hot_query)),
+                [{'query_cache_warmup_01_hot': True}])
+            self.assertEqual(
+                await self._wait_for_compile_count(hot_query, 2), [2])
+        finally:
+            await self.con.execute('''
+                DROP TYPE test::CacheWarmup_01;
+            ''')
+
+    async def test_server_proto_query_cache_warmup_02(self):
+        # A hot query that no longer compiles after DDL does not stop
+        # the warm-up, nor leaves anything behind in the cache.
+        await self.con.execute('''
+            CREATE TYPE test::CacheWarmup_02 {
+                CREATE PROPERTY prop1 -> std::str;
+            };
+            INSERT test::CacheWarmup_02 { prop1 := 'aaa' };
+        ''')
+        try:
+            broken_query = 'SELECT test::CacheWarmup_02.prop1;'
+            hot_query = 'SELECT (query_cache_warmup_02_hot := true);'
+
+            for _ in range(5):
+                self.assertEqual(
+                    await self.con.fetchall(broken_query),
+                    edgedb.Set(['aaa']))
+                await self.con.fetchall_json(hot_query)
+
+            self.assertEqual(
+                await self._wait_for_compile_count(hot_query, 1), [1])
+
+            await self.con.execute('''
+                ALTER TYPE test::CacheWarmup_02 {
+                    DROP PROPERTY prop1;
+                };
+            ''')
+
+            self.assertEqual(
+                await self._wait_for_compile_count(hot_query, 2), [2])
+
+            with self.assertRaisesRegex(edgedb.InvalidReferenceError,
+                                        'prop1'):
+                await self.con.fetchall(broken_query)
+
+            await self.con.execute('''
+                ALTER TYPE test::CacheWarmup_02 {
+                    CREATE PROPERTY prop1 -> std::int64;
+                };
+                UPDATE test::CacheWarmup_02 SET { prop1 := 123 };
+            ''')
+
+            self.assertEqual(
+                await self.con.fetchall(broken_query),
+                edgedb.Set([123]))
+        finally:
+            await self.con.execute('''
+                DROP TYPE test::CacheWarmup_02;
+            ''')
+
+    async def raw_open(self):
+        conargs = self.get_connect_args()
+        raw = await RawConnection.open(conargs['host'], conargs['port'])
+        raw.handshake()
+        return raw
+
+    async def raw_authenticate(self):
+        # The key data of the binary protocol is not exposed by the
+        # client, so the connection is opened and authenticated here.
+        raw = await self.raw_open()
+        raw.connect(self.get_connect_args()['user'], self.con.dbname)
+        messages = dict(await raw.recv_until_ready())
+        self.assertEqual(messages[b'R'], struct.pack('!i', 0))
+        self.assertEqual(len(messages[b'K']), 32)
+        return raw, messages[b'K']
+
+    async def trust_connections(self, comment):
+        await self.con.execute(f'''
+            CONFIGURE SYSTEM INSERT Auth {{
+                comment := '{comment}',
+                priority := 0,
+                method := (INSERT Trust),
+            }};
+        ''')
+
+    async def reset_trust_connections(self, comment):
+        await self.con.execute(f'''
+            CONFIGURE SYSTEM RESET Auth FILTER .comment = '{comment}';
+        ''')
+
+    async def test_server_proto_cancel_01(self):
+        await self.trust_connections('test_server_proto_cancel_01')
+        try:
+            raw, key = await self.raw_authenticate()
+            raw2, key2 = await self.raw_authenticate()
+        finally:
+            await self.reset_trust_connections('test_server_proto_cancel_01')
+
+        try:
+            # Every connection has its own key.
+            self.assertNotEqual(key, key2)
+
+            raw.prepare(b'', 'SELECT sys::sleep(10);')
+            raw.execute(b'')
+            raw.sync()
+            await asyncio.sleep(0.5)
+
+            canceller = await self.raw_open()
+            canceller.cancel(key)
+            # The connection is closed without a reply.
+            with self.assertRaises(ConnectionAbortedError):
+                await canceller.recv()
+
+            messages = await asyncio.wait_for(raw.recv_until_ready(), 5)
+            self.assertEqual([m for m, _ in messages], [b'1', b'E'])
+            self.assertEqual(
+                raw.parse_error_code(messages[1][1]),
+                errors.QueryTimeoutError.get_code())
+
+            # Both connections are still usable.
+            self.assertEqual(
+                await self.raw_run(raw, 'SELECT 1;'), [b'1', b'D', b'C'])
+            self.assertEqual(
+                await self.raw_run(raw2, 'SELECT 1;'), [b'1', b'D', b'C'])
+        finally:
+            raw.close()
+            raw2.close()
+
+    async def test_server_proto_cancel_02(self):
+        await self.trust_connections('test_server_proto_cancel_02')
+        try:
+            raw, _ = await self.raw_authenticate()
+        finally:
+            await self.reset_trust_connections('test_server_proto_cancel_02')
+
+        try:
+            raw.prepare(b'', 'SELECT sys::sleep(1);')
+            raw.execute(b'')
+            raw.sync()
+            await asyncio.sleep(0.2)
+
+            # A request with an unknown key is ignored.
+            canceller = await self.raw_open()
+            canceller.cancel(b'\x00' * 32)
+            with self.assertRaises(ConnectionAbortedError):
+                await canceller.recv()
+
+            messages = await raw.recv_until_ready()
+            self.assertEqual([m for m, _ in messages], [b'1', b'D', b'C'])
+        finally:
+            raw.close()
+
+    async def test_server_proto_cancel_03(self):
+        await self.trust_connections('test_server_proto_cancel_03')
+        try:
+            raw, key = await self.raw_authenticate()
+            raw2, _ = await self.raw_authenticate()
+        finally:
+            await self.reset_trust_connections('test_server_proto_cancel_03')
+
+        try:
+            # Outside of a transaction the backend connection is
+            # released as soon as the query completes.
+            self.assertEqual(
+                await self.raw_run(raw, 'SELECT 1;'), [b'1', b'D', b'C'])
+
+            # The released connection might now run a query of
+            # another client, which a late cancel request for the
+            # first one must not interrupt.
+            raw2.prepare(b'', 'SELECT sys::sleep(1);')
+            raw2.execute(b'')
+            raw2.sync()
+            await asyncio.sleep(0.2)
+
+            canceller = await self.raw_open()
+            canceller.cancel(key)
+            with self.assertRaises(ConnectionAbortedError):
+                await canceller.recv()
+
+            messages = await asyncio.wait_for(raw2.recv_until_ready(), 5)
+            self.assertEqual([m for m, _ in messages], [b'1', b'D', b'C'])
+
+            self.assertEqual(
+                await self.raw_run(raw, 'SELECT 1;'), [b'1', b'D', b'C'])
+        finally:
+            raw.close()
+            raw2.close()
@@ -0,0 +1,235 @@
+#
+# This source file is part of the EdgeDB open source project.
+#
+# Copyright 2019-present MagicStack Inc. and the EdgeDB authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+
+import os.path
+import tempfile
+
+import immutables
+
+from edb.server import dbview
+from edb.server import defines
+from edb.server.cache import persistent
+from edb.testbase import server as tb
+
+
+class TestPersistentQueryCache(tb.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmpdir.name, 'query_cache.sqlite')
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+        super().tearDown()
+
+    async def open_store(self, *, build='1.0', maxsize=100):
+        store = persistent.PersistentQueryCache(
+            self.path, build=build, maxsize=maxsize)
+        await store.start()
+        return store
+
+    def key(self, eql, modaliases=immutables.Map({None: 'default'})):
+        return (eql, False, False, False, False, modaliases,
+                immutables.Map())
+
+    async def test_server_query_cache_01(self):
+        store = await self.open_store()
+        self.assertIsNone(store.get_schema_version('db'))
+
+        # Nothing is stored until the schema version is known.
+        store.put('db', None, self.key(b'SELECT 1'), 'unit1')
+        store.set_schema_version('db', 'v1')
+        store.put('db', 'v1', self.key(b'SELECT 2'), 'unit2')
+        store.close()
+
+        store = await self.open_store()
+        try:
+            self.assertEqual(store.get_databases(), ['db'])
+            self.assertEqual(
+                await store.load('db', 'v1'),
+                [(self.key(b'SELECT 2'), 'unit2')])
+
+            # Entries of another schema version are never loaded.
+            self.assertEqual(await store.load('db', 'v2'), [])
+        finally:
+            store.close()
+
+    async def test_server_query_cache_02(self):
+        store = await self.open_store()
+        store.set_schema_version('db', 'v1')
+        store.put('db', 'v1', self.key(b'SELECT 1'), 'unit1')
+        store.close()
+
+        # Entries compiled by another build of the server are dropped.
+        store = await self.open_store(build='2.0')
+        try:
+            self.assertEqual(store.get_databases(), [])
+            self.assertEqual(await store.load('db', 'v1'), [])
+        finally:
+            store.close()
+
+    async def test_server_query_cache_03(self):
+        store = await self.open_store()
+        try:
+            store.set_schema_version('db', 'v1')
+            store.put('db', 'v1', self.key(b'SELECT 1'), 'unit1')
+            store._flush()
+
+            store.suspend('db')
+            self.assertIsNone(store.get_schema_version('db'))
+            # Queries compiled while storing is suspended are dropped.
+            store.put('db', 'v1', self.key(b'SELECT 2'), 'unit2')
+            self.assertEqual(
+                await store.load('db', 'v1'),
+                [(self.key(b'SELECT 1'), 'unit1')])
+
+            # The schema has not changed: the entries are kept.
+            store.set_schema_version('db', 'v1')
+            self.assertEqual(
+                await store.load('db', 'v1'),
+                [(self.key(b'SELECT 1'), 'unit1')])
+
+            # The schema has changed: the entries are dropped.
+            store.suspend('db')
+            store.set_schema_version('db', 'v2')
+            self.assertEqual(await store.load('db', 'v1'), [])
+        finally:
+            store.close()
+
+    async def test_server_query_cache_04(self):
+        store = await self.open_store()
+        try:
+            store.set_schema_version('db1', 'v1')
+            store.set_schema_version('db2', 'v1')
+            store.put('db1', 'v1', self.key(b'SELECT 1'), 'unit1')
+            store.put('db2', 'v1', self.key(b'SELECT 1'), 'unit1')
+            store._flush()
+
+            store.drop_database('db1')
+            self.assertIsNone(store.get_schema_version('db1'))
+            self.assertEqual(await store.load('db1', 'v1'), [])
+            self.assertEqual(
+                await store.load('db2', 'v1'),
+                [(self.key(b'SELECT 1'), 'unit1')])
+        finally:
+            store.close()
+
+    async def test_server_query_cache_05(self):
+        store = await self.open_store(maxsize=2)
+        try:
+            store.set_schema_version('db', 'v1')
+            for i in range(3):
+                store.put('db', 'v1', self.key(f'SELECT {i}'.encode()), i)
+                store._flush()
+
+            # The least recently used entry is evicted.
+            self.assertEqual(
+                [compiled for _, compiled in await store.load('db', 'v1')],
+                [1, 2])
+
+            store.touch('db', self.key(b'SELECT 1'))
+            store.put('db', 'v1', self.key(b'SELECT 3'), 3)
+            store._flush()
+            self.assertEqual(
+                sorted(c for _, c in await store.load('db', 'v1')),
+                [1, 3])
+        finally:
+            store.close()
+
+    async def test_server_query_cache_06(self):
+        store = await self.open_store()
+        try:
+            store.set_schema_version('db', 'v1')
+            store.put(
+                'db', 'v1',
+                self.key(b'SELECT 1',
+                         immutables.Map({None: 'default', 'm': 'mod'})),
+                'unit1')
+            store.put(
+                'db', 'v1',
+                self.key(b'SELECT 1',
+                         immutables.Map({'m': 'mod', None: 'default'})),
+                'unit2')
+            store._flush()
+
+            # Keys with equal maps are the same entry.
+            self.assertEqual(
+                [c for _, c in await store.load('db', 'v1')], ['unit2'])
+        finally:
+            store.close()
+
+    def test_server_query_cache_build_01(self):
+        src_dirs = persistent.CACHE_SRC_DIRS
+        devmode = os.environ.get('__EDGEDB_DEVMODE')
+        src_path = os.path.join(self._tmpdir.name, 'compiler.py')
+        try:
+            persistent.CACHE_SRC_DIRS = ((self._tmpdir.name, '.py'),)
+
+            os.environ['__EDGEDB_DEVMODE'] = '0'
+            self.assertEqual(persistent.get_build_key('1.0'), '1.0')
+
+            # In dev mode the compiler can change while the version
+            # stays the same.
+            os.environ['__EDGEDB_DEVMODE'] = '1'
+            with open(src_path, 'w') as f:
+                f.write('A = 1\n')
+            key1 = persistent.get_build_key('1.0')
+            self.assertTrue(key1.startswith('1.0-'))
+            self.assertEqual(persistent.get_build_key('1.0'), key1)
+
+            with open(src_path, 'w') as f:
+                f.write('A = 2\n')
+            key2 = persistent.get_build_key('1.0')
+            self.assertTrue(key2.startswith('1.0-'))
+            self.assertNotEqual(key2, key1)
+        finally:
+            persistent.CACHE_SRC_DIRS = src_dirs
+            if devmode is None:
+                os.environ.pop('__EDGEDB_DEVMODE', None)
+            else:
+                os.environ['__EDGEDB_DEVMODE'] = devmode
+
+
+class TestCompiledQueryCacheKey(tb.TestCase):
+
+    def test_server_query_cache_key_01(self):
+        # Compilations without session state, like those of the HTTP
+        # port, share the keys of sessions in the default state.
+        self.assertEqual(
+            dbview.eql_cache_key(b'SELECT 1', True, False, None, None),
+            dbview.eql_cache_key(
+                b'SELECT 1', True, False,
+                immutables.Map({None: defines.DEFAULT_MODULE_ALIAS}),
+                immutables.Map()))
+
+        self.assertNotEqual(
+            dbview.eql_cache_key(b'SELECT 1', True, False, None, None),
+            dbview.eql_cache_key(
+                b'SELECT 1', True, False,
+                immutables.Map({None: 'test'}), None))
+
+    def test_server_query_cache_key_02(self):
+        # The HTTP port compiles queries differently from the binary
+        # port, so their keys differ.
+        self.assertNotEqual(
+            dbview.eql_cache_key(
+                b'SELECT 1', True, False, None, None,
+                json_parameters=True, json_elements=True),
+            dbview.eql_cache_key(b'SELECT 1', True, False, None, None))